@@ -6,6 +6,7 @@ import logging
 from neuron import gui,h
 import numpy as np
 import neuron_reduce
+from neuron_reduce.synapse_placement import place_synapses, placement_locations, placement_segments
 import time
 import matplotlib.pyplot as plt
 
@@ -25,12 +26,12 @@ h.v_init = complex_cell.soma[0].e_pas
 #Add synapses to the model
 synapses_list, netstims_list, netcons_list, randoms_list = [], [], [] ,[]
 
-all_segments = [i for j in map(list,list(complex_cell.apical)) for i in j] + [i for j in map(list,list(complex_cell.basal)) for i in j]
-len_per_segment = np.array([seg.sec.L/seg.sec.nseg for seg in all_segments])
+#uniformly distributed over the dendritic length
+placement = place_synapses(placement_segments(complex_cell), 10000, seed=10)
+sections = {'apical': list(complex_cell.apical), 'basal': list(complex_cell.basal)}
 rnd = np.random.RandomState(10)
-for i in range(10000):
-    seg_for_synapse = rnd.choice(all_segments,   p=len_per_segment/sum(len_per_segment))
-    synapses_list.append(h.Exp2Syn(seg_for_synapse))
+for i, location in enumerate(placement_locations(placement)):
+    synapses_list.append(h.Exp2Syn(sections[location.type][location.section_num](location.x)))
     if rnd.uniform()<0.85:
         e_syn, tau1, tau2, spike_interval, syn_weight = 0, 0.3, 1.8,  1000/2.5, 0.0016
     else:
@@ -1,4 +1,6 @@
 from .subtree_reductor_func import subtree_reductor
+from .reduced_cell_spec import reduced_cell_to_spec, instantiate_spec, save_spec, load_spec
+from .batch import reduce_many, iter_reduce, ReductionJob
 import os
 
 
@@ -0,0 +1,272 @@
+'''
+Reducing many cells using a pool of worker processes
+
+NEURON runs a single model per process, so reducing many cells is done by
+worker processes, each loads the mechanisms once and then instantiates and
+reduces the cells of the jobs it receives.  The reduced cells are sent back as
+specs (see reduced_cell_spec.py).
+
+usage:
+    jobs = [ReductionJob(name='cell1',
+                         model_file='L5PCtemplate.hoc',
+                         morphology_file='cell1.asc',
+                         create_type='hay',
+                         reduction_frequency=0,
+                         synapse_file='origRandomSynapses-10000',
+                         hoc_files=('L5PCbiophys3.hoc', )),
+            ...]
+    results = reduce_many(jobs, workers=4, mechanisms=['x86_64/libnrnmech.so'])
+    for result in results:
+        if result.error is not None:
+            print(result.name, 'failed', result.error)
+
+iter_reduce() reduces the jobs one by one in the current process, yielding
+the results as they are ready.
+'''
+import collections
+import concurrent.futures
+import logging
+import multiprocessing
+import os
+import time
+import traceback
+
+from neuron import h
+
+from .instrumentation import ReductionProfile
+from .reduced_cell_spec import reduced_cell_to_spec
+from .subtree_reductor_func import load_model, subtree_reductor, template_name
+from .synapse_locations import (create_synapses_at_locations, create_synapses_from_arrays,
+                                read_synapse_locations)
+
+logger = logging.getLogger(__name__)
+
+ReductionJob = collections.namedtuple('ReductionJob',
+                                      'name, model_file, morphology_file, create_type, '
+                                      'reduction_frequency, synapse_file, celsius, '
+                                      'total_segments_manual, hoc_files, synapse_arrays')
+# synapse_arrays: a SynapseLocationArrays (see synapse_locations.py), used instead of synapse_file
+ReductionJob.__new__.__defaults__ = (None,  # synapse_file
+                                     37,  # celsius
+                                     -1,  # total_segments_manual
+                                     (),  # hoc_files
+                                     None,  # synapse_arrays
+                                     )
+
+# profile: the ReductionProfile.as_dict() of the reduction (see instrumentation.py), if requested
+JobResult = collections.namedtuple('JobResult', 'name, spec, error, elapsed, profile')
+JobResult.__new__.__defaults__ = (None,  # profile
+                                  )
+
+# create_type: how the cell is instantiated from the template
+IMPORT3D_CREATE_TYPES = ('basic', 'human', )  # template(), morphology imported with Import3d
+MORPHOLOGY_ARG_CREATE_TYPES = ('hay', 'almog', 'allen', )  # template(morphology_file)
+
+_loaded_mechanisms = set()
+# {template name: real path of its model file} of the templates loaded by the
+# jobs of this process, a hoc template can't be redefined
+_loaded_templates = {}
+
+
+def load_mechanisms(mechanisms):
+    '''loads the compiled mechanisms libraries, each library is loaded once per process'''
+    for mechanism in mechanisms:
+        mechanism = os.path.realpath(mechanism)
+        if mechanism not in _loaded_mechanisms:
+            h.nrn_load_dll(mechanism)
+            _loaded_mechanisms.add(mechanism)
+
+
+def _import3d_reader(morphology_file):
+    '''returns an Import3d reader according to the morphology file extension'''
+    if morphology_file.lower().endswith('.swc'):
+        return h.Import3d_SWC_read()
+    reader = h.Import3d_Neurolucida3()
+    reader.quiet = 1
+    return reader
+
+
+def check_template(model_file):
+    '''raises ValueError if the template of model_file can't be loaded in this process
+
+    that is if a template of the same name was loaded from another file, or
+    was defined other than by a job
+    '''
+    name, path = template_name(model_file), os.path.realpath(model_file)
+    if name in _loaded_templates:
+        if _loaded_templates[name] != path:
+            raise ValueError("The template '%s' of %s is already loaded from %s" %
+                             (name, path, _loaded_templates[name]))
+    elif h.name_declared(name):
+        raise ValueError("The template '%s' of %s is already defined in this process" %
+                         (name, path))
+
+
+def create_cell(job):
+    '''instantiates the full morphology cell described by the job'''
+    check_template(job.model_file)
+    for hoc_file in job.hoc_files:
+        h.load_file(hoc_file)
+    h.load_file("import3d.hoc")
+    model_obj_name = load_model(job.model_file)
+    _loaded_templates[model_obj_name] = os.path.realpath(job.model_file)
+    template = getattr(h, model_obj_name)
+
+    if job.create_type in IMPORT3D_CREATE_TYPES:
+        cell = template()
+        reader = _import3d_reader(job.morphology_file)
+        reader.input(job.morphology_file)
+        h.Import3d_GUI(reader, 0).instantiate(cell)
+        # this function should be included in the model template
+        cell.complete_full_model_creation()
+    elif job.create_type in MORPHOLOGY_ARG_CREATE_TYPES:
+        cell = template(job.morphology_file)
+    else:
+        raise ValueError('Unknown create_type %s, must be one of %s' %
+                         (job.create_type, IMPORT3D_CREATE_TYPES + MORPHOLOGY_ARG_CREATE_TYPES))
+    return cell
+
+
+def teardown_reduced_cell(cell):
+    '''deletes all the sections of a reduced cell (including its soma and axon)'''
+    soma = cell.soma[0] if cell.soma.hname()[-1] == ']' else cell.soma
+    for sec in h.SectionRef(sec=soma).root.wholetree():
+        h.delete_section(sec=sec)
+
+
+def _delete_new_sections(sections_before):
+    '''deletes the sections that are not in sections_before'''
+    for section in list(h.allsec()):
+        if section not in sections_before:
+            h.delete_section(sec=section)
+
+
+def _create_and_reduce(job, profile=None):
+    '''instantiates and reduces the cell of the job
+
+    returns the reduced cell, synapses_list and netcons_list (see subtree_reductor())
+    '''
+    h.celsius = job.celsius
+    cell = create_cell(job)
+
+    if job.synapse_arrays is not None:
+        synapses_list, netcons_list = create_synapses_from_arrays(cell, job.synapse_arrays)
+    else:
+        locations = read_synapse_locations(job.synapse_file) if job.synapse_file else []
+        synapses_list, netcons_list = create_synapses_at_locations(cell, locations)
+
+    return subtree_reductor(cell,
+                            synapses_list,
+                            netcons_list,
+                            job.reduction_frequency,
+                            total_segments_manual=job.total_segments_manual,
+                            profile=profile)
+
+
+def reduce_job(job, profile=None):
+    '''instantiates, and reduces the cell of the given job, returns the reduced cell spec
+
+    The cell is deleted once it has been converted to a spec, and so are the
+    sections the job created if it fails.  profile: an optional
+    ReductionProfile of the reduction (see instrumentation.py)
+    '''
+    sections_before = set(h.allsec())
+    try:
+        reduced_cell, synapses_list, netcons_list = _create_and_reduce(job, profile)
+        spec = reduced_cell_to_spec(reduced_cell, synapses_list, netcons_list)
+    except Exception:
+        # the full or partially reduced cell of the job
+        _delete_new_sections(sections_before)
+        raise
+
+    teardown_reduced_cell(reduced_cell)
+    return spec
+
+
+def _run_job(job, profile=False):
+    '''runs the job and isolates its failure'''
+    start = time.time()
+    reduction_profile = ReductionProfile() if profile else None
+    try:
+        spec, error = reduce_job(job, reduction_profile), None
+    except Exception:  # pylint: disable=broad-except
+        spec, error = None, traceback.format_exc()
+        logger.warning('reduction of %s failed:\n%s', job.name, error)
+    return JobResult(job.name, spec, error, time.time() - start,
+                     reduction_profile.as_dict() if profile else None)
+
+
+def reduce_many(jobs, workers=None, mechanisms=(), mp_context='spawn', profile=False):
+    '''reduces the cells described by the jobs using a pool of worker processes
+
+    jobs: a list of ReductionJob
+    workers: number of worker processes, by default the number of cpus
+    mechanisms: paths of compiled mechanisms libraries (ie: x86_64/libnrnmech.so)
+                loaded once by each worker
+    mp_context: the multiprocessing start method, 'spawn' ensures that every
+                worker starts with a clean NEURON instance
+    profile: if True, the results have the profile of each reduction (see instrumentation.py)
+
+    Returns a list of JobResult (in the order of the jobs), a failed job has
+    spec=None and error set to its traceback, the other jobs are not affected.
+    '''
+    jobs = list(jobs)
+    results = []
+    with concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context(mp_context),
+            initializer=load_mechanisms,
+            initargs=(list(mechanisms), )) as executor:
+        futures = [executor.submit(_run_job, job, profile) for job in jobs]
+        for job, future in zip(jobs, futures):
+            try:
+                results.append(future.result())
+            except concurrent.futures.process.BrokenProcessPool:
+                # a worker died (ie: segfault in a mechanism), the pending jobs can't be run
+                results.append(JobResult(job.name, None, traceback.format_exc(), None))
+    return results
+
+
+def iter_reduce(jobs, profile=False):
+    '''reduces the cells described by the jobs one after the other, in this process
+
+    A generator that yields a JobResult per job, as soon as its cell is
+    reduced.  The reduced cell (and what is left of the original cell) is
+    deleted when the next result is requested, so that memory does not grow
+    with the number of jobs, and results can be written as they come:
+
+        for result in iter_reduce(jobs):
+            if result.error is None:
+                save_spec(result.spec, result.name + '.json')
+
+    As in reduce_many(), a failed job has spec=None and error set to its
+    traceback, and if profile is True the results have the profile of each
+    reduction.
+    '''
+    for job in jobs:
+        start = time.time()
+        reduction_profile = ReductionProfile() if profile else None
+        sections_before = set(h.allsec())
+        error = None
+        try:
+            reduced_cell, synapses_list, netcons_list = _create_and_reduce(job, reduction_profile)
+            spec = reduced_cell_to_spec(reduced_cell, synapses_list, netcons_list)
+        except Exception:  # pylint: disable=broad-except
+            error = traceback.format_exc()
+            logger.warning('reduction of %s failed:\n%s', job.name, error)
+
+        if error is not None:
+            # yielded out of the except clause, whose traceback references the
+            # cell, its synapses and NetCons; the sections of the job are deleted
+            reduced_cell = synapses_list = netcons_list = None
+            _delete_new_sections(sections_before)
+            yield JobResult(job.name, None, error, time.time() - start,
+                            reduction_profile.as_dict() if profile else None)
+            continue
+
+        try:
+            yield JobResult(job.name, spec, None, time.time() - start,
+                            reduction_profile.as_dict() if profile else None)
+        finally:
+            teardown_reduced_cell(reduced_cell)
+            del reduced_cell, synapses_list, netcons_list
@@ -0,0 +1,95 @@
+'''
+Simulating reduced cells with CoreNEURON
+
+CoreNEURON simulates the model that NEURON holds, once it is transferred to
+it (in memory by psolve(), or written to files by write_model()).  Only the
+hoc side of a reduced cell is transferred, so before that:
+- the cell needs a gid, with its soma as the spike source
+- its NetCons must target synapses that are located on the reduced cell
+  (NetCons of merged synapses were redirected to the merged synapse)
+- NetCons without a source (ie: h.NetCon(None, synapse), as created by
+  create_synapses_at_locations()) are kept, but events sent to them with
+  NetCon.event() from python are not transferred
+prepare_reduced_cell() does that.  Vector.record() and pc.spike_record() are
+supported by CoreNEURON.  Mechanisms that are not built into NEURON must be
+compiled with `nrnivmodl -coreneuron`.
+
+usage:
+    pc = h.ParallelContext()
+    reduced_cell, synapses_list, netcons_list = subtree_reductor(...)
+    prepare_reduced_cell(pc, gid, reduced_cell, synapses_list, netcons_list)
+    pc.spike_record(-1, spike_times, spike_gids)
+    psolve(pc, tstop)  # or write_model(pc, 'coredat') for the coreneuron executable
+'''
+import collections
+import logging
+
+from neuron import coreneuron, h
+
+from .parallel_network import SPIKE_THRESHOLD, check_netcons_targets, register_spike_source
+from .subtree_reductor_func import initialize_hoc
+
+logger = logging.getLogger(__name__)
+
+CoreNeuronCell = collections.namedtuple('CoreNeuronCell',
+                                        'gid, cell, synapses_list, netcons_list, spike_detector')
+
+
+def netcons_without_source(netcons_list):
+    '''returns the NetCons that have no source (no point process, voltage or gid)'''
+    return [netcon for netcon in netcons_list
+            if netcon.pre() is None and netcon.preseg() is None and netcon.srcgid() < 0]
+
+
+def prepare_reduced_cell(pc, gid, reduced_cell, synapses_list, netcons_list,
+                         threshold=SPIKE_THRESHOLD):
+    '''registers the reduced cell as gid, and checks that it can be transferred to CoreNEURON
+
+    pc: the h.ParallelContext
+    reduced_cell, synapses_list, netcons_list: as returned by subtree_reductor()
+    threshold: the spike detection threshold of the soma, if gid has no spike source yet
+
+    Returns a CoreNeuronCell, spike_detector is None if gid already had a spike source
+    '''
+    check_netcons_targets(gid, netcons_list)
+
+    n_netcons_without_source = len(netcons_without_source(netcons_list))
+    if n_netcons_without_source:
+        logger.warning('%d NetCons of gid %d have no source, events sent to them with '
+                       'NetCon.event() are not transferred to CoreNEURON',
+                       n_netcons_without_source, gid)
+
+    spike_detector = register_spike_source(pc, gid, reduced_cell, threshold)
+    return CoreNeuronCell(gid, reduced_cell, synapses_list, netcons_list, spike_detector)
+
+
+def psolve(pc, tstop, use_coreneuron=True, maxstep=10):
+    '''initializes and simulates until tstop, with CoreNEURON (in memory transfer) or NEURON
+
+    CoreNEURON only runs with a fixed time step (h.dt), CVODE must not be active
+    '''
+    initialize_hoc()
+    if use_coreneuron and h.cvode.active():
+        raise Exception('CoreNEURON does not support the variable time step method (CVODE)')
+
+    h.cvode.cache_efficient(1)
+    pc.set_maxstep(maxstep)
+
+    coreneuron_was_enabled = coreneuron.enable
+    coreneuron.enable = use_coreneuron
+    try:
+        h.stdinit()
+        pc.psolve(tstop)
+    finally:
+        coreneuron.enable = coreneuron_was_enabled
+
+
+def write_model(pc, path):
+    '''writes the model in the CoreNEURON data format into the path directory
+
+    so that it can be simulated by the coreneuron executable (ie: special-core --datpath path)
+    '''
+    initialize_hoc()
+    h.cvode.cache_efficient(1)
+    h.stdinit()
+    pc.nrncore_write(path)
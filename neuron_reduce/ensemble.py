@@ -0,0 +1,157 @@
+'''
+Simulating many copies of a reduced cell together
+
+A reduced cell has a handful of sections, so simulating it alone is dominated
+by the overhead of every run.  An ensemble instantiates K copies of the spec of
+a reduced cell (see reduced_cell_spec.py) in one NEURON instance, every NetCon
+of every copy driven by its own NetStim, and simulates them in one run, with
+the threads of the ParallelContext (the copies are independent cells, so
+NEURON distributes them between the threads).
+
+The NetStims are seeded with Random123 streams (netcon index, seed, copy
+index): the copies get independent inputs, and copy k gets the same inputs in
+any ensemble of the same spec.  The stimulus of a NetCon is the one of the
+class of its synapse (the class in SYNAPSE_CLASSES whose reversal potential is
+the closest).  NEURON needs the NetCons to have a delay to simulate in
+threads, so the NetCons of the copies have a delay of at least MIN_DELAY (the
+inputs of a spec whose delays are 0 are shifted by MIN_DELAY, whatever the
+number of threads).
+
+usage:
+    spec = reduce_job(job)
+    ensemble = build_ensemble(spec, 100)
+    result = run_ensemble(ensemble, tstop=1000, seed=1)
+    result.v  # (100, number of time steps) somatic voltages
+    # a parameter scan, one value per copy
+    def set_cm(copy_index, cell, synapses_list, netcons_list):
+        cell.soma.cm = 0.5 + 0.1 * copy_index
+    ensemble = build_ensemble(spec, 10, setup=set_cm)
+'''
+import collections
+import logging
+import os
+import time
+
+import numpy as np
+from neuron import h
+
+from .parallel_network import SPIKE_THRESHOLD
+from .reduced_cell_spec import instantiate_spec
+from .simulation import FIXED_STEP_REFERENCE, apply_config
+from .steady_state import initialize_to_steady_state
+from .subtree_reductor_func import initialize_hoc
+from .synapse_locations import SYNAPSE_CLASSES
+from .validation import STIMULI
+
+logger = logging.getLogger(__name__)
+
+ENSEMBLE_CONFIG = FIXED_STEP_REFERENCE._replace(name='ensemble', cache_efficient=True,
+                                                nthread=os.cpu_count() or 1)
+# ms, NEURON needs the delays to be at least twice the time step, to simulate in threads
+MIN_DELAY = 2 * ENSEMBLE_CONFIG.dt
+
+Ensemble = collections.namedtuple('Ensemble', 'cells, synapses, netcons, netstims')
+EnsembleResult = collections.namedtuple('EnsembleResult', 't, v, spike_times, wall_time')
+
+
+def synapse_class_of_params(params, synapse_classes=SYNAPSE_CLASSES):
+    '''the synapse class (ie: excitatory) whose reversal potential is the closest to params['e']'''
+    return min(synapse_classes, key=lambda name: abs(synapse_classes[name]['e'] - params['e']))
+
+
+def build_ensemble(spec, n_copies, stimuli=STIMULI, setup=None, min_delay=MIN_DELAY):
+    '''instantiates n_copies of the spec, with a NetStim per NetCon of every copy
+
+    stimuli: {synapse class: Stimulus} of the NetStims (see validation.py)
+    min_delay: the minimal delay (ms) of the NetCons
+    setup: an optional function(copy index, cell, synapses_list, netcons_list)
+           called on every copy, ie: to set a parameter of a scan
+
+    Returns an Ensemble: the lists of cells, synapses_list, netcons_list and
+    NetStims of the copies
+    '''
+    synapse_stimuli = [stimuli[synapse_class_of_params(synapse['params'])]
+                       for synapse in spec['synapses']]
+    netcon_stimuli = [synapse_stimuli[netcon['synapse']] for netcon in spec['netcons']]
+
+    ensemble = Ensemble(cells=[], synapses=[], netcons=[], netstims=[])
+    for copy_index in range(n_copies):
+        netstims = []
+        for stimulus in netcon_stimuli:
+            netstim = h.NetStim()
+            netstim.interval = stimulus.interval
+            netstim.number = stimulus.number
+            netstim.start = stimulus.start
+            netstim.noise = stimulus.noise
+            netstims.append(netstim)
+
+        cell, synapses_list, netcons_list = instantiate_spec(spec, netstims)
+        for netcon in netcons_list:
+            netcon.delay = max(netcon.delay, min_delay)
+        if setup is not None:
+            setup(copy_index, cell, synapses_list, netcons_list)
+        ensemble.cells.append(cell)
+        ensemble.synapses.append(synapses_list)
+        ensemble.netcons.append(netcons_list)
+        ensemble.netstims.append(netstims)
+    return ensemble
+
+
+def run_ensemble(ensemble, tstop, seed=0, config=ENSEMBLE_CONFIG, v_init=None, record_dt=None,
+                 steady_state=None):
+    '''simulates all the copies of the ensemble in one run
+
+    seed: of the synaptic activity, the copies get independent streams of it
+    config: the SimulationConfig (see simulation.py), its nthread threads
+            simulate the copies
+    v_init: by default the e_pas of the soma of the first copy
+    record_dt: the voltages are recorded every record_dt ms, every time step by default
+    steady_state: the copies start from this SteadyState of their spec (see
+                  steady_state.py), instead of from v_init
+
+    Returns an EnsembleResult: the times, the (copies, times) array of the
+    somatic voltages, the spike times of every copy and the wall time of the run
+    '''
+    initialize_hoc()
+    for copy_index, netstims in enumerate(ensemble.netstims):
+        for i, netstim in enumerate(netstims):
+            netstim.noiseFromRandom123(i, seed, copy_index)
+
+    apply_config(config)
+    t, voltages = h.Vector(), []
+    spike_times, spike_detectors = [], []
+    for cell in ensemble.cells:
+        v = h.Vector()
+        if record_dt is None:
+            v.record(cell.soma(0.5)._ref_v)
+        else:
+            v.record(cell.soma(0.5)._ref_v, record_dt)
+        voltages.append(v)
+
+        spikes = h.Vector()
+        spike_detector = h.NetCon(cell.soma(0.5)._ref_v, None, sec=cell.soma)
+        spike_detector.threshold = SPIKE_THRESHOLD
+        spike_detector.record(spikes)
+        spike_times.append(spikes)
+        spike_detectors.append(spike_detector)
+    if record_dt is None:
+        t.record(h._ref_t)
+    else:
+        t.record(h._ref_t, record_dt)
+
+    h.v_init = ensemble.cells[0].soma.e_pas if v_init is None else v_init
+    initializer = None
+    if steady_state is not None:
+        initializer = initialize_to_steady_state(ensemble.cells, steady_state)
+    h.tstop = tstop
+    h.stdinit()
+    start = time.time()
+    h.continuerun(tstop)
+    wall_time = time.time() - start
+    del initializer
+    logger.debug('simulated %d copies for %s ms in %.2f s', len(ensemble.cells), tstop, wall_time)
+
+    return EnsembleResult(t=np.array(t),
+                          v=np.array([np.array(v) for v in voltages]),
+                          spike_times=[np.array(spikes) for spikes in spike_times],
+                          wall_time=wall_time)
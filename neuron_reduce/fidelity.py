@@ -0,0 +1,137 @@
+'''
+Checking a reduction without simulating it
+
+The reduced cell should keep the transfer impedances from the synapses to the
+soma.  measure_impedances() measures them (and the somatic input impedance)
+over a band of frequencies, for the target synapse of every NetCon; since the
+NetCons are kept by subtree_reductor() (merged synapses are redirected), the
+same NetCons are measured on the original cell before the reduction and on the
+reduced cell after it.  fidelity_report() compares the two, and
+summarize_report() gives the error statistics to screen many reductions.
+
+usage:
+    original = measure_impedances(cell.soma[0](0.5), netcons_list)
+    reduced_cell, synapses_list, netcons_list = subtree_reductor(cell, synapses_list,
+                                                                 netcons_list, 38)
+    reduced = measure_impedances(reduced_cell.soma[0](0.5), netcons_list)
+    print(summarize_report(fidelity_report(original, reduced)))
+
+or, in one call:
+    reduced_cell, synapses_list, netcons_list, report = reduce_with_fidelity_report(
+        cell, synapses_list, netcons_list, 38)
+'''
+import cmath
+import collections
+
+import numpy as np
+from neuron import h
+
+from .reducing_methods import measure_transfer_impedance
+from .subtree_reductor_func import initialize_hoc, subtree_reductor
+
+DEFAULT_FREQUENCIES = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)  # Hz
+
+# input: the input impedance of the soma per frequency, transfer: per frequency
+# and NetCon, the transfer impedance from its synapse to the soma (complex, in Ohms)
+ImpedanceMeasurement = collections.namedtuple('ImpedanceMeasurement',
+                                              'frequencies, input, transfer')
+
+# relative errors of the magnitudes, and errors of the phases (in radians), of the
+# impedances of the reduced cell
+FidelityReport = collections.namedtuple('FidelityReport',
+                                        'frequencies, input_magnitude_error, input_phase_error, '
+                                        'transfer_magnitude_error, transfer_phase_error')
+
+
+def measure_impedances(soma_seg, netcons_list, frequencies=DEFAULT_FREQUENCIES):
+    '''measures the input impedance of soma_seg, and the transfer impedances to it
+
+    from the target synapse of each NetCon, at each of the frequencies.  The
+    model is initialized (h.init()) and the impedances are computed at the
+    resting state, without the dynamics of the active channels (as done by the
+    reduction).  Returns an ImpedanceMeasurement.
+    '''
+    initialize_hoc()
+    h.init()
+    imp = h.Impedance()
+    imp.loc(soma_seg.x, sec=soma_seg.sec)
+
+    targets = [netcon.syn().get_segment() for netcon in netcons_list]
+    input_impedances = np.zeros(len(frequencies), dtype=complex)
+    transfer_impedances = np.zeros((len(frequencies), len(targets)), dtype=complex)
+    for i, frequency in enumerate(frequencies):
+        imp.compute(frequency + 1 / 9e9, 0)
+        input_impedances[i] = cmath.rect(imp.input(soma_seg.x, sec=soma_seg.sec) * 1000000,
+                                         imp.input_phase(soma_seg.x, sec=soma_seg.sec))
+        transfer_impedances[i] = [measure_transfer_impedance(imp, seg.sec, seg.x)
+                                  for seg in targets]
+
+    return ImpedanceMeasurement(np.array(frequencies, dtype=float),
+                                input_impedances,
+                                transfer_impedances)
+
+
+def _phase_difference(reduced, original):
+    '''the absolute difference of the phases, in radians'''
+    return np.abs(np.angle(reduced / original))
+
+
+def fidelity_report(original, reduced):
+    '''compares the ImpedanceMeasurement of the reduced cell to the one of the original cell'''
+    assert np.array_equal(original.frequencies, reduced.frequencies), \
+        'The impedances must be measured at the same frequencies'
+    assert original.transfer.shape == reduced.transfer.shape, \
+        'The impedances must be measured for the same NetCons'
+
+    return FidelityReport(
+        frequencies=original.frequencies,
+        input_magnitude_error=np.abs(np.abs(reduced.input) / np.abs(original.input) - 1),
+        input_phase_error=_phase_difference(reduced.input, original.input),
+        transfer_magnitude_error=np.abs(np.abs(reduced.transfer) / np.abs(original.transfer) - 1),
+        transfer_phase_error=_phase_difference(reduced.transfer, original.transfer))
+
+
+def summarize_report(report):
+    '''returns a dictionary of summary statistics of the FidelityReport, over all frequencies'''
+    magnitude_error = report.transfer_magnitude_error
+    phase_error = report.transfer_phase_error
+    summary = {'max_input_magnitude_error': float(np.max(report.input_magnitude_error)),
+               'max_input_phase_error': float(np.max(report.input_phase_error)),
+               'n_synapses': magnitude_error.shape[1],
+               }
+    if magnitude_error.size:
+        summary.update({
+            'mean_transfer_magnitude_error': float(np.mean(magnitude_error)),
+            'median_transfer_magnitude_error': float(np.median(magnitude_error)),
+            'p95_transfer_magnitude_error': float(np.percentile(magnitude_error, 95)),
+            'max_transfer_magnitude_error': float(np.max(magnitude_error)),
+            'mean_transfer_phase_error': float(np.mean(phase_error)),
+            'p95_transfer_phase_error': float(np.percentile(phase_error, 95)),
+            'max_transfer_phase_error': float(np.max(phase_error)),
+        })
+    return summary
+
+
+def reduce_with_fidelity_report(original_cell,
+                                synapses_list,
+                                netcons_list,
+                                reduction_frequency,
+                                frequencies=DEFAULT_FREQUENCIES,
+                                **reductor_kwargs):
+    '''reduces the cell with subtree_reductor(), and compares the impedances before and after
+
+    Returns the reduced cell, the new synapses list, the netcons list, and the
+    FidelityReport (return_seg_to_seg is not supported)
+    '''
+    soma = original_cell.soma[0] if original_cell.soma.hname()[-1] == ']' else original_cell.soma
+    original = measure_impedances(soma(0.5), netcons_list, frequencies)
+
+    reduced_cell, synapses_list, netcons_list = subtree_reductor(original_cell,
+                                                                 synapses_list,
+                                                                 netcons_list,
+                                                                 reduction_frequency,
+                                                                 **reductor_kwargs)
+
+    # the soma of the original cell is the soma of the reduced cell
+    reduced = measure_impedances(soma(0.5), netcons_list, frequencies)
+    return reduced_cell, synapses_list, netcons_list, fidelity_report(original, reduced)
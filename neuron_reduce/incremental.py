@@ -0,0 +1,128 @@
+'''
+Updating the mechanisms of a reduced cell, without reducing it again
+
+The reduced cables, and the mapping of the synapses and of the segments of the
+original cell to the reduced cell, depend only on the morphology and on the
+passive properties.  IncrementalReduction reduces the cell once and keeps the
+mapping of the original segments to the reduced segments; when only the active
+conductances change (ie: in a parameter fitting loop), only the averaging of
+the mechanisms of the original segments into the reduced segments (see
+copy_dendritic_mech()) is done again.
+
+The original segments are identified by the name of their section in the cell
+(ie: dend[3]) and their x, since the original dendrites are deleted by the
+reduction.
+
+usage:
+    reduction = IncrementalReduction(cell, synapses_list, netcons_list, 38)
+    reduced_cell = reduction.reduced_cell
+    for parameters in ...:
+        # an instance of the same model, with the new parameters, that is not reduced
+        full_cell = create_full_cell(parameters)
+        reduction.update_from_cell(full_cell)
+        # or, sets values of original segments
+        reduction.update_mechanisms({OriginalSegment('dend[3]', 0.25): {'hh': {'gnabar_hh': 0.2}}})
+        ... simulates reduced_cell ...
+'''
+import collections
+import logging
+
+from neuron import h
+
+from .segment_mapping import section_name
+from .subtree_reductor_func import copy_dendritic_mech, get_segment_mech_vals, subtree_reductor
+
+logger = logging.getLogger(__name__)
+
+OriginalSegment = collections.namedtuple('OriginalSegment', 'section_name, x')
+
+
+def _cell_sections(cell):
+    '''the sections connected to the soma of the cell'''
+    soma = cell.soma[0] if cell.soma.hname()[-1] == ']' else cell.soma
+    return list(h.SectionRef(sec=soma).root.wholetree())
+
+
+class IncrementalReduction(object):
+    '''reduces a cell once, and updates the mechanisms of the reduced cell when they change
+
+    The arguments are the ones of subtree_reductor() (except seg_to_seg).
+
+    Attributes:
+        reduced_cell, synapses_list, netcons_list: as returned by subtree_reductor()
+        mech_vals: {OriginalSegment: {mech_name: {param_name: value}}} of the
+                   original dendritic segments
+        original_seg_to_reduced_seg: {OriginalSegment: reduced segment}
+    '''
+    def __init__(self, original_cell, synapses_list, netcons_list, reduction_frequency,
+                 **kwargs):
+        assert 'seg_to_seg' not in kwargs, 'seg_to_seg is used by the reduction'
+
+        # the original dendrites are deleted by the reduction, so the values of
+        # their mechanisms are read before
+        original_segments, mech_vals = {}, {}
+        for section in _cell_sections(original_cell):
+            for seg in section:
+                key = OriginalSegment(section_name(section), seg.x)
+                original_segments[str(seg)] = key
+                mech_vals[key] = get_segment_mech_vals(seg)
+
+        seg_to_seg = {}
+        reduced = subtree_reductor(original_cell, synapses_list, netcons_list, reduction_frequency,
+                                   seg_to_seg=seg_to_seg, **kwargs)
+        self.reduced_cell, self.synapses_list, self.netcons_list = reduced[:3]
+
+        self.original_seg_to_reduced_seg = {original_segments[original]: reduced_seg
+                                            for original, reduced_seg in seg_to_seg.items()}
+        self.reduced_seg_to_original_seg = collections.defaultdict(list)
+        for original, reduced_seg in self.original_seg_to_reduced_seg.items():
+            self.reduced_seg_to_original_seg[reduced_seg].append(original)
+        self.reduced_seg_to_original_seg = dict(self.reduced_seg_to_original_seg)
+        self.mech_vals = {key: mech_vals[key] for key in self.original_seg_to_reduced_seg}
+
+        # the soma and the axon of the original cell are kept in the reduced cell
+        reduced_dendrites = set(seg.sec for seg in self.reduced_seg_to_original_seg)
+        reduced_dendrites.update(self.reduced_cell.hoc_model.basal)
+        reduced_dendrites.update(self.reduced_cell.hoc_model.apical)
+        self.kept_sections = [section for section in _cell_sections(self.reduced_cell)
+                              if section not in reduced_dendrites]
+
+    def _average_mechanisms(self):
+        '''averages the mechanisms of the original segments into the reduced segments'''
+        copy_dendritic_mech(self.original_seg_to_reduced_seg,
+                            self.reduced_seg_to_original_seg,
+                            self.reduced_cell.apic,
+                            list(self.reduced_cell.hoc_model.basal),
+                            self.mech_vals)
+
+    def update_mechanisms(self, mech_vals):
+        '''sets values of the mechanisms of original segments, and averages them again
+
+        mech_vals: {OriginalSegment: {mech_name: {param_name: value}}}, only the
+                   changed values are needed.  param_name as in
+                   get_segment_mech_vals() (ie: gnabar_hh)
+        '''
+        for key, mechs in mech_vals.items():
+            for mech_name, params in mechs.items():
+                self.mech_vals[key].setdefault(mech_name, {}).update(params)
+        self._average_mechanisms()
+
+    def update_from_cell(self, cell):
+        '''reads the mechanisms of an instance of the same model (that is not reduced)
+
+        the values of the dendritic segments are averaged into the reduced
+        segments, and the values of the soma and the axon are copied
+        '''
+        sections = {section_name(section): section for section in _cell_sections(cell)}
+        for key, mechs in self.mech_vals.items():
+            seg = sections[key.section_name](key.x)
+            for params in mechs.values():
+                for param_name in params:
+                    params[param_name] = getattr(seg, param_name)
+        self._average_mechanisms()
+
+        for kept_section in self.kept_sections:
+            for kept_seg, seg in zip(kept_section, sections[section_name(kept_section)]):
+                for params in get_segment_mech_vals(seg).values():
+                    for param_name, value in params.items():
+                        setattr(kept_seg, param_name, value)
@@ -0,0 +1,209 @@
+'''
+Profiling the stages of a reduction
+
+subtree_reductor(..., profile=ReductionProfile()) fills the profile with:
+- the wall time of each stage of the reduction (see STAGES)
+- counters: Impedance computations, bisection iterations (finding the length of
+  the cables and the locations on them), hoc calls (interpreter statements and
+  hoc functions, ie: section creation, deletion and uninsert), synapses placed
+  on the reduced cell and synapses merged into them, and orphan segments (reduced
+  segments that no original segment is mapped to)
+- the peak resident memory during the reduction, and its increase over the
+  resident memory at its start: the current resident memory is sampled by a
+  thread every MEMORY_SAMPLE_INTERVAL seconds while the reduction runs, so
+  that the reductions run one after the other by a process (ie: a worker of
+  reduce_many) are measured independently.  Where it can't be read (not linux),
+  this is the peak of the process (ru_maxrss), which doesn't decrease
+
+profile.as_dict() is plain json-serializable data, so that batch runs can
+store it and flag slow cells or regressions (see batch.iter_reduce()).
+
+The counters are incremented by count() in the modules of the reduction,
+while a profile is active (see profiled()).  The bisection iterations of
+subtrees reduced by a subtree_executor are not counted, since they run in
+other processes.
+
+usage:
+    profile = ReductionProfile()
+    subtree_reductor(cell, synapses_list, netcons_list, 38, profile=profile)
+    print(profile.stage_times['subtree_reduction'], profile.counters['impedance_computes'])
+    json.dump(profile.as_dict(), open('profile.json', 'w'))
+'''
+import collections
+import functools
+import logging
+import os
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # not available on windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+STAGES = ('initialization',
+          'axon_detach',
+          'mechanism_snapshot',
+          'subtree_reduction',
+          'cell_creation',
+          'synapse_merge',
+          'segment_mapping',
+          'mechanism_copy',
+          'teardown',
+          )
+COUNTERS = ('impedance_computes',
+            'bisection_iterations',
+            'hoc_calls',
+            'synapses_placed',
+            'synapses_merged',
+            'orphan_segments',
+            )
+
+MEMORY_SAMPLE_INTERVAL = 0.005  # s
+STATM_PATH = '/proc/self/statm'
+
+_active_profile = None
+
+
+def peak_memory_mb():
+    '''returns the peak resident memory of the process (in MB), None if it is unknown'''
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # in bytes on mac, in kilobytes elsewhere
+    return max_rss / 1024. ** (2 if sys.platform == 'darwin' else 1)
+
+
+def current_memory_mb():
+    '''returns the current resident memory of the process (in MB), None if it is unknown'''
+    try:
+        with open(STATM_PATH) as fd:
+            resident_pages = int(fd.read().split()[1])
+    except (IOError, OSError):
+        return None
+    return resident_pages * os.sysconf('SC_PAGE_SIZE') / 1024. ** 2
+
+
+class MemorySampler(object):
+    '''samples the current resident memory in a thread, from start() to stop()
+
+    peak_mb: the highest sample, start_mb: the first one
+    '''
+    def __init__(self, interval=MEMORY_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.start_mb = self.peak_mb = None
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._sample_until_stopped)
+        self._thread.daemon = True
+
+    def _sample(self):
+        '''updates the peak with the current resident memory'''
+        self.peak_mb = max(self.peak_mb, current_memory_mb())
+
+    def _sample_until_stopped(self):
+        '''samples every interval, until stopped'''
+        while not self._stopped.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        '''takes the first sample, and starts sampling'''
+        self.start_mb = self.peak_mb = current_memory_mb()
+        self._thread.start()
+
+    def stop(self):
+        '''stops sampling, and takes the last sample'''
+        self._stopped.set()
+        self._thread.join()
+        self._sample()
+
+
+class ReductionProfile(object):
+    '''the stage times (in seconds), counters and peak memory (in MB) of a reduction'''
+
+    def __init__(self):
+        self.stage_times = collections.OrderedDict()
+        self.counters = collections.OrderedDict((name, 0) for name in COUNTERS)
+        self.total_time = 0.
+        self.peak_memory_mb = None
+        self.peak_memory_increase_mb = None
+        self._stage = None
+        self._stage_start = None
+
+    def start_stage(self, name):
+        '''ends the current stage, and starts timing the stage name'''
+        self.end_stage()
+        self._stage, self._stage_start = name, time.time()
+
+    def end_stage(self):
+        '''ends the current stage, if any'''
+        if self._stage is not None:
+            elapsed = time.time() - self._stage_start
+            self.stage_times[self._stage] = self.stage_times.get(self._stage, 0.) + elapsed
+            self._stage = None
+
+    def count(self, name, n=1):
+        '''adds n to the counter name'''
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def as_dict(self):
+        '''returns the profile as a dictionary, that can be written as json'''
+        return {'stage_times': dict(self.stage_times),
+                'counters': dict(self.counters),
+                'total_time': self.total_time,
+                'peak_memory_mb': self.peak_memory_mb,
+                'peak_memory_increase_mb': self.peak_memory_increase_mb,
+                }
+
+
+def count(name, n=1):
+    '''adds n to the counter name of the active profile, if any'''
+    if _active_profile is not None:
+        _active_profile.count(name, n)
+
+
+def start_stage(name):
+    '''starts timing the stage name in the active profile, if any'''
+    if _active_profile is not None:
+        _active_profile.start_stage(name)
+
+
+def profiled(func):
+    '''decorates a function that takes a profile keyword argument
+
+    If a ReductionProfile is given, it is active (receives count() and
+    start_stage()) while the function runs, and its total time and peak memory
+    (of this call, see MemorySampler) are set when the function returns.
+    '''
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        '''activates the profile while func runs'''
+        global _active_profile  # pylint: disable=global-statement
+        profile = kwargs.get('profile')
+        if profile is None:
+            return func(*args, **kwargs)
+
+        previous_profile, _active_profile = _active_profile, profile
+        sampler = MemorySampler() if current_memory_mb() is not None else None
+        if sampler is not None:
+            sampler.start()
+        else:
+            memory_before = peak_memory_mb()
+        start = time.time()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profile.end_stage()
+            profile.total_time += time.time() - start
+            if sampler is not None:
+                sampler.stop()
+                profile.peak_memory_mb = sampler.peak_mb
+                profile.peak_memory_increase_mb = sampler.peak_mb - sampler.start_mb
+            else:
+                profile.peak_memory_mb = peak_memory_mb()
+                if memory_before is not None:
+                    profile.peak_memory_increase_mb = profile.peak_memory_mb - memory_before
+            _active_profile = previous_profile
+    return wrapper
@@ -0,0 +1,120 @@
+'''
+Compiling mechanisms once, and reusing the library
+
+compile_mechanisms() compiles a directory of mod files with nrnivmodl into a
+cache directory, keyed by a hash of the files (and of the NEURON version and
+platform), so that models with the same mod files, or the same model run many
+times (ie: by the tests and the benchmarks), are compiled once.  Concurrent
+processes may compile the same mechanisms: each compiles in its own temporary
+directory, and the first one to finish publishes it.
+
+The cache directory is $NEURON_REDUCE_MECHANISMS_CACHE, or
+~/.cache/neuron_reduce/mechanisms
+
+usage:
+    library = compile_mechanisms('tests/TestsFiles/Test_5_Hay_2011/mod')
+    h.nrn_load_dll(library)
+or:
+    load_compiled_mechanisms('tests/TestsFiles/Test_5_Hay_2011/mod')
+'''
+import glob
+import hashlib
+import logging
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+
+import neuron
+
+from .batch import load_mechanisms
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR_ENVIRONMENT_VARIABLE = 'NEURON_REDUCE_MECHANISMS_CACHE'
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'neuron_reduce', 'mechanisms')
+
+# where nrnivmodl writes the library, relative to the directory it runs in,
+# depending on the version of NEURON
+LIBRARY_PATTERNS = ('*/libnrnmech.so',
+                    '*/libnrnmech.dylib',
+                    '*/.libs/libnrnmech.so',
+                    '*/.libs/libnrnmech.so.0',
+                    '*/.libs/libnrnmech.0.so',
+                    'nrnmech.dll',
+                    )
+
+
+def cache_dir():
+    '''returns the directory of the compiled mechanisms cache'''
+    return os.environ.get(CACHE_DIR_ENVIRONMENT_VARIABLE, DEFAULT_CACHE_DIR)
+
+
+def mod_files_hash(mod_dir):
+    '''returns a hash of the files in mod_dir (names and contents), the NEURON version and platform'''
+    digest = hashlib.sha256()
+    digest.update(neuron.__version__.encode('utf-8'))
+    digest.update(platform.machine().encode('utf-8'))
+    for name in sorted(os.listdir(mod_dir)):
+        path = os.path.join(mod_dir, name)
+        if os.path.isfile(path):
+            digest.update(name.encode('utf-8'))
+            with open(path, 'rb') as fd:
+                digest.update(hashlib.sha256(fd.read()).digest())
+    return digest.hexdigest()
+
+
+def find_library(build_dir):
+    '''returns the path of the library compiled by nrnivmodl in build_dir, None if there is none'''
+    for pattern in LIBRARY_PATTERNS:
+        libraries = glob.glob(os.path.join(build_dir, pattern))
+        if libraries:
+            return libraries[0]
+    return None
+
+
+def compile_mechanisms(mod_dir, cache=None):
+    '''returns the path of the library of the mechanisms in mod_dir, compiling them if needed
+
+    cache: the cache directory, by default cache_dir()
+    '''
+    cache = cache_dir() if cache is None else cache
+    build_dir = os.path.join(cache, mod_files_hash(mod_dir))
+    library = find_library(build_dir)
+    if library is not None:
+        return library
+
+    if not os.path.isdir(cache):
+        os.makedirs(cache)
+    tmp_dir = tempfile.mkdtemp(prefix='.build-', dir=cache)
+    try:
+        shutil.copytree(mod_dir, os.path.join(tmp_dir, 'mod'))
+        logger.info('compiling the mechanisms of %s into %s', mod_dir, build_dir)
+        process = subprocess.Popen(['nrnivmodl', 'mod'], cwd=tmp_dir,
+                                   stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        output = process.communicate()[0].decode('utf-8', 'replace')
+        if process.returncode != 0 or find_library(tmp_dir) is None:
+            raise Exception('Compiling the mechanisms of %s failed:\n%s' % (mod_dir, output))
+
+        try:
+            os.rename(tmp_dir, build_dir)
+        except OSError:
+            # another process published the same mechanisms first
+            if find_library(build_dir) is None:
+                raise
+    finally:
+        if os.path.isdir(tmp_dir):
+            shutil.rmtree(tmp_dir)
+
+    return find_library(build_dir)
+
+
+def load_compiled_mechanisms(mod_dir, cache=None):
+    '''compiles the mechanisms of mod_dir if needed (see compile_mechanisms()), and loads them
+
+    returns the path of the library
+    '''
+    library = compile_mechanisms(mod_dir, cache)
+    load_mechanisms([library])
+    return library
@@ -0,0 +1,131 @@
+'''
+Reducing the cells of a network that is distributed with a ParallelContext
+
+When a network is built under MPI, each rank owns a set of gids.  The driver
+reduce_rank_cells() reduces the cells owned by the current rank and registers
+the somata of the reduced cells as the spike sources of their gids.
+
+The NetCons given with the cells (including the ones created with
+pc.gid_connect() to cells on other ranks) stay valid: subtree_reductor() moves
+every synapse to the reduced cell, and a NetCon of a synapse that was merged is
+redirected (NetCon.setpost) to the synapse it was merged into.
+
+usage (on every rank):
+    pc = h.ParallelContext()
+    cells = {gid: (cell, synapses_list, netcons_list) for gid in my_gids}
+    reduced_cells, reports = reduce_rank_cells(pc, cells, reduction_frequency=0)
+    pc.set_maxstep(10)
+    h.stdinit()
+    pc.psolve(tstop)
+
+Gids that are not yet registered to the rank get the soma of their reduced
+cell as a spike source.  NEURON requires a gid to be registered (pc.cell)
+before it is used in pc.gid_connect() on the same rank, so usually the gids
+are registered on the full cells (see register_spike_source()); these
+registrations are kept, since the soma and axon of the original cell are the
+soma and axon of the reduced cell.
+
+for testing locally:
+    mpiexec -n 4 python tests/test_parallel_network.py
+'''
+import collections
+import logging
+import time
+
+from neuron import h
+
+from .subtree_reductor_func import subtree_reductor
+
+logger = logging.getLogger(__name__)
+
+SPIKE_THRESHOLD = -20  # mV
+GID_IS_OUTPUT_CELL = 3  # returned by pc.gid_exists() for gids with a spike source on this rank
+
+RankReductionReport = collections.namedtuple('RankReductionReport',
+                                             'rank, n_cells, reduction_time, time_per_gid, '
+                                             'n_netcons, n_synapses_before, n_synapses_after')
+
+
+def register_spike_source(pc, gid, cell, threshold=SPIKE_THRESHOLD):
+    '''registers the soma of the cell as the spike source of gid on this rank
+
+    Returns the spike detecting NetCon, or None if gid already had a spike source
+    '''
+    gid_exists = pc.gid_exists(gid)
+    if gid_exists == GID_IS_OUTPUT_CELL:
+        logger.debug('gid %d already has a spike source, it is kept', gid)
+        return None
+    if gid_exists == 0:
+        pc.set_gid2node(gid, pc.id())
+
+    soma = cell.soma[0] if cell.soma.hname()[-1] == ']' else cell.soma
+    spike_detector = h.NetCon(soma(0.5)._ref_v, None, sec=soma)
+    spike_detector.threshold = threshold
+    pc.cell(gid, spike_detector)
+    return spike_detector
+
+
+def check_netcons_targets(gid, netcons_list):
+    '''raises if a NetCon of the reduced cell does not target a located synapse'''
+    for netcon in netcons_list:
+        synapse = netcon.syn()
+        if synapse is None or not synapse.has_loc():
+            raise Exception('A NetCon of gid %d lost its target synapse during the reduction' %
+                            gid)
+
+
+def reduce_rank_cells(pc, cells, reduction_frequency, threshold=SPIKE_THRESHOLD,
+                      **reductor_kwargs):
+    '''reduces the cells owned by this rank, and registers the reduced somata as spike sources
+
+    pc: the h.ParallelContext of the network
+    cells: dictionary of {gid: (cell, synapses_list, netcons_list)} of the cells
+           owned by this rank (arguments of subtree_reductor())
+    reduction_frequency: passed to subtree_reductor()
+    threshold: the spike detection threshold of the reduced somata
+    reductor_kwargs: other keyword arguments for subtree_reductor()
+
+    Must be called on all the ranks, since the timing reports are gathered.
+
+    Returns (reduced_cells, reports) where:
+      reduced_cells is a dictionary of {gid: (reduced_cell, synapses_list,
+      netcons_list, spike_detector)}, spike_detector is None if the gid already
+      had a spike source
+      reports is a list of RankReductionReport, one per rank (ordered by rank)
+    '''
+    reduced_cells, time_per_gid = {}, {}
+    n_netcons = n_synapses_before = n_synapses_after = 0
+    start = time.time()
+    for gid in sorted(cells):
+        cell, synapses_list, netcons_list = cells[gid]
+        n_synapses_before += len(synapses_list)
+
+        gid_start = time.time()
+        reduced_cell, synapses_list, netcons_list = subtree_reductor(cell,
+                                                                     synapses_list,
+                                                                     netcons_list,
+                                                                     reduction_frequency,
+                                                                     **reductor_kwargs)
+        time_per_gid[gid] = time.time() - gid_start
+
+        check_netcons_targets(gid, netcons_list)
+        spike_detector = register_spike_source(pc, gid, reduced_cell, threshold)
+        reduced_cells[gid] = (reduced_cell, synapses_list, netcons_list, spike_detector)
+
+        n_netcons += len(netcons_list)
+        n_synapses_after += len(synapses_list)
+
+    report = RankReductionReport(rank=int(pc.id()),
+                                 n_cells=len(cells),
+                                 reduction_time=time.time() - start,
+                                 time_per_gid=time_per_gid,
+                                 n_netcons=n_netcons,
+                                 n_synapses_before=n_synapses_before,
+                                 n_synapses_after=n_synapses_after)
+    reports = pc.py_allgather(report)
+    if pc.id() == 0:
+        for rank_report in reports:
+            logger.info('rank %d reduced %d cells in %.2f s (%d -> %d synapses)',
+                        rank_report.rank, rank_report.n_cells, rank_report.reduction_time,
+                        rank_report.n_synapses_before, rank_report.n_synapses_after)
+    return reduced_cells, list(reports)
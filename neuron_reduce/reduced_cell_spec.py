@@ -0,0 +1,218 @@
+'''
+Serialization of reduced cells
+
+A reduced cell (as returned by subtree_reductor()) is converted into a "spec":
+a plain, JSON-serializable dictionary that holds everything needed to rebuild
+the cell in another NEURON instance:
+ - the sections of the cell (soma, reduced cables and the axon), their
+   topology, geometry, passive properties and the per-segment values of all
+   the mechanisms inserted in them
+ - the (merged) synapses and their parameters
+ - the NetCons, in the order they were given to subtree_reductor(), each
+   pointing to the index of the synapse it now targets
+
+This makes it possible to reduce cells in worker processes and send the
+results back, or to store them on disk and instantiate them later.
+'''
+import json
+import logging
+
+from neuron import h
+
+from .subtree_reductor_func import (Neuron,
+                                    add_PP_properties_to_dict,
+                                    get_segment_mech_vals,
+                                    type_of_point_process,
+                                    )
+
+logger = logging.getLogger(__name__)
+SPEC_VERSION = 1
+
+
+def _short_section_name(sec):
+    '''returns the section name without the cell prefix, ie: "apic[0]"'''
+    return sec.hname().split('.')[-1]
+
+
+def _section_to_spec(sec, parent_index):
+    '''returns the spec of a single section'''
+    section_spec = {'name': _short_section_name(sec),
+                    'parent': parent_index,
+                    'parent_x': sec.parentseg().x if parent_index is not None else None,
+                    'orientation': h.section_orientation(sec=sec),
+                    'nseg': sec.nseg,
+                    'L': sec.L,
+                    'Ra': sec.Ra,
+                    'cm': [seg.cm for seg in sec],
+                    'diam': [seg.diam for seg in sec],
+                    'pt3d': [],
+                    'mechanisms': {},
+                    }
+
+    n3d = int(h.n3d(sec=sec))
+    if n3d > 0:
+        section_spec['pt3d'] = [(h.x3d(i, sec=sec), h.y3d(i, sec=sec), h.z3d(i, sec=sec),
+                                 h.diam3d(i, sec=sec))
+                                for i in range(n3d)]
+
+    for i, seg in enumerate(sec):
+        for mech_name, params in get_segment_mech_vals(seg).items():
+            mech_spec = section_spec['mechanisms'].setdefault(mech_name, {})
+            for param_name, value in params.items():
+                mech_spec.setdefault(param_name, [None] * sec.nseg)[i] = value
+
+    return section_spec
+
+
+def _point_process_params(PP, PP_params_dict):
+    '''returns the numerical parameters of the point process'''
+    if type_of_point_process(PP) not in PP_params_dict:
+        add_PP_properties_to_dict(PP, PP_params_dict)
+
+    params = {}
+    for param in PP_params_dict[type_of_point_process(PP)]:
+        value = getattr(PP, param)
+        if isinstance(value, float):
+            params[param] = value
+    return params
+
+
+def reduced_cell_to_spec(cell, synapses_list, netcons_list):
+    '''converts a reduced cell, its synapses and netcons to a spec
+
+    cell, synapses_list and netcons_list are the values returned by subtree_reductor()
+
+    Note: the sources of the netcons are not part of the spec, the i'th netcon
+    in the spec corresponds to the i'th netcon in netcons_list
+    '''
+    soma = cell.soma[0] if cell.soma.hname()[-1] == ']' else cell.soma
+    # the axon may be the parent of the soma, so the tree is walked from its root
+    root = h.SectionRef(sec=soma).root
+
+    sections = [root]
+    section_indexes = {root.hname(): 0}
+    sections_spec = [_section_to_spec(root, None)]
+
+    # parents are always before their children
+    for sec in sections:
+        for child in h.SectionRef(sec=sec).child:
+            section_indexes[child.hname()] = len(sections)
+            sections.append(child)
+            sections_spec.append(_section_to_spec(child, section_indexes[sec.hname()]))
+
+    PP_params_dict = {}
+    synapses_spec, synapse_indexes = [], {}
+    for synapse in synapses_list:
+        seg = synapse.get_segment()
+        synapse_indexes[synapse.hname()] = len(synapses_spec)
+        synapses_spec.append({'type': type_of_point_process(synapse),
+                              'section': section_indexes[seg.sec.hname()],
+                              'x': seg.x,
+                              'params': _point_process_params(synapse, PP_params_dict),
+                              })
+
+    netcons_spec = []
+    for netcon in netcons_list:
+        netcons_spec.append({'synapse': synapse_indexes[netcon.syn().hname()],
+                             'weight': [netcon.weight[i] for i in range(int(netcon.wcnt()))],
+                             'delay': netcon.delay,
+                             })
+
+    return {'version': SPEC_VERSION,
+            'soma': section_indexes[soma.hname()],
+            'sections': sections_spec,
+            'synapses': synapses_spec,
+            'netcons': netcons_spec,
+            }
+
+
+def _set_segment_values(sec, mechanisms):
+    '''sets the per-segment values of the mechanisms of `sec`'''
+    # ions are implicitly inserted by the mechanisms that use them
+    for mech_name in mechanisms:
+        if not mech_name.endswith('_ion'):
+            sec.insert(mech_name)
+
+    for params in mechanisms.values():
+        for param_name, values in params.items():
+            for seg, value in zip(sec, values):
+                try:
+                    setattr(seg, param_name, value)
+                except (AttributeError, LookupError, ValueError):
+                    logger.debug('could not set %s in %s', param_name, seg)
+
+
+def instantiate_spec(spec, netcon_sources=None):
+    '''creates a cell from a spec (see reduced_cell_to_spec())
+
+    netcon_sources: optional list of sources (ie NetStims) for the netcons,
+                    if None, the netcons are created without a source
+
+    Returns the cell (a Neuron object whose sections are python sections),
+    a list of synapses, and a list of netcons
+    '''
+    assert spec['version'] == SPEC_VERSION, 'unsupported spec version %s' % spec['version']
+    if netcon_sources is None:
+        netcon_sources = [None] * len(spec['netcons'])
+    assert len(netcon_sources) == len(spec['netcons']), \
+        'there must be a source for each netcon in the spec'
+
+    cell = Neuron(None)
+    sections = []
+    for section_spec in spec['sections']:
+        sec = h.Section(name=section_spec['name'])
+        if section_spec['parent'] is not None:
+            sec.connect(sections[section_spec['parent']](section_spec['parent_x']),
+                        section_spec['orientation'])
+
+        sec.nseg = section_spec['nseg']
+        sec.Ra = section_spec['Ra']
+        if section_spec['pt3d']:
+            for x, y, z, diam in section_spec['pt3d']:
+                h.pt3dadd(x, y, z, diam, sec=sec)
+        else:
+            sec.L = section_spec['L']
+        for seg, cm, diam in zip(sec, section_spec['cm'], section_spec['diam']):
+            seg.cm = cm
+            if not section_spec['pt3d']:
+                seg.diam = diam
+
+        _set_segment_values(sec, section_spec['mechanisms'])
+        sections.append(sec)
+
+    cell.all = sections
+    cell.soma = sections[spec['soma']]
+    cell.dend = [sec for sec in sections if sec.name().startswith('dend')]
+    cell.axon = [sec for sec in sections if sec.name().startswith('axon')]
+    apic = [sec for sec in sections if sec.name().startswith('apic')]
+    cell.apic = apic[0] if apic else None
+
+    synapses_list = []
+    for synapse_spec in spec['synapses']:
+        sec = sections[synapse_spec['section']]
+        synapse = getattr(h, synapse_spec['type'])(sec(synapse_spec['x']))
+        for param, value in synapse_spec['params'].items():
+            setattr(synapse, param, value)
+        synapses_list.append(synapse)
+
+    netcons_list = []
+    for netcon_spec, source in zip(spec['netcons'], netcon_sources):
+        netcon = h.NetCon(source, synapses_list[netcon_spec['synapse']])
+        for i, weight in enumerate(netcon_spec['weight']):
+            netcon.weight[i] = weight
+        netcon.delay = netcon_spec['delay']
+        netcons_list.append(netcon)
+
+    return cell, synapses_list, netcons_list
+
+
+def save_spec(spec, filename):
+    '''writes the spec to a json file'''
+    with open(filename, 'w') as fd:
+        json.dump(spec, fd)
+
+
+def load_spec(filename):
+    '''reads a spec from a json file'''
+    with open(filename) as fd:
+        return json.load(fd)
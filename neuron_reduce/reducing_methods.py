@@ -8,15 +8,28 @@ import logging
 import math
 import cmath
 
+import numpy as np
 from neuron import h
 
+from . import instrumentation
+
 logger = logging.getLogger(__name__)
 CableParams = collections.namedtuple('CableParams',
                                      'length, diam, space_const,'
                                      'cm, rm, ra, e_pas, electrotonic_length')
 SynapseLocation = collections.namedtuple('SynapseLocation', 'subtree_index, section_num, x')
 
-h('''obfunc lowest_impedance_recursive() { local lowest_impedance, lowest_phase, i   localobj curr_subtree_root, sref1, lowest_imp_vec, lowest_child_subtree_impedance, imp_obj
+# everything measured in the hoc model that is needed to reduce a subtree (see extract_subtree_arrays)
+SubtreeArrays = collections.namedtuple('SubtreeArrays',
+                                       'cm, rm, ra, e_pas, q, root_input_impedance, '
+                                       'lowest_impedance, transfer_impedances')
+# the reduced cable of a subtree, and the relative locations on it of the given transfer impedances
+SubtreeReduction = collections.namedtuple('SubtreeReduction', 'cable_params, relative_locations')
+
+# Returns (as a vector) the lowest "transfer impedance (in Mohms) + transfer phase" within the
+# subtree of the given subtree root section in relation to the proximal (to soma) tip of the
+# given subtree root section, recursive.  Defined in hoc on first use, see define_hoc_functions()
+LOWEST_IMPEDANCE_RECURSIVE = '''obfunc lowest_impedance_recursive() { local lowest_impedance, lowest_phase, i   localobj curr_subtree_root, sref1, lowest_imp_vec, lowest_child_subtree_impedance, imp_obj
     curr_subtree_root = $o1  // in the first call to the function, this is a root section of a dendritic trunk
     imp_obj = $o2
     curr_subtree_root.sec {
@@ -38,7 +51,21 @@ h('''obfunc lowest_impedance_recursive() { local lowest_impedance, lowest_phase,
     lowest_imp_vec.x[0] = lowest_impedance
     lowest_imp_vec.x[1] = lowest_phase
     return lowest_imp_vec
-}''')
+}'''
+
+_hoc_functions_defined = False
+
+
+def define_hoc_functions():
+    '''defines the hoc functions of the reduction, once
+
+    not done on import, so importing neuron_reduce doesn't change the hoc state
+    '''
+    global _hoc_functions_defined  # pylint: disable=global-statement
+    if not _hoc_functions_defined:
+        if not h.name_declared('lowest_impedance_recursive'):
+            h(LOWEST_IMPEDANCE_RECURSIVE)
+        _hoc_functions_defined = True
 
 
 @contextlib.contextmanager
@@ -81,8 +108,10 @@ def find_lowest_subtree_impedance(subtree_root_ref, imp_obj):
 
     returns the lowest impedance in Ohms
     '''
+    define_hoc_functions()
     # returns [lowest subtree transfer impedance in Mohms, transfer phase]
     lowest_impedance = h.lowest_impedance_recursive(subtree_root_ref, imp_obj)
+    instrumentation.count('hoc_calls')
     # impedance saved as a complex number after converting Mohms to ohms
     curr_lowest_subtree_imp = cmath.rect(lowest_impedance.x[0] * 1000000, lowest_impedance.x[1])
     return curr_lowest_subtree_imp
@@ -108,6 +137,7 @@ def find_best_real_L(Z0, ZL_goal, q, max_L=10.0, max_depth=50):
     ZL_goal_A = cmath.polar(ZL_goal)[0]
 
     for _ in range(max_depth):
+        instrumentation.count('bisection_iterations')
         Z_current_L_A = compute_zl_polar(Z0, current_L, q)[0]
         if abs(ZL_goal_A - Z_current_L_A) <= 0.001:  # Z are in Ohms , normal values are >10^6
             break
@@ -140,6 +170,7 @@ def find_best_real_X(Z0, ZX_goal, q, L, max_depth=50):
     ZX_goal = cmath.polar(ZX_goal)[0]
 
     for _ in range(max_depth):
+        instrumentation.count('bisection_iterations')
         Z_current_X_A = compute_zx_polar(Z0, L, q, current_x)[0]
 
         if abs(ZX_goal - Z_current_X_A) <= 0.001:
@@ -223,7 +254,21 @@ def reduce_subtree(subtree_root, frequency):
     somatic end, and the transfer impedance in the subtree from the distal end
     to the proximal somatic end (between the new cable's two tips).
     '''
+    return reduce_subtree_arrays(extract_subtree_arrays(subtree_root, frequency, [])).cable_params
 
+
+def extract_subtree_arrays(subtree_root, frequency, locations):
+    '''measures in the hoc model everything that is needed in order to reduce the subtree
+
+    locations: a list of (section, x) in the subtree (ie: of synapses or
+               segments), whose transfer impedances to the somatic-proximal end
+               of the subtree root section are measured, to later find their
+               locations on the reduced cable
+
+    All the hoc calls of the reduction of a subtree are done here, using a
+    single impedance computation, so that reduce_subtree_arrays() can run in
+    another thread or process.  Returns a SubtreeArrays.
+    '''
     subtree_root_ref = h.SectionRef(sec=subtree_root)
     cm, rm, ra, e_pas, q = _get_subtree_biophysical_properties(subtree_root_ref, frequency)
 
@@ -233,14 +278,40 @@ def reduce_subtree(subtree_root, frequency):
     imp_obj, root_input_impedance = measure_input_impedance_of_subtree(subtree_root, frequency)
 
     # in Ohms (a complex number)
-    curr_lowest_subtree_imp = find_lowest_subtree_impedance(subtree_root_ref, imp_obj)
+    lowest_impedance = find_lowest_subtree_impedance(subtree_root_ref, imp_obj)
+
+    transfer_impedances = np.array([measure_transfer_impedance(imp_obj, section, x)
+                                    for section, x in locations], dtype=complex)
+
+    return SubtreeArrays(cm=cm,
+                         rm=rm,
+                         ra=ra,
+                         e_pas=e_pas,
+                         q=q,
+                         root_input_impedance=root_input_impedance,
+                         lowest_impedance=lowest_impedance,
+                         transfer_impedances=transfer_impedances)
+
+
+def reduce_subtree_arrays(subtree_arrays):
+    '''reduces a subtree, given the values measured by extract_subtree_arrays()
+
+    Returns a SubtreeReduction: the CableParams of the new cable, and the
+    relative locations (x, 0<=x<=1) on the new cable of the measured transfer
+    impedances (see reduce_synapse()).
+
+    Does not use hoc, it may run in any thread or process.
+    '''
+    rm, ra, q = subtree_arrays.rm, subtree_arrays.ra, subtree_arrays.q
+    root_input_impedance = subtree_arrays.root_input_impedance
 
     # reducing the whole subtree into one section:
     # L = 1/q * arcosh(ZtreeIn(f)/min(ZtreeX,0(f)),
     # d = ( (2/pi * (sqrt(Rm*Ra)/q*ZtreeIn(f)) * coth(qL) )^(2/3) - from Gal Eliraz's thesis 1999
-    new_cable_electrotonic_length = find_subtree_new_electrotonic_length(root_input_impedance,
-                                                                         curr_lowest_subtree_imp,
-                                                                         q)
+    new_cable_electrotonic_length = find_subtree_new_electrotonic_length(
+        root_input_impedance,
+        subtree_arrays.lowest_impedance,
+        q)
     cable_electrotonic_length_as_complex = complex(new_cable_electrotonic_length, 0)
     new_cable_diameter_in_cm = _find_subtree_new_diam_in_cm(root_input_impedance,
                                                             cable_electrotonic_length_as_complex,
@@ -257,14 +328,170 @@ def reduce_subtree(subtree_root, frequency):
     curr_space_const_in_micron = 10000 * curr_space_const_in_cm
     new_cable_length = curr_space_const_in_micron * new_cable_electrotonic_length  # in microns
 
-    return CableParams(length=new_cable_length,
-                       diam=new_cable_diameter,
-                       space_const=curr_space_const_in_micron,
-                       cm=cm,
-                       rm=rm,
-                       ra=ra,
-                       e_pas=e_pas,
-                       electrotonic_length=new_cable_electrotonic_length)
+    cable_params = CableParams(length=new_cable_length,
+                               diam=new_cable_diameter,
+                               space_const=curr_space_const_in_micron,
+                               cm=subtree_arrays.cm,
+                               rm=rm,
+                               ra=ra,
+                               e_pas=subtree_arrays.e_pas,
+                               electrotonic_length=new_cable_electrotonic_length)
+
+    relative_locations = [find_relative_loc_on_cable(root_input_impedance,
+                                                     complex(transfer_impedance),
+                                                     q,
+                                                     new_cable_electrotonic_length)
+                          for transfer_impedance in subtree_arrays.transfer_impedances]
+
+    return SubtreeReduction(cable_params, relative_locations)
+
+
+def cable_q(cable_params, frequency):
+    '''returns q = sqrt(1+iwRC) of the cable at the given frequency'''
+    RC = cable_params.rm * (float(cable_params.cm) / 1000000)  # in secs
+    return cmath.sqrt(complex(1, 2 * math.pi * frequency * RC))
+
+
+def merge_cables(cables, frequency):
+    '''merges cables, that are connected to the same point, into a single cable
+
+    The cables must have the same membrane and axial properties.  The
+    electrotonic length of the merged cable is the average of their electrotonic
+    lengths, weighted by diam^(3/2), and its diameter is chosen such that its
+    input impedance (modulus, at the given frequency) is the one of the cables in
+    parallel.  For cables of the same electrotonic length, this is Rall's 3/2
+    power rule.
+    '''
+    first = cables[0]
+    q = cable_q(first, frequency)
+    weights = [cable.diam ** 1.5 for cable in cables]
+
+    electrotonic_length = (sum(weight * cable.electrotonic_length
+                               for weight, cable in zip(weights, cables)) / sum(weights))
+
+    # the input admittance of a cable is proportional to diam^(3/2) * q * tanh(qL)
+    admittance = sum(weight * cmath.tanh(q * cable.electrotonic_length)
+                     for weight, cable in zip(weights, cables))
+    diam = (abs(admittance) / abs(cmath.tanh(q * electrotonic_length))) ** (2. / 3)
+
+    space_const = 10000 * find_space_const_in_cm(diam / 10000, first.rm, first.ra)
+    return CableParams(length=space_const * electrotonic_length,
+                       diam=diam,
+                       space_const=space_const,
+                       cm=first.cm,
+                       rm=first.rm,
+                       ra=first.ra,
+                       e_pas=first.e_pas,
+                       electrotonic_length=electrotonic_length)
+
+
+def relative_locations_on_merged_cable(cable, merged_cable, relative_locations, frequency):
+    '''returns the relative locations on merged_cable (see merge_cables())
+
+    that have the same attenuation to the start of the cable as the given
+    relative locations on one of the merged cables
+    '''
+    if cable == merged_cable:
+        return list(relative_locations)
+
+    q = cable_q(cable, frequency)
+    L = cable.electrotonic_length
+    return [find_relative_loc_on_cable(1.,
+                                       cmath.cosh(q * L * (1 - x)) / cmath.cosh(q * L),
+                                       q,
+                                       merged_cable.electrotonic_length)
+            for x in relative_locations]
+
+
+def cable_transfer_impedances(L, q, relative_locations):
+    '''returns the transfer impedances from the relative locations on a sealed end cable to its start
+
+    L is the electrotonic length of the cable, and the impedances are in units
+    of the axial resistance of one space constant of the cable (relative errors
+    do not depend on the units).  At location 0 it is the input impedance of the
+    cable: coth(qL)/q (see equation 2.8 in Gals thesis)
+    '''
+    X = L * np.asarray(relative_locations, dtype=float)
+    return np.cosh(q * (L - X)) / (q * np.sinh(q * L))
+
+
+def segmented_cable_transfer_impedances(L, q, nseg, relative_locations):
+    '''returns the transfer impedances of cable_transfer_impedances() for a cable of nseg segments
+
+    The way NEURON computes them: the membrane of each segment is lumped at its
+    center, with half a segment of axial resistance to each side, and a
+    location is moved to the center of the segment it is in (see find_merged_loc())
+    '''
+    segment_L = float(L) / nseg
+    axial_resistance, membrane_admittance = segment_L, q * q * segment_L
+
+    # impedance of the cable distal to the center of each segment (including its membrane)
+    distal_impedance = [0j] * (nseg + 1)
+    distal_impedance[nseg] = 1 / membrane_admittance
+    for i in range(nseg - 1, 0, -1):
+        distal_impedance[i] = 1 / (membrane_admittance +
+                                   1 / (axial_resistance + distal_impedance[i + 1]))
+
+    # voltages at the nodes when injecting a unit current at the start of the
+    # cable, which are the transfer impedances to its start: the start,
+    # the center of each segment and the end of the cable
+    nodes_v = np.zeros(nseg + 2, dtype=complex)
+    nodes_v[0] = axial_resistance / 2 + distal_impedance[1]
+    nodes_v[1] = distal_impedance[1]
+    for i in range(1, nseg):
+        current = nodes_v[i] / (axial_resistance + distal_impedance[i + 1])
+        nodes_v[i + 1] = current * distal_impedance[i + 1]
+    nodes_v[nseg + 1] = nodes_v[nseg]  # no current flows to the sealed end
+
+    relative_locations = np.asarray(relative_locations, dtype=float)
+    node_index = np.floor(relative_locations * nseg).astype(int) + 1
+    node_index[relative_locations == 0] = 0
+    node_index[relative_locations == 1] = nseg + 1
+    return nodes_v[node_index]
+
+
+def merged_locations(nseg, relative_locations):
+    '''returns the merged locations of the relative locations on a cable of nseg segments
+
+    the same as find_merged_loc() for an array of locations
+    '''
+    relative_locations = np.asarray(relative_locations, dtype=float)
+    at_tips = (relative_locations == 0) | (relative_locations == 1)
+    return np.where(at_tips,
+                    relative_locations,
+                    (np.floor(relative_locations * nseg) + 0.5) / nseg)
+
+
+def segmentation_impedance_error(cable_params, nseg, relative_locations, frequencies):
+    '''returns the largest relative error, due to dividing the cable into nseg segments
+
+    of the input impedance of the cable, and of the transfer impedances to the
+    start of the cable from the merged locations of the given relative
+    locations, at the given frequencies.  The error of moving the locations to
+    their merged locations is not included (see segmentation_displacement())
+    '''
+    relative_locations = np.append(0., relative_locations)
+    L = cable_params.electrotonic_length
+
+    error = 0.
+    for frequency in frequencies:
+        q = cable_q(cable_params, frequency)
+        exact = cable_transfer_impedances(L, q, merged_locations(nseg, relative_locations))
+        segmented = segmented_cable_transfer_impedances(L, q, nseg, relative_locations)
+        error = max(error, np.max(np.abs(segmented - exact) / np.abs(exact)))
+    return error
+
+
+def segmentation_displacement(cable_params, nseg, relative_locations):
+    '''returns the largest distance (in space constants) a location is moved
+
+    to its merged location on a cable of nseg segments
+    '''
+    relative_locations = np.asarray(relative_locations, dtype=float)
+    if not relative_locations.size:
+        return 0.
+    displacement = np.abs(relative_locations - merged_locations(nseg, relative_locations))
+    return np.max(displacement) * cable_params.electrotonic_length
 
 
 def find_merged_loc(cable_nseg, relative_loc):
@@ -305,6 +532,7 @@ def measure_input_impedance_of_subtree(subtree_root_section, frequency):
     # computes transfer impedance from every segment in the model in relation
     # to the origin location above
     imp_obj.compute(frequency + 1 / 9e9, 0)
+    instrumentation.count('impedance_computes')
 
     # in Ohms (impedance measured at soma-proximal end of root section)
     root_input_impedance = imp_obj.input(CLOSE_TO_SOMA_EDGE, sec=subtree_root_section) * 1000000
@@ -314,6 +542,45 @@ def measure_input_impedance_of_subtree(subtree_root_section, frequency):
     return imp_obj, root_input_impedance
 
 
+def measure_transfer_impedance(imp_obj, section, x):
+    '''returns the transfer impedance (as a complex value, in Ohms) from (section, x)
+
+    to the location of the given (computed) Impedance hoc object
+    '''
+    with push_section(section):
+        transfer_imp = imp_obj.transfer(x) * 1000000  # ohms
+        transfer_phase = imp_obj.transfer_phase(x)
+        # creates a complex Impedance value with the given polar coordinates
+        return cmath.rect(transfer_imp, transfer_phase)
+
+
+def find_relative_loc_on_cable(root_input_impedance,
+                               transfer_impedance,
+                               q_subtree,
+                               new_cable_electrotonic_length):
+    '''returns the relative location (x, 0<=x<=1) on the reduced cable
+
+    with the given electrotonic length, that has the given transfer impedance
+    to the somatic end of the cable
+    '''
+    # synapse location could be calculated using:
+    # X = L - (1/q) * arcosh( (Zx,0(f) / ZtreeIn(f)) * cosh(q*L) ),
+    # derived from Rall's cable theory for dendrites (Gal Eliraz)
+    # but we chose to find the X that will give the correct modulus. See comment about L values
+
+    synapse_new_electrotonic_location = find_best_real_X(root_input_impedance,
+                                                         transfer_impedance,
+                                                         q_subtree,
+                                                         new_cable_electrotonic_length)
+    new_relative_loc_in_section = (float(synapse_new_electrotonic_location) /
+                                   new_cable_electrotonic_length)
+
+    if new_relative_loc_in_section > 1:  # PATCH
+        new_relative_loc_in_section = 0.999999
+
+    return new_relative_loc_in_section
+
+
 def reduce_synapse(cell_instance,
                    synapse_location,
                    on_basal,
@@ -342,25 +609,11 @@ def reduce_synapse(cell_instance,
     else:             # basal subtree
         section = cell_instance.dend[synapse_location.section_num]
 
-    with push_section(section):
-        orig_transfer_imp = imp_obj.transfer(synapse_location.x) * 1000000  # ohms
-        orig_transfer_phase = imp_obj.transfer_phase(synapse_location.x)
-        # creates a complex Impedance value with the given polar coordinates
-        orig_synapse_transfer_impedance = cmath.rect(orig_transfer_imp, orig_transfer_phase)
-
-    # synapse location could be calculated using:
-    # X = L - (1/q) * arcosh( (Zx,0(f) / ZtreeIn(f)) * cosh(q*L) ),
-    # derived from Rall's cable theory for dendrites (Gal Eliraz)
-    # but we chose to find the X that will give the correct modulus. See comment about L values
+    orig_synapse_transfer_impedance = measure_transfer_impedance(imp_obj,
+                                                                 section,
+                                                                 synapse_location.x)
 
-    synapse_new_electrotonic_location = find_best_real_X(root_input_impedance,
-                                                         orig_synapse_transfer_impedance,
-                                                         q_subtree,
-                                                         new_cable_electrotonic_length)
-    new_relative_loc_in_section = (float(synapse_new_electrotonic_location) /
-                                   new_cable_electrotonic_length)
-
-    if new_relative_loc_in_section > 1:  # PATCH
-        new_relative_loc_in_section = 0.999999
-
-    return new_relative_loc_in_section
+    return find_relative_loc_on_cable(root_input_impedance,
+                                      orig_synapse_transfer_impedance,
+                                      q_subtree,
+                                      new_cable_electrotonic_length)
@@ -0,0 +1,91 @@
+'''
+The mapping of the segments of the original cell to the segments of the reduced cell, as arrays
+
+subtree_reductor(..., return_seg_to_seg='arrays') returns a SegmentMapping:
+an entry per original dendritic segment, with the id of its section (an index
+of original_section_names) and its x, and the id of the reduced cable it is
+mapped to (an index of reduced_cable_names) and the index of the segment in
+that cable.  The names are the names of the sections in their cell (ie:
+dend[3]), without the name of the cell.
+
+averaging_matrix() returns a scipy.sparse matrix, that projects values of the
+original segments (in the order of the entries) to the reduced segments (cable
+after cable, see reduced_segment_offsets()) with one product, ie: the average
+density of a mechanism, as done by the reduction (see copy_dendritic_mech()):
+    mapping = ...
+    densities = np.array([...])  # per entry of the mapping
+    reduced_densities = averaging_matrix(mapping).dot(densities)
+or the sum of the areas of the original segments of every reduced segment:
+    reduced_areas = averaging_matrix(mapping, mean=False).dot(areas)
+'''
+import collections
+
+import numpy as np
+
+SegmentMapping = collections.namedtuple('SegmentMapping',
+                                        'original_section_names, original_section_ids, '
+                                        'original_xs, reduced_cable_names, reduced_nsegs, '
+                                        'reduced_cable_ids, reduced_segment_indices')
+
+
+def section_name(section):
+    '''the name of the section in its cell (ie: dend[3]), without the name of the cell'''
+    return section.name().split('.')[-1]
+
+
+def segment_mapping_arrays(original_seg_to_reduced_seg, reduced_cables):
+    '''returns the SegmentMapping of {original segment: reduced segment}
+
+    reduced_cables: the sections of the reduced cell the segments are mapped to
+    '''
+    reduced_cable_ids = {cable: cable_id for cable_id, cable in enumerate(reduced_cables)}
+    original_section_ids = collections.OrderedDict()
+
+    n_segments = len(original_seg_to_reduced_seg)
+    section_ids = np.empty(n_segments, dtype=np.int32)
+    xs = np.empty(n_segments, dtype=np.float64)
+    cable_ids = np.empty(n_segments, dtype=np.int32)
+    segment_indices = np.empty(n_segments, dtype=np.int32)
+    for i, (seg, reduced_seg) in enumerate(original_seg_to_reduced_seg.items()):
+        section_ids[i] = original_section_ids.setdefault(seg.sec, len(original_section_ids))
+        xs[i] = seg.x
+        cable_ids[i] = reduced_cable_ids[reduced_seg.sec]
+        # the reduced segment is given by the location it was mapped to
+        nseg = reduced_seg.sec.nseg
+        segment_indices[i] = min(int(reduced_seg.x * nseg), nseg - 1)
+
+    return SegmentMapping(original_section_names=[section_name(section)
+                                                  for section in original_section_ids],
+                          original_section_ids=section_ids,
+                          original_xs=xs,
+                          reduced_cable_names=[section_name(cable) for cable in reduced_cables],
+                          reduced_nsegs=np.array([cable.nseg for cable in reduced_cables],
+                                                 dtype=np.int32),
+                          reduced_cable_ids=cable_ids,
+                          reduced_segment_indices=segment_indices)
+
+
+def reduced_segment_offsets(mapping):
+    '''the index, in the rows of averaging_matrix(), of the first segment of each reduced cable'''
+    return np.concatenate(([0], np.cumsum(mapping.reduced_nsegs)[:-1])).astype(np.int64)
+
+
+def averaging_matrix(mapping, mean=True):
+    '''returns the (number of reduced segments, number of entries) scipy.sparse.csr_matrix
+
+    that projects values of the original segments to the reduced segments:
+    their mean (or their sum if mean is False).  The rows of reduced segments
+    no original segment is mapped to are 0.
+    '''
+    import scipy.sparse  # only needed here, neuron_reduce doesn't depend on scipy
+
+    n_entries = len(mapping.original_xs)
+    n_reduced_segments = int(np.sum(mapping.reduced_nsegs))
+    rows = reduced_segment_offsets(mapping)[mapping.reduced_cable_ids] + \
+        mapping.reduced_segment_indices
+    matrix = scipy.sparse.csr_matrix((np.ones(n_entries), (rows, np.arange(n_entries))),
+                                     shape=(n_reduced_segments, n_entries))
+    if mean:
+        counts = np.bincount(rows, minlength=n_reduced_segments)
+        matrix = scipy.sparse.diags(1. / np.maximum(counts, 1)).dot(matrix).tocsr()
+    return matrix
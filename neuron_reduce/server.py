@@ -0,0 +1,237 @@
+'''
+A long-lived reduction server, for interactive model building
+
+Every reduction in a new process pays the startup of python and NEURON, the
+loading of the mechanisms and of the model templates.  The server is a process
+that loads the mechanisms once, keeps the templates it has loaded, and reduces
+the ReductionJobs (see batch.py) it receives over a local connection
+(multiprocessing.connection: a unix socket, or a named pipe on windows); the
+replies are JobResults, with the spec of the reduced cell (see
+reduced_cell_spec.py).  The sections that a job creates are deleted after it,
+so every job starts from the same NEURON state.
+
+The requests are unpickled by the server, so only the clients that have its
+authkey can connect; a bad request (ie: not a (command, argument) tuple) is
+answered with its exception, and a client that hangs up is dropped.
+
+usage:
+    process, address, authkey = start_server(mechanisms=['x86_64/libnrnmech.so'])
+    with ReductionClient(address, authkey) as client:
+        result = client.reduce(ReductionJob(name='cell1', ...,
+                                            synapse_arrays=load_synapse_location_arrays(...)))
+        ...
+        client.shutdown()
+    process.join()
+
+or, in a terminal:
+    python -m neuron_reduce.server --address /tmp/reduction_server \\
+        --mechanisms x86_64/libnrnmech.so
+which prints its (random) authkey in hex, or takes one with --authkey, and
+clients connect with ReductionClient('/tmp/reduction_server', bytes.fromhex(authkey)).
+'''
+from __future__ import print_function
+
+import argparse
+import logging
+import multiprocessing
+import multiprocessing.connection
+import os
+import sys
+
+from neuron import h
+
+from .batch import _delete_new_sections, _run_job, load_mechanisms
+
+logger = logging.getLogger(__name__)
+
+# the requests are (command, argument) tuples
+COMMANDS = ('reduce', 'status', 'shutdown', )
+AUTHKEY_LENGTH = 32  # bytes
+
+
+class ReductionServer(object):
+    '''reduces the jobs received over the connections of a Listener
+
+    mechanisms: paths of compiled mechanisms libraries, loaded once
+    profile: if True, the results have the profile of each reduction
+    '''
+    def __init__(self, listener, mechanisms=(), profile=False):
+        self.listener = listener
+        self.profile = profile
+        self.jobs = 0
+        load_mechanisms(list(mechanisms))
+        h.load_file("import3d.hoc")
+
+    def reduce(self, job):
+        '''reduces the job, returns its JobResult
+
+        whatever happens to the job, the sections it created are deleted
+        '''
+        sections_before = set(h.allsec())
+        try:
+            return _run_job(job, self.profile)
+        finally:
+            _delete_new_sections(sections_before)
+            self.jobs += 1
+
+    def status(self):
+        '''the number of jobs reduced, and of sections (that should not grow with the jobs)'''
+        return {'jobs': self.jobs, 'sections': len(list(h.allsec()))}
+
+    def _reply(self, request):
+        '''returns the reply to the request, and whether the server goes on running
+
+        the reply to a bad request is its exception
+        '''
+        try:
+            command, argument = request
+            if command == 'reduce':
+                return self.reduce(argument), True
+            elif command == 'status':
+                return self.status(), True
+            elif command == 'shutdown':
+                return None, False
+            raise ValueError('Unknown command %s, must be one of %s' % (command, COMMANDS))
+        except Exception as error:  # pylint: disable=broad-except
+            logger.warning('bad request: %s', error)
+            return error, True
+
+    def serve_connection(self, connection):
+        '''answers the requests of the connection, until it is closed
+
+        a connection that fails (ie: its client hung up) is dropped.  Returns
+        False if the server was asked to shut down
+        '''
+        while True:
+            try:
+                request = connection.recv()
+            except (EOFError, OSError):
+                return True
+            except Exception as error:  # pylint: disable=broad-except
+                # ie: a request that can't be unpickled
+                request = error
+
+            if isinstance(request, Exception):
+                reply, running = request, True
+            else:
+                reply, running = self._reply(request)
+
+            try:
+                connection.send(reply)
+            except (EOFError, OSError):
+                logger.warning('the client hung up before its reply, it is dropped')
+                return running
+            if not running:
+                return False
+
+    def serve_forever(self):
+        '''accepts connections, one at a time, until it is shut down'''
+        running = True
+        while running:
+            try:
+                connection = self.listener.accept()
+            except (multiprocessing.AuthenticationError, EOFError, OSError) as error:
+                logger.warning('refused a client: %s', error)
+                continue
+            with connection:
+                running = self.serve_connection(connection)
+        self.listener.close()
+
+
+def serve(address=None, mechanisms=(), profile=False, authkey=None, ready=None):
+    '''runs a ReductionServer listening at address (a new one if None)
+
+    ready: an optional Connection, the address is sent to it once the server listens
+    '''
+    listener = multiprocessing.connection.Listener(address, authkey=authkey)
+    server = ReductionServer(listener, mechanisms, profile)
+    logger.info('reduction server listening at %s', listener.address)
+    if ready is not None:
+        ready.send(listener.address)
+        ready.close()
+    server.serve_forever()
+
+
+def start_server(address=None, mechanisms=(), profile=False, authkey=None, mp_context='spawn'):
+    '''starts a server process, returns the process, the address it listens at and its authkey
+
+    authkey: the key the clients must have (the requests are unpickled, so
+             only trusted clients may connect), a random one by default
+    mp_context: the multiprocessing start method, 'spawn' ensures that the
+                server starts with a clean NEURON instance
+    '''
+    authkey = authkey or os.urandom(AUTHKEY_LENGTH)
+    context = multiprocessing.get_context(mp_context)
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=serve,
+                              args=(address, list(mechanisms), profile, authkey, sender))
+    process.daemon = True
+    process.start()
+    sender.close()
+    return process, receiver.recv(), authkey
+
+
+class ReductionClient(object):
+    '''a connection to a reduction server'''
+    def __init__(self, address, authkey=None):
+        self.connection = multiprocessing.connection.Client(address, authkey=authkey)
+
+    def _request(self, command, argument=None):
+        '''sends the request, returns its reply'''
+        self.connection.send((command, argument))
+        reply = self.connection.recv()
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+
+    def reduce(self, job):
+        '''returns the JobResult of the ReductionJob'''
+        return self._request('reduce', job)
+
+    def status(self):
+        '''returns {'jobs': number of jobs reduced, 'sections': number of sections} of the server'''
+        return self._request('status')
+
+    def shutdown(self):
+        '''stops the server'''
+        self._request('shutdown')
+        self.close()
+
+    def close(self):
+        '''closes the connection, the server waits for the next client'''
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        if not self.connection.closed:
+            self.close()
+
+
+def main(argv):
+    '''main'''
+    parser = argparse.ArgumentParser(description='A long-lived reduction server')
+    parser.add_argument('--address', help='the path of the socket, a new one by default')
+    parser.add_argument('--authkey',
+                        help='the key (in hex) the clients must have, a random one (that is '
+                        'printed) by default')
+    parser.add_argument('--mechanisms', nargs='*', default=[],
+                        help='compiled mechanisms libraries, loaded once')
+    parser.add_argument('--profile', action='store_true', help='profile every reduction')
+    args = parser.parse_args(argv)
+
+    if args.authkey:
+        authkey = bytes.fromhex(args.authkey)
+    else:
+        authkey = os.urandom(AUTHKEY_LENGTH)
+        print('authkey: %s' % authkey.hex())
+        sys.stdout.flush()
+
+    logging.basicConfig(level=logging.INFO)
+    serve(args.address, args.mechanisms, args.profile, authkey)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
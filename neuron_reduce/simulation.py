@@ -0,0 +1,216 @@
+'''
+Simulating reduced cells, and choosing the fastest integration configuration
+
+A reduced cell has a handful of sections, so the best NEURON configuration
+differs from the one of the full cell: with few equations per step, the
+variable time step method (CVODE) and cache efficient memory layout may pay
+off, and many reduced cells can be simulated in threads.
+
+compare_configs() simulates the cell with each of the given configurations,
+and compares its somatic voltage and spikes to a fixed step reference. The
+speed is reported as simulated ms per wall clock second, and as the number of
+delivered synaptic events per second.
+
+usage:
+    reports = compare_configs(reduced_cell.soma[0](0.5),
+                              tstop=1000,
+                              netcons_list=netcons_list,
+                              before_run=lambda: [r.seq(1) for r in randoms_list])
+    for report in reports:
+        print(report.config.name, report.sim_ms_per_wall_s, report.is_safe)
+    apply_config(fastest_safe_config(reports).config)
+'''
+import collections
+import logging
+import os
+import time
+
+import numpy as np
+from neuron import h
+
+from .parallel_network import SPIKE_THRESHOLD
+from .subtree_reductor_func import initialize_hoc
+
+logger = logging.getLogger(__name__)
+
+SimulationConfig = collections.namedtuple('SimulationConfig',
+                                          'name, dt, cvode, atol, cache_efficient, nthread')
+
+SimulationResult = collections.namedtuple('SimulationResult',
+                                          'config, t, v, spike_times, wall_time, n_events')
+
+SimulationReport = collections.namedtuple('SimulationReport',
+                                          'config, wall_time, sim_ms_per_wall_s, n_events, '
+                                          'events_per_s, n_spikes, rmsd, max_abs_diff, '
+                                          'spike_count_diff, max_spike_time_diff, is_safe')
+
+FIXED_STEP_REFERENCE = SimulationConfig(name='fixed_step',
+                                        dt=0.025,  # ms
+                                        cvode=False,
+                                        atol=None,
+                                        cache_efficient=False,
+                                        nthread=1)
+
+PRESETS = (FIXED_STEP_REFERENCE._replace(name='fixed_step_cache_efficient', cache_efficient=True),
+           FIXED_STEP_REFERENCE._replace(name='fixed_step_dt_0.1', dt=0.1, cache_efficient=True),
+           FIXED_STEP_REFERENCE._replace(name='fixed_step_threads', cache_efficient=True,
+                                         nthread=os.cpu_count() or 1),
+           SimulationConfig(name='cvode', dt=None, cvode=True, atol=1e-3, cache_efficient=True,
+                            nthread=1),
+           SimulationConfig(name='cvode_atol_1e-5', dt=None, cvode=True, atol=1e-5,
+                            cache_efficient=True, nthread=1),
+           )
+
+# a configuration is safe if its somatic voltage is within these tolerances from the reference
+RMSD_TOLERANCE = 0.5  # mV
+SPIKE_TIME_TOLERANCE = 1.  # ms
+
+
+def apply_config(config):
+    '''sets up NEURON to simulate using the given SimulationConfig'''
+    initialize_hoc()
+    h.ParallelContext().nthread(config.nthread)
+    h.cvode.cache_efficient(int(config.cache_efficient))
+    h.cvode.active(int(config.cvode))
+    if config.cvode:
+        h.cvode.atol(config.atol)
+    else:
+        h.steps_per_ms = 1. / config.dt
+        h.dt = config.dt
+
+
+def current_config():
+    '''returns the SimulationConfig that NEURON is currently set up with'''
+    initialize_hoc()
+    return SimulationConfig(name='current',
+                            dt=h.dt,
+                            cvode=bool(h.cvode.active()),
+                            atol=h.cvode.atol(),
+                            cache_efficient=bool(h.cvode.cache_efficient()),
+                            nthread=int(h.ParallelContext().nthread()))
+
+
+def _record_event_sources(netcons_list):
+    '''records the spikes of the point process sources (ie: NetStims) of the NetCons
+
+    returns {source: spike times vector} and the recording NetCons
+    '''
+    spike_times_per_source, recorders = {}, []
+    for netcon in netcons_list:
+        source = netcon.pre()
+        if source is None or source in spike_times_per_source:
+            continue
+        spike_times_per_source[source] = h.Vector()
+        recorder = h.NetCon(source, None)
+        recorder.record(spike_times_per_source[source])
+        recorders.append(recorder)
+    return spike_times_per_source, recorders
+
+
+def run_simulation(seg, tstop, config, netcons_list=(), before_run=None,
+                   threshold=SPIKE_THRESHOLD):
+    '''simulates until tstop with the given SimulationConfig, recording the voltage of seg
+
+    netcons_list: the events delivered by these NetCons are counted (only the
+                  ones whose source is a point process, ie: a NetStim)
+    before_run: an optional function called before initialization (ie: to
+                reset the random generators of the NetStims)
+
+    Returns a SimulationResult, wall_time is the time of the run, excluding the
+    initialization
+    '''
+    apply_config(config)
+
+    t, v, spike_times = h.Vector(), h.Vector(), h.Vector()
+    t.record(h._ref_t)
+    v.record(seg._ref_v)
+    spike_detector = h.NetCon(seg._ref_v, None, sec=seg.sec)
+    spike_detector.threshold = threshold
+    spike_detector.record(spike_times)
+    spike_times_per_source, _recorders = _record_event_sources(netcons_list)
+
+    if before_run is not None:
+        before_run()
+    h.tstop = tstop
+    h.stdinit()
+    start = time.time()
+    h.continuerun(tstop)
+    wall_time = time.time() - start
+
+    n_events = sum(int(spike_times_per_source[netcon.pre()].size())
+                   for netcon in netcons_list if netcon.pre() is not None)
+
+    return SimulationResult(config=config,
+                            t=np.array(t),
+                            v=np.array(v),
+                            spike_times=np.array(spike_times),
+                            wall_time=wall_time,
+                            n_events=n_events)
+
+
+def _report(result, reference, rmsd_tolerance, spike_time_tolerance):
+    '''compares the result of a simulation to the reference one'''
+    # variable time step traces are compared at the times of the reference
+    v = np.interp(reference.t, result.t, result.v)
+    diff = v - reference.v
+    rmsd = np.sqrt(np.mean(diff ** 2))
+
+    spike_count_diff = result.spike_times.size - reference.spike_times.size
+    if spike_count_diff == 0 and reference.spike_times.size:
+        max_spike_time_diff = np.max(np.abs(result.spike_times - reference.spike_times))
+    elif spike_count_diff == 0:
+        max_spike_time_diff = 0.
+    else:
+        max_spike_time_diff = np.inf
+
+    wall_time = max(result.wall_time, 1e-9)
+    return SimulationReport(config=result.config,
+                            wall_time=result.wall_time,
+                            sim_ms_per_wall_s=reference.t[-1] / wall_time,
+                            n_events=result.n_events,
+                            events_per_s=result.n_events / wall_time,
+                            n_spikes=result.spike_times.size,
+                            rmsd=rmsd,
+                            max_abs_diff=np.max(np.abs(diff)),
+                            spike_count_diff=spike_count_diff,
+                            max_spike_time_diff=max_spike_time_diff,
+                            is_safe=(rmsd <= rmsd_tolerance and
+                                     max_spike_time_diff <= spike_time_tolerance))
+
+
+def compare_configs(seg,
+                    tstop,
+                    configs=PRESETS,
+                    reference=FIXED_STEP_REFERENCE,
+                    netcons_list=(),
+                    before_run=None,
+                    rmsd_tolerance=RMSD_TOLERANCE,
+                    spike_time_tolerance=SPIKE_TIME_TOLERANCE):
+    '''simulates with the reference configuration and each of the configs, see run_simulation()
+
+    A configuration is safe if the RMSD of the voltage of seg from the
+    reference is within rmsd_tolerance, and it has the same spikes as the
+    reference, within spike_time_tolerance.  The configuration NEURON was set
+    up with is restored at the end.
+
+    Returns a list of SimulationReport, the first is of the reference
+    '''
+    previous_config = current_config()
+    try:
+        reference_result = run_simulation(seg, tstop, reference, netcons_list, before_run)
+        reports = [_report(reference_result, reference_result, rmsd_tolerance,
+                           spike_time_tolerance)]
+        for config in configs:
+            result = run_simulation(seg, tstop, config, netcons_list, before_run)
+            reports.append(_report(result, reference_result, rmsd_tolerance, spike_time_tolerance))
+            logger.debug('%s: %.1f simulated ms per second, rmsd %.3g mV',
+                         config.name, reports[-1].sim_ms_per_wall_s, reports[-1].rmsd)
+    finally:
+        apply_config(previous_config)
+    return reports
+
+
+def fastest_safe_config(reports):
+    '''returns the SimulationReport of the fastest safe configuration'''
+    return max((report for report in reports if report.is_safe),
+               key=lambda report: report.sim_ms_per_wall_s)
@@ -0,0 +1,205 @@
+'''
+Starting the simulations of a reduced cell from its steady state
+
+A simulation starts from h.v_init, and the active conductances (ie: Ih, Ca)
+need simulated time to settle before the window of interest.  The steady state
+of a reduced cell spec (see reduced_cell_spec.py) is computed once, by
+simulating a copy of the cell without synaptic input for a warm-up period, and
+its snapshot (the voltage, the states of the density mechanisms and the ion
+concentrations of every segment) is stored in a cache directory, keyed by a
+hash of the spec, of the warm-up and of the temperature.  The cells
+instantiated from the spec are then restored to it at the initialization of
+every run.
+
+The states of the point processes (ie: the synapses) are not part of the
+snapshot, they are at rest without input.  The warm-up simulates the whole
+NEURON model, so it is computed before other cells are instantiated.  The cache directory is
+$NEURON_REDUCE_STEADY_STATES_CACHE, or ~/.cache/neuron_reduce/steady_states
+
+usage:
+    steady_state = get_steady_state(spec, warmup=1000)
+    cell, synapses_list, netcons_list = instantiate_spec(spec, netstims)
+    initializer = initialize_to_steady_state([cell], steady_state)  # keep a reference
+    h.stdinit()
+    h.continuerun(tstop)
+'''
+import collections
+import hashlib
+import json
+import logging
+import os
+
+import numpy as np
+from neuron import h
+
+from .reduced_cell_spec import instantiate_spec
+from .subtree_reductor_func import initialize_hoc
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR_ENVIRONMENT_VARIABLE = 'NEURON_REDUCE_STEADY_STATES_CACHE'
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'neuron_reduce',
+                                 'steady_states')
+STEADY_STATE_WARMUP = 1000.  # ms
+STATE_VARTYPE = 3  # of h.MechanismStandard
+
+SteadyState = collections.namedtuple('SteadyState',
+                                     'key, section_indices, segment_indices, variables, values')
+
+_steady_states = {}
+
+
+def cache_dir():
+    '''returns the directory of the steady states cache'''
+    return os.environ.get(CACHE_DIR_ENVIRONMENT_VARIABLE, DEFAULT_CACHE_DIR)
+
+
+def default_v_init(spec):
+    '''the e_pas of the soma of the spec, h.v_init if it has no pas'''
+    soma_mechanisms = spec['sections'][spec['soma']]['mechanisms']
+    if 'pas' in soma_mechanisms:
+        return soma_mechanisms['pas']['e_pas'][0]
+    return h.v_init
+
+
+def steady_state_key(spec, warmup=STEADY_STATE_WARMUP, v_init=None):
+    '''returns the hash of the spec, the warm-up, v_init and the temperature'''
+    v_init = default_v_init(spec) if v_init is None else v_init
+    description = json.dumps({'spec': spec, 'warmup': warmup, 'v_init': v_init,
+                              'celsius': h.celsius}, sort_keys=True)
+    return hashlib.sha256(description.encode('utf-8')).hexdigest()
+
+
+def _segment_state_variables(seg):
+    '''the names of the variables of the state of the segment (ie: v, m_hh, cai)'''
+    variables = ['v']
+    for mech in seg:
+        if mech.is_ion():
+            ion = mech.name()[:-len('_ion')]
+            variables += [ion + 'i', ion + 'o']
+            continue
+        mechanism_standard = h.MechanismStandard(mech.name(), STATE_VARTYPE)
+        name = h.ref('')
+        for i in range(int(mechanism_standard.count())):
+            if mechanism_standard.name(name, i) == 1:
+                variables.append(name[0])
+            else:
+                logger.debug('the state %s of %s is an array, it is not restored',
+                             name[0], mech.name())
+    return variables
+
+
+def capture_state(cell, key=None):
+    '''returns the SteadyState of the current state of a cell instantiated from a spec'''
+    section_indices, segment_indices, variables, values = [], [], [], []
+    for section_index, section in enumerate(cell.all):
+        for segment_index, seg in enumerate(section):
+            for variable in _segment_state_variables(seg):
+                section_indices.append(section_index)
+                segment_indices.append(segment_index)
+                variables.append(variable)
+                values.append(getattr(seg, variable))
+    return SteadyState(key=key,
+                       section_indices=np.array(section_indices, dtype=np.int32),
+                       segment_indices=np.array(segment_indices, dtype=np.int32),
+                       variables=variables,
+                       values=np.array(values, dtype=np.float64))
+
+
+def restore_state(cell, steady_state):
+    '''sets the state of a cell instantiated from the spec of the steady state'''
+    segments = [list(section) for section in cell.all]
+    for section_index, segment_index, variable, value in zip(
+            steady_state.section_indices.tolist(), steady_state.segment_indices.tolist(),
+            steady_state.variables, steady_state.values.tolist()):
+        setattr(segments[section_index][segment_index], variable, value)
+
+
+def compute_steady_state(spec, warmup=STEADY_STATE_WARMUP, v_init=None):
+    '''simulates a copy of the cell of the spec without input for warmup ms, returns its state
+
+    The warm-up initializes and runs the whole NEURON model, so no other
+    section may exist (ValueError otherwise): the steady states are computed
+    (or loaded from the cache by get_steady_state()) before the other cells are
+    instantiated.  The copy is deleted afterwards, and h.v_init and h.tstop are
+    restored.
+    '''
+    initialize_hoc()
+    n_sections = sum(1 for _ in h.allsec())
+    if n_sections:
+        raise ValueError('The steady state is computed by simulating the whole NEURON model, '
+                         'it must not have other sections (it has %d)' % n_sections)
+
+    v_init = default_v_init(spec) if v_init is None else v_init
+    previous_v_init, previous_tstop = h.v_init, h.tstop
+    cell, synapses_list, netcons_list = instantiate_spec(spec)
+    try:
+        h.v_init = v_init
+        h.tstop = warmup
+        h.stdinit()
+        h.continuerun(warmup)
+        steady_state = capture_state(cell, steady_state_key(spec, warmup, v_init))
+    finally:
+        del cell, synapses_list, netcons_list
+        h.v_init, h.tstop = previous_v_init, previous_tstop
+    return steady_state
+
+
+def write_steady_state(path, steady_state):
+    '''writes the SteadyState to a .npz file'''
+    np.savez(path,
+             key=np.array(steady_state.key, dtype=np.str_),
+             section_indices=steady_state.section_indices,
+             segment_indices=steady_state.segment_indices,
+             variables=np.array(steady_state.variables, dtype=np.str_),
+             values=steady_state.values)
+
+
+def load_steady_state(path):
+    '''reads a SteadyState from a .npz file'''
+    with np.load(path, allow_pickle=False) as arrays:
+        return SteadyState(key=str(arrays['key']),
+                           section_indices=arrays['section_indices'],
+                           segment_indices=arrays['segment_indices'],
+                           variables=arrays['variables'].tolist(),
+                           values=arrays['values'])
+
+
+def get_steady_state(spec, warmup=STEADY_STATE_WARMUP, v_init=None, cache=None):
+    '''returns the SteadyState of the spec, computing it if it is not in the cache
+
+    cache: the cache directory, by default cache_dir()
+    '''
+    key = steady_state_key(spec, warmup, v_init)
+    if key in _steady_states:
+        return _steady_states[key]
+
+    path = os.path.join(cache or cache_dir(), key + '.npz')
+    if os.path.exists(path):
+        logger.debug('using the steady state in %s', path)
+        steady_state = load_steady_state(path)
+    else:
+        steady_state = compute_steady_state(spec, warmup, v_init)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        # written under another name and renamed, concurrent processes may compute it too
+        tmp_path = '%s.%d.npz' % (path[:-len('.npz')], os.getpid())
+        write_steady_state(tmp_path, steady_state)
+        os.rename(tmp_path, path)
+        logger.debug('steady state written to %s', path)
+
+    _steady_states[key] = steady_state
+    return steady_state
+
+
+def initialize_to_steady_state(cells, steady_state):
+    '''restores the cells to the steady state at every initialization (ie: h.stdinit())
+
+    cells: cells instantiated from the spec of the steady state
+    Returns the FInitializeHandler, the cells are restored as long as it is referenced
+    '''
+    def restore():
+        for cell in cells:
+            restore_state(cell, steady_state)
+    # type 1: after the INITIAL blocks, before the initial values are recorded
+    return h.FInitializeHandler(1, restore)
@@ -0,0 +1,216 @@
+'''
+Recording long simulations in chunks, with constant memory
+
+run_chunked() simulates in chunks of chunk_ms (h.continuerun), and after
+each chunk it updates the metrics and empties the recording vectors, so the
+memory does not grow with the simulation length:
+- the RMSD and largest absolute difference of each recorded voltage from a
+  reference, either one of the recorded segments (ie: the soma of the full
+  cell, when it is simulated with the reduced cell) or a reference trace array
+  (which can be memory mapped, ie: np.load(file, mmap_mode='r'))
+- the spike counts, and the spike coincidence with the reference segment
+  (see validation.spike_coincidence())
+The raw traces can be written to a .npy file, that is filled as the
+simulation runs (and can be loaded with np.load(trace_file, mmap_mode='r')).
+
+usage:
+    result = run_chunked([full_soma(0.5), reduced_soma(0.5)], tstop=600000,
+                         reference=0, trace_file='traces.npy')
+    print(result.rmsd[1], result.spike_coincidence[1])
+'''
+import collections
+import logging
+
+import numpy as np
+from neuron import h
+
+from .parallel_network import SPIKE_THRESHOLD
+from .subtree_reductor_func import initialize_hoc
+from .validation import SPIKE_COINCIDENCE_WINDOW
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_MS = 1000.
+
+# per recorded segment: rmsd, max_abs_diff (None without a reference), spike_counts,
+# spike_coincidence and mean_spike_time_diff (None without a reference segment)
+StreamingResult = collections.namedtuple('StreamingResult',
+                                         'n_samples, rmsd, max_abs_diff, spike_counts, '
+                                         'spike_coincidence, mean_spike_time_diff, trace_file')
+
+
+class RunningDifference(object):
+    '''the RMSD and the largest absolute difference of a trace from a reference, by chunks'''
+
+    def __init__(self):
+        self.n_samples = 0
+        self.sum_of_squares = 0.
+        self.max_abs_diff = 0.
+
+    def add(self, values, reference_values):
+        '''adds a chunk of the trace, and the same chunk of the reference'''
+        diff = np.asarray(values) - np.asarray(reference_values)
+        if diff.size:
+            self.n_samples += diff.size
+            self.sum_of_squares += float(np.dot(diff, diff))
+            self.max_abs_diff = max(self.max_abs_diff, float(np.max(np.abs(diff))))
+
+    @property
+    def rmsd(self):
+        '''the root mean square difference so far'''
+        return np.sqrt(self.sum_of_squares / self.n_samples) if self.n_samples else 0.
+
+
+class RunningSpikeCoincidence(object):
+    '''the spike coincidence of validation.spike_coincidence(), by chunks
+
+    Only the spikes that may still be matched are kept: a reference spike is
+    matched once the simulation passed it by the window.
+    '''
+
+    def __init__(self, window=SPIKE_COINCIDENCE_WINDOW):
+        self.window = window
+        self.n_reference_spikes = 0
+        self.n_spikes = 0
+        self.n_coincident = 0
+        self.sum_of_time_diffs = 0.
+        self._pending_reference_spikes = np.array([])
+        self._recent_spikes = np.array([])
+
+    def add(self, reference_spike_times, spike_times, t):
+        '''adds the spikes of a chunk of the simulation that ended at t'''
+        self._pending_reference_spikes = np.append(self._pending_reference_spikes,
+                                                   reference_spike_times)
+        self._recent_spikes = np.append(self._recent_spikes, spike_times)
+        self.n_spikes += len(spike_times)
+
+        ready = self._pending_reference_spikes + self.window <= t
+        self._match(self._pending_reference_spikes[ready])
+        self._pending_reference_spikes = self._pending_reference_spikes[~ready]
+        # older spikes can't be in the window of the pending reference spikes
+        self._recent_spikes = self._recent_spikes[self._recent_spikes >= t - 2 * self.window]
+
+    def finish(self):
+        '''matches the remaining reference spikes, at the end of the simulation'''
+        self._match(self._pending_reference_spikes)
+        self._pending_reference_spikes = np.array([])
+
+    def _match(self, reference_spike_times):
+        '''counts the reference spikes that have a spike within the window'''
+        self.n_reference_spikes += reference_spike_times.size
+        if not reference_spike_times.size or not self._recent_spikes.size:
+            return
+        closest = np.abs(reference_spike_times[:, None] - self._recent_spikes[None, :]).min(axis=1)
+        coincident = closest <= self.window
+        self.n_coincident += int(np.sum(coincident))
+        self.sum_of_time_diffs += float(np.sum(closest[coincident]))
+
+    @property
+    def coincidence(self):
+        '''the fraction of reference spikes that have a spike within the window'''
+        if not self.n_reference_spikes:
+            return 1. if not self.n_spikes else 0.
+        return float(self.n_coincident) / self.n_reference_spikes
+
+    @property
+    def mean_spike_time_diff(self):
+        '''the mean time difference of the coincident spikes (0 if there are no spikes at all)'''
+        if not self.n_reference_spikes and not self.n_spikes:
+            return 0.
+        return self.sum_of_time_diffs / self.n_coincident if self.n_coincident else np.nan
+
+
+def run_chunked(segments,
+                tstop,
+                chunk_ms=DEFAULT_CHUNK_MS,
+                reference=None,
+                trace_file=None,
+                threshold=SPIKE_THRESHOLD,
+                window=SPIKE_COINCIDENCE_WINDOW):
+    '''initializes and simulates until tstop in chunks, recording the voltage of the segments
+
+    segments: list of segments to record
+    chunk_ms: the simulated time of each chunk
+    reference: None, the index in segments of the reference segment, or an
+               array of shape (len(segments), n_samples) of reference traces
+               (ie: a memory mapped .npy file)
+    trace_file: optional path of a .npy file to write the traces to, of shape
+                (len(segments), n_samples)
+    threshold: the spike detection threshold
+    window: of the spike coincidence with the reference segment
+
+    Runs with a fixed time step (h.dt), n_samples = tstop / h.dt + 1.
+    Returns a StreamingResult
+    '''
+    initialize_hoc()
+    if h.cvode.active():
+        raise Exception('run_chunked() needs a fixed time step, CVODE must not be active')
+
+    n_samples = int(round(tstop / h.dt)) + 1
+    has_reference_segment = isinstance(reference, int)
+    if reference is not None and not has_reference_segment:
+        assert reference.shape[0] == len(segments) and reference.shape[1] >= n_samples, \
+            'The reference traces must have a trace of %d samples per segment' % n_samples
+
+    traces, spike_times, spike_detectors = [], [], []
+    for seg in segments:
+        traces.append(h.Vector())
+        traces[-1].record(seg._ref_v)
+        spike_times.append(h.Vector())
+        spike_detectors.append(h.NetCon(seg._ref_v, None, sec=seg.sec))
+        spike_detectors[-1].threshold = threshold
+        spike_detectors[-1].record(spike_times[-1])
+
+    trace_array = None
+    if trace_file is not None:
+        trace_array = np.lib.format.open_memmap(trace_file, mode='w+', dtype=float,
+                                                shape=(len(segments), n_samples))
+
+    differences = [RunningDifference() for _ in segments]
+    coincidences = [RunningSpikeCoincidence(window) for _ in segments]
+    spike_counts = [0] * len(segments)
+
+    h.tstop = tstop
+    h.stdinit()
+    offset = 0
+    chunk_ends = list(np.arange(chunk_ms, tstop, chunk_ms)) + [tstop]
+    for chunk_end in chunk_ends:
+        h.continuerun(chunk_end)
+
+        chunk = [np.array(trace) for trace in traces]
+        spikes = [np.array(times) for times in spike_times]
+        chunk_size = min(chunk[0].size, n_samples - offset)
+
+        for i in range(len(segments)):
+            if trace_array is not None:
+                trace_array[i, offset:offset + chunk_size] = chunk[i][:chunk_size]
+            spike_counts[i] += spikes[i].size
+            if has_reference_segment:
+                differences[i].add(chunk[i], chunk[reference])
+                coincidences[i].add(spikes[reference], spikes[i], chunk_end)
+            elif reference is not None:
+                differences[i].add(chunk[i][:chunk_size],
+                                   reference[i, offset:offset + chunk_size])
+
+        offset += chunk_size
+        for vector in traces + spike_times:
+            vector.resize(0)
+
+    if trace_array is not None:
+        trace_array.flush()
+        del trace_array
+
+    for coincidence in coincidences:
+        coincidence.finish()
+
+    return StreamingResult(
+        n_samples=offset,
+        rmsd=[difference.rmsd for difference in differences] if reference is not None else None,
+        max_abs_diff=([difference.max_abs_diff for difference in differences]
+                      if reference is not None else None),
+        spike_counts=spike_counts,
+        spike_coincidence=([coincidence.coincidence for coincidence in coincidences]
+                           if has_reference_segment else None),
+        mean_spike_time_diff=([coincidence.mean_spike_time_diff for coincidence in coincidences]
+                              if has_reference_segment else None),
+        trace_file=trace_file)
@@ -22,49 +22,69 @@ function subtree_reductor():
 import collections
 import itertools as it
 import logging
-import math
+import os
 import re
-import cmath
 
 import numpy as np
 import neuron
 from neuron import h
-h.load_file("stdrun.hoc")
 
-from .reducing_methods import (reduce_subtree,
-                               reduce_synapse,
-                               measure_input_impedance_of_subtree,
+from . import instrumentation
+from .reducing_methods import (define_hoc_functions,
+                               extract_subtree_arrays,
+                               reduce_subtree_arrays,
                                CableParams,
                                SynapseLocation,
+                               merge_cables,
                                push_section,
+                               relative_locations_on_merged_cable,
+                               segmentation_displacement,
+                               segmentation_impedance_error,
                                )
+from .segment_mapping import segment_mapping_arrays
 
 logger = logging.getLogger(__name__)
 SOMA_LABEL = "soma"
+# the template of the reduced cells, reserved so that it never clashes with a model file
+DEFAULT_TEMPLATE_NAME = "NeuronReduceReducedCell"
+SEGMENTATION_CRITERIA = ('impedance', 'displacement', )
+MAX_NSEG_FOR_SEGMENTATION_TOLERANCE = 1001
 EXCLUDE_MECHANISMS = ('pas', 'na_ion', 'k_ion', 'ca_ion', 'h_ion', 'ttx_ion', )
 
+_hoc_initialized = False
 
-def create_sections_in_hoc(type_of_section, num, instance_as_str):
+
+def initialize_hoc():
+    '''loads stdrun.hoc and defines the hoc functions of the reduction, once
+
+    Called by subtree_reductor(), instead of on import: processes that only use
+    the specs, or the array based parts, don't pay for it, and importing
+    neuron_reduce doesn't change the hoc state
+    '''
+    global _hoc_initialized  # pylint: disable=global-statement
+    if not _hoc_initialized:
+        h.load_file("stdrun.hoc")
+        define_hoc_functions()
+        _hoc_initialized = True
+
+
+def create_sections_in_hoc(type_of_section, num, instance):
     '''creates sections in the hoc world according to the given section type and number of sections
 
-    in the instance whose name is given as a string
+    in the given (hoc template) instance
     '''
-    h("strdef string")
-    h.string = type_of_section
-    h('{sprint(string, "create %s[%d]", string, ' + str(num) + ') }')
-    h("{execute(string, " + instance_as_str + ")}")
+    h.execute("create %s[%d]" % (type_of_section, num), instance)
+    instrumentation.count('hoc_calls')
 
 
-def append_to_section_lists(section, type_of_sectionlist, instance_as_str):
+def append_to_section_lists(section, type_of_sectionlist, instance):
     ''' appends given section to the sectionlist of the given type and to the "all" sectionlist
 
-    in the hoc world in the instance whose name is given as a string
+    in the hoc world in the given (hoc template) instance
     '''
-    h("strdef string")
-    h.string = section + " " + type_of_sectionlist + ".append()"
-    h("{execute(string, " + instance_as_str + ")}")
-    h.string = section + " all.append()"
-    h("{execute(string, " + instance_as_str + ")}")
+    h.execute(section + " " + type_of_sectionlist + ".append()", instance)
+    h.execute(section + " all.append()", instance)
+    instrumentation.count('hoc_calls', 2)
 
 
 def find_section_number(section):
@@ -121,6 +141,46 @@ def calculate_nsegs_from_lambda(new_cable_properties):
     return dends_nsegs
 
 
+def calculate_nsegs_from_tolerance(new_cable_properties,
+                                   relative_locations_per_cable,
+                                   tolerance,
+                                   criterion='impedance',
+                                   frequencies=(0, )):
+    '''calculates the minimal number of segments for each section in the reduced model
+
+    such that the error caused by the segmentation is within the tolerance,
+    where criterion is either:
+      'impedance': tolerance is the largest relative error (ie: 0.01) of the
+                   input impedance of the cable and the transfer impedances to
+                   the soma from the segments of the given relative locations
+                   (of synapses and mapped segments), at the given
+                   frequencies, compared to a continuous cable
+      'displacement': tolerance is the largest distance (in space constants)
+                      that a synapse is moved when merged to the center of
+                      its segment
+    '''
+    if criterion not in SEGMENTATION_CRITERIA:
+        raise ValueError('Unknown segmentation criterion %s, must be one of %s' %
+                         (criterion, SEGMENTATION_CRITERIA))
+
+    dends_nsegs = []
+    for cable, relative_locations in zip(new_cable_properties, relative_locations_per_cable):
+        for nseg in range(1, MAX_NSEG_FOR_SEGMENTATION_TOLERANCE + 1):
+            if criterion == 'impedance':
+                error = segmentation_impedance_error(cable, nseg, relative_locations, frequencies)
+            else:
+                error = segmentation_displacement(cable, nseg, relative_locations)
+            if error <= tolerance:
+                break
+        else:
+            logger.warning('the segmentation error of a reduced cable is %g with %d segments, '
+                           'above the tolerance %g', error, nseg, tolerance)
+        logger.debug('a reduced cable of L=%.3f lambda is divided into %d segments (error %g)',
+                     cable.electrotonic_length, nseg, error)
+        dends_nsegs.append(nseg)
+    return dends_nsegs
+
+
 def mark_subtree_sections_with_subtree_index(sections_to_delete,
                                              section_per_subtree_index,
                                              root_sec_of_subtree,
@@ -191,6 +251,7 @@ def find_and_disconnect_axon(soma_ref):
             sec.push()
             h.disconnect()
             h.define_shape()
+            instrumentation.count('hoc_calls', 2)
 
     if soma_ref.has_parent():
         name = soma_ref.parent().sec.hname().lower()
@@ -200,6 +261,7 @@ def find_and_disconnect_axon(soma_ref):
             soma_axon_x = None
             soma_ref.push()
             h.disconnect()
+            instrumentation.count('hoc_calls')
         else:
             raise Exception('Soma has a parent which is not an axon')
 
@@ -209,6 +271,30 @@ def find_and_disconnect_axon(soma_ref):
     return axon_section, axon_parent, soma_axon_x
 
 
+def get_segment_mech_vals(seg):
+    '''returns a dictionary of {mech_name: {param_name: value}} for all the mechanisms in `seg`
+
+    param_name is the name under which the value can be read from (or set on)
+    the segment, i.e. suffixed with the mechanism name unless it is an ion
+    '''
+    mech_vals = {}
+    for mech in seg:
+        mech_name = mech.name()
+        mech_vals[mech_name] = {}
+        for n in dir(mech):
+            if n.startswith('__') or n in ('next', 'name', 'is_ion', 'segment', ):
+                continue
+
+            if callable(getattr(mech, n)):  # FUNCTION/PROCEDUREs exposed by newer NEURONs
+                continue
+
+            if not n.endswith('_' + mech_name) and not mech_name.endswith('_ion'):
+                n += '_' + mech_name
+
+            mech_vals[mech_name][n] = getattr(seg, n)
+    return mech_vals
+
+
 def create_segments_to_mech_vals(sections_to_delete,
                                  remove_mechs=True,
                                  exclude=EXCLUDE_MECHANISMS):
@@ -225,19 +311,10 @@ def create_segments_to_mech_vals(sections_to_delete,
     segment_to_mech_vals, mech_names = {}, set()
 
     for seg in it.chain.from_iterable(sections_to_delete):
-        segment_to_mech_vals[seg] = {}
-        for mech in seg:
-            mech_name = mech.name()
-            segment_to_mech_vals[seg][mech_name] = {}
-            for n in dir(mech):
-                if n.startswith('__') or n in ('next', 'name', 'is_ion', 'segment', ):
-                    continue
-
-                if not n.endswith('_' + mech_name) and not mech_name.endswith('_ion'):
-                    n += '_' + mech_name
-
-                segment_to_mech_vals[seg][mech_name][n] = getattr(seg, n)
-                mech_names.add(mech_name)
+        segment_to_mech_vals[seg] = get_segment_mech_vals(seg)
+        mech_names.update(mech_name
+                          for mech_name, params in segment_to_mech_vals[seg].items()
+                          if params)
 
     mech_names -= exclude
 
@@ -246,23 +323,23 @@ def create_segments_to_mech_vals(sections_to_delete,
             with push_section(sec):
                 for mech in mech_names:
                     h("uninsert " + mech)
+                    instrumentation.count('hoc_calls')
 
     return segment_to_mech_vals
 
 
-def create_seg_to_seg(original_cell,
-                      section_per_subtree_index,
-                      roots_of_subtrees,
-                      mapping_sections_to_subtree_index,
-                      new_cable_properties,
+def create_seg_to_seg(segments_per_subtree,
+                      segments_xs,
                       has_apical,
                       apic,
                       basals,
-                      subtree_ind_to_q,
-                      mapping_type,
-                      reduction_frequency):
+                      mapping_type):
     '''create mapping between segments in the original model to segments in the reduced model
 
+       segments_per_subtree: {subtree_index: list of the segments of the subtree}
+       segments_xs: {subtree_index: list of the relative locations of these
+                    segments on the reduced cable} (see reduce_subtrees())
+
        if mapping_type == impedance the mapping will be a response to the
        transfer impedance of each segment to the soma (like the synapses)
 
@@ -277,40 +354,27 @@ def create_seg_to_seg(original_cell,
     # segments of the reduced model
     original_seg_to_reduced_seg = {}
     reduced_seg_to_original_seg = collections.defaultdict(list)
-    for subtree_index in section_per_subtree_index:
-        for sec in section_per_subtree_index[subtree_index]:
-            for seg in sec:
-                synapse_location = find_synapse_loc(seg, mapping_sections_to_subtree_index)
-                imp_obj, subtree_input_impedance = measure_input_impedance_of_subtree(
-                    roots_of_subtrees[subtree_index], reduction_frequency)
-
-                # if synapse is on the apical subtree
-                on_basal_subtree = not (has_apical and subtree_index == 0)
-
-                mid_of_segment_loc = reduce_synapse(
-                    original_cell,
-                    synapse_location,
-                    on_basal_subtree,
-                    imp_obj,
-                    subtree_input_impedance,
-                    new_cable_properties[subtree_index].electrotonic_length,
-                    subtree_ind_to_q[subtree_index])
-
-                if on_basal_subtree:
-                    if has_apical:
-                        new_section_for_synapse = basals[subtree_index - 1]
-                    else:
-                        new_section_for_synapse = basals[subtree_index]
-                else:
-                    new_section_for_synapse = apic
-
-                reduced_seg = new_section_for_synapse(mid_of_segment_loc)
-                original_seg_to_reduced_seg[seg] = reduced_seg
-                reduced_seg_to_original_seg[reduced_seg].append(seg)
+    for subtree_index in segments_per_subtree:
+        new_section_for_segments = section_of_subtree(subtree_index, has_apical, apic, basals)
+        for seg, mid_of_segment_loc in zip(segments_per_subtree[subtree_index],
+                                           segments_xs[subtree_index]):
+            reduced_seg = new_section_for_segments(mid_of_segment_loc)
+            original_seg_to_reduced_seg[seg] = reduced_seg
+            reduced_seg_to_original_seg[reduced_seg].append(seg)
 
     return original_seg_to_reduced_seg, dict(reduced_seg_to_original_seg)
 
 
+def section_of_subtree(subtree_index, has_apical, apic, basals):
+    '''returns the reduced cable (section) of the subtree'''
+    on_basal_subtree = not (has_apical and subtree_index == 0)
+    if not on_basal_subtree:
+        return apic
+    if has_apical:
+        return basals[subtree_index - 1]
+    return basals[subtree_index]
+
+
 def copy_dendritic_mech(original_seg_to_reduced_seg,
                         reduced_seg_to_original_seg,
                         apic,
@@ -362,6 +426,7 @@ def handle_orphan_segments(original_seg_to_reduced_seg,
     # Get all reduced segments that have been mapped by a original model segment
     all_mapped_control_segments = original_seg_to_reduced_seg.values()
     non_mapped_segments = set(all_segments) - set(all_mapped_control_segments)
+    instrumentation.count('orphan_segments', len(non_mapped_segments))
 
     for reduced_seg in non_mapped_segments:
         seg_secs = list(reduced_seg.sec)
@@ -447,12 +512,12 @@ def type_of_point_process(PP):
     return s[:ix]
 
 
-def apply_params_to_section(name, type_of_sectionlist, instance_as_str, section, cable_params, nseg):
+def apply_params_to_section(name, type_of_sectionlist, instance, section, cable_params, nseg):
     section.L = cable_params.length
     section.diam = cable_params.diam
     section.nseg = nseg
 
-    append_to_section_lists(name, type_of_sectionlist, instance_as_str)
+    append_to_section_lists(name, type_of_sectionlist, instance)
 
     section.insert('pas')
     section.cm = cable_params.cm
@@ -461,16 +526,6 @@ def apply_params_to_section(name, type_of_sectionlist, instance_as_str, section,
     section.e_pas = cable_params.e_pas
 
 
-def calculate_subtree_q(root, reduction_frequency):
-    rm = 1.0 / root.g_pas
-    rc = rm * (float(root.cm) / 1000000)
-    angular_freq = 2 * math.pi * reduction_frequency
-    q_imaginary = angular_freq * rc
-    q_subtree = complex(1, q_imaginary)   # q=1+iwRC
-    q_subtree = cmath.sqrt(q_subtree)
-    return q_subtree
-
-
 def synapse_properties_match(synapse, PP, PP_params_dict):
     if PP.hname()[:PP.hname().rindex('[')] != synapse.hname()[:synapse.hname().rindex('[')]:
         return False
@@ -482,12 +537,24 @@ def synapse_properties_match(synapse, PP, PP_params_dict):
     return True
 
 
-def load_model(model_filename):
-    model_obj_name = model_filename.split(".")[0].split('/')[-1]
+def template_name(model_filename):
+    '''the name of the template of a model file (ie: model for path/model.hoc)'''
+    return os.path.basename(model_filename).split(".")[0]
+
+
+def load_model(model_filename=None):
+    '''loads the template of the model file, returns its name
+
+    model_filename: None for the default template of the reduced cells
+                    (DEFAULT_TEMPLATE_NAME, that model files can't clash with)
+    '''
+    if model_filename is None:
+        model_obj_name = DEFAULT_TEMPLATE_NAME
+    else:
+        model_obj_name = template_name(model_filename)
     if h.name_declared(model_obj_name) == 0:
         logger.debug("loading template '%s'" % model_obj_name)
-        if model_filename == 'model.hoc':
-            logger.debug("loading default reduced model")
+        if model_filename is None:
             load_default_model()
         else:
             h.load_file(model_filename)
@@ -567,22 +634,22 @@ def create_reduced_cell(soma_cable,
                         new_cable_properties,
                         new_cables_nsegs,
                         subtrees_xs):
-    h("objref reduced_cell")
-    h("reduced_cell = new " + model_obj_name + "()")
+    # the instance is not bound to a global hoc name, so that many cells can be reduced
+    reduced_cell = getattr(h, model_obj_name)()
 
-    create_sections_in_hoc("soma", 1, "reduced_cell")
+    create_sections_in_hoc("soma", 1, reduced_cell)
 
     soma = original_cell.soma[0] if original_cell.soma.hname()[-1] == ']' else original_cell.soma
-    append_to_section_lists("soma[0]", "somatic", "reduced_cell")
+    append_to_section_lists("soma[0]", "somatic", reduced_cell)
 
     if has_apical:  # creates reduced apical cable if apical subtree existed
-        create_sections_in_hoc("apic", 1, "reduced_cell")
-        apic = h.reduced_cell.apic[0]
+        create_sections_in_hoc("apic", 1, reduced_cell)
+        apic = reduced_cell.apic[0]
         num_of_basal_subtrees = len(new_cable_properties) - 1
 
         cable_params = new_cable_properties[0]
         nseg = new_cables_nsegs[0]
-        apply_params_to_section("apic[0]", "apical", "reduced_cell",
+        apply_params_to_section("apic[0]", "apical", reduced_cell,
                                 apic, cable_params, nseg)
         apic.connect(soma, subtrees_xs[0], 0)
     else:
@@ -590,8 +657,8 @@ def create_reduced_cell(soma_cable,
         num_of_basal_subtrees = len(new_cable_properties)
 
     # creates reduced basal cables
-    create_sections_in_hoc("dend", num_of_basal_subtrees, "reduced_cell")
-    basals = [h.reduced_cell.dend[i] for i in range(num_of_basal_subtrees)]
+    create_sections_in_hoc("dend", num_of_basal_subtrees, reduced_cell)
+    basals = [reduced_cell.dend[i] for i in range(num_of_basal_subtrees)]
 
     for i in range(num_of_basal_subtrees):
         if has_apical:
@@ -602,36 +669,32 @@ def create_reduced_cell(soma_cable,
         cable_params = new_cable_properties[index_in_reduced_cables_dimensions]
         nseg = new_cables_nsegs[index_in_reduced_cables_dimensions]
 
-        apply_params_to_section("dend[" + str(i) + "]", "basal", "reduced_cell",
+        apply_params_to_section("dend[" + str(i) + "]", "basal", reduced_cell,
                                 basals[i], cable_params, nseg)
 
         basals[i].connect(soma, subtrees_xs[index_in_reduced_cables_dimensions], 0)
 
     # create cell python template
-    cell = Neuron(h.reduced_cell)
+    cell = Neuron(reduced_cell)
     cell.soma = original_cell.soma
     cell.apic = apic
 
     return cell, basals
 
 
-def merge_and_add_synapses(num_of_subtrees,
-                           new_cable_properties,
-                           PP_params_dict,
-                           synapses_list,
-                           mapping_sections_to_subtree_index,
-                           netcons_list,
-                           has_apical,
-                           roots_of_subtrees,
-                           original_cell,
-                           basals,
-                           cell,
-                           reduction_frequency):
-    # dividing the original synapses into baskets, so that all synapses that are
-    # on the same subtree will be together in the same basket
+def sort_synapses_into_baskets(num_of_subtrees,
+                               synapses_list,
+                               netcons_list,
+                               mapping_sections_to_subtree_index):
+    '''dividing the original synapses into baskets, so that all synapses that are
+    on the same subtree will be together in the same basket
 
-    # a list of baskets of synapses, each basket in the list will hold the
-    # synapses of the subtree of the corresponding basket index
+    returns (baskets, soma_synapses_syn_to_netcon) where baskets is a list of
+    baskets of synapses, each basket in the list holds (synapse,
+    synapse_location, syn_index) of the subtree of the corresponding basket
+    index, and soma_synapses_syn_to_netcon maps the somatic synapses to their
+    netcons
+    '''
     baskets = [[] for _ in num_of_subtrees]
     soma_synapses_syn_to_netcon = {}
 
@@ -645,39 +708,160 @@ def merge_and_add_synapses(num_of_subtrees,
         else:
             baskets[synapse_location.subtree_index].append((synapse, synapse_location, syn_index))
 
+    return baskets, soma_synapses_syn_to_netcon
+
+
+def reduce_subtrees(roots_of_subtrees,
+                    num_of_subtrees,
+                    baskets,
+                    segments_per_subtree,
+                    reduction_frequency,
+                    executor=None):
+    '''reduces every subtree, and finds the new relative locations of its synapses and segments
+
+    The subtrees must be disconnected from the soma. All the values needed
+    from hoc are measured first (one impedance computation per subtree), then
+    the subtrees are reduced independently from each other, using
+    executor.map() if an executor is given (ie: a
+    concurrent.futures.ProcessPoolExecutor).
+
+    returns (new_cable_properties, synapses_xs, segments_xs) where
+      new_cable_properties is a list of the CableParams of the reduced cables
+      synapses_xs is a list (per subtree) of the relative locations of the
+      synapses in the basket of the subtree on the reduced cable
+      segments_xs is a dictionary {subtree_index: list of the relative
+      locations of the segments of the subtree on the reduced cable}
+    '''
+    subtrees_arrays = []
+    for subtree_index in num_of_subtrees:
+        locations = [(synapse.get_segment().sec, synapse_location.x)
+                     for synapse, synapse_location, _ in baskets[subtree_index]]
+        locations.extend((seg.sec, seg.x) for seg in segments_per_subtree.get(subtree_index, []))
+        subtrees_arrays.append(extract_subtree_arrays(roots_of_subtrees[subtree_index],
+                                                      reduction_frequency,
+                                                      locations))
+
+    if executor is None:
+        subtrees_reductions = [reduce_subtree_arrays(arrays) for arrays in subtrees_arrays]
+    else:
+        subtrees_reductions = list(executor.map(reduce_subtree_arrays, subtrees_arrays))
+
+    new_cable_properties, synapses_xs, segments_xs = [], [], {}
+    for subtree_index, reduction in zip(num_of_subtrees, subtrees_reductions):
+        n_synapses = len(baskets[subtree_index])
+        new_cable_properties.append(reduction.cable_params)
+        synapses_xs.append(reduction.relative_locations[:n_synapses])
+        segments_xs[subtree_index] = reduction.relative_locations[n_synapses:]
+
+    return new_cable_properties, synapses_xs, segments_xs
+
+
+def cluster_basal_subtrees(num_of_subtrees, has_apical, new_cable_properties, tolerance):
+    '''groups the basal subtrees whose reduced cables are electrically similar
+
+    Cables are similar if they have the same membrane and axial properties, and
+    their electrotonic lengths (so their attenuations) are within the relative
+    tolerance from the shortest cable of the group.  The apical subtree is not
+    grouped with other subtrees.
+
+    returns a list of clusters, each is a list of subtree indices
+    '''
+    basal_subtrees = num_of_subtrees[1:] if has_apical else num_of_subtrees
+    clusters = [[num_of_subtrees[0]]] if has_apical else []
+
+    subtrees_per_properties = collections.defaultdict(list)
+    for subtree_index in basal_subtrees:
+        cable = new_cable_properties[subtree_index]
+        subtrees_per_properties[(cable.cm, cable.rm, cable.ra, cable.e_pas)].append(subtree_index)
+
+    for subtree_indices in subtrees_per_properties.values():
+        subtree_indices.sort(key=lambda i: new_cable_properties[i].electrotonic_length)
+        cluster = []
+        for subtree_index in subtree_indices:
+            if cluster and (new_cable_properties[subtree_index].electrotonic_length >
+                            new_cable_properties[cluster[0]].electrotonic_length * (1 + tolerance)):
+                clusters.append(sorted(cluster))
+                cluster = []
+            cluster.append(subtree_index)
+        clusters.append(sorted(cluster))
+
+    return sorted(clusters)
+
+
+def merge_clustered_subtrees(clusters,
+                             new_cable_properties,
+                             baskets,
+                             synapses_xs,
+                             segments_per_subtree,
+                             segments_xs,
+                             subtrees_xs,
+                             reduction_frequency):
+    '''replaces the reduced cables of each cluster of subtrees by a single cable (see merge_cables())
+
+    The synapses and segments of the subtrees are moved to the locations on the
+    new cable with the same attenuation to the soma.  From here on, each cluster
+    is handled as a single subtree.
+
+    returns (num_of_subtrees, new_cable_properties, baskets, synapses_xs,
+    segments_per_subtree, segments_xs, subtrees_xs), indexed by clusters
+    '''
+    merged_cable_properties, merged_baskets, merged_synapses_xs, merged_subtrees_xs = [], [], [], []
+    merged_segments_per_subtree, merged_segments_xs = {}, {}
+    for cluster_index, cluster in enumerate(clusters):
+        cables = [new_cable_properties[subtree_index] for subtree_index in cluster]
+        merged_cable = merge_cables(cables, reduction_frequency) if len(cluster) > 1 else cables[0]
+
+        basket, cluster_synapses_xs, segments, cluster_segments_xs = [], [], [], []
+        for subtree_index, cable in zip(cluster, cables):
+            basket.extend(baskets[subtree_index])
+            cluster_synapses_xs.extend(relative_locations_on_merged_cable(
+                cable, merged_cable, synapses_xs[subtree_index], reduction_frequency))
+            segments.extend(segments_per_subtree.get(subtree_index, []))
+            cluster_segments_xs.extend(relative_locations_on_merged_cable(
+                cable, merged_cable, segments_xs[subtree_index], reduction_frequency))
+
+        merged_cable_properties.append(merged_cable)
+        merged_baskets.append(basket)
+        merged_synapses_xs.append(cluster_synapses_xs)
+        merged_segments_per_subtree[cluster_index] = segments
+        merged_segments_xs[cluster_index] = cluster_segments_xs
+        # the merged cable is connected where the first subtree of the cluster was
+        merged_subtrees_xs.append(subtrees_xs[cluster[0]])
+
+    return (list(range(len(clusters))),
+            merged_cable_properties,
+            merged_baskets,
+            merged_synapses_xs,
+            merged_segments_per_subtree,
+            merged_segments_xs,
+            merged_subtrees_xs)
+
+
+def merge_and_add_synapses(num_of_subtrees,
+                           baskets,
+                           synapses_xs,
+                           soma_synapses_syn_to_netcon,
+                           PP_params_dict,
+                           netcons_list,
+                           has_apical,
+                           basals,
+                           cell):
+    '''moves the synapses to their new locations on the reduced cell (see reduce_subtrees())
+
+    merging synapses of the same type that are mapped to the same segment
+    returns the new synapses list
+    '''
     # mapping (non-somatic) synapses to their new location on the reduced model
     # (the new location is the exact location of the middle of the segment they
     # were mapped to, in order to enable merging)
-    new_synapses_list, subtree_ind_to_q = [], {}
+    new_synapses_list = []
     for subtree_index in num_of_subtrees:
-        imp_obj, subtree_input_impedance = measure_input_impedance_of_subtree(
-            roots_of_subtrees[subtree_index], reduction_frequency)
-        subtree_ind_to_q[subtree_index] = calculate_subtree_q(
-            roots_of_subtrees[subtree_index], reduction_frequency)
-
-        # iterates over the synapses in the curr basket
-        for synapse, synapse_location, syn_index in baskets[subtree_index]:
-            on_basal_subtree = not (has_apical and subtree_index == 0)
-
-            # "reduces" the synapse - finds this synapse's new "merged"
-            # location on its corresponding reduced cable
-            x = reduce_synapse(original_cell,
-                               synapse_location,
-                               on_basal_subtree,
-                               imp_obj,
-                               subtree_input_impedance,
-                               new_cable_properties[subtree_index].electrotonic_length,
-                               subtree_ind_to_q[subtree_index])
-
-            # find the section of the synapse
-            if on_basal_subtree:
-                if has_apical:
-                    section_for_synapse = basals[subtree_index - 1]
-                else:
-                    section_for_synapse = basals[subtree_index]
-            else:
-                section_for_synapse = cell.apic
+        # find the section of the synapses
+        section_for_synapse = section_of_subtree(subtree_index, has_apical, cell.apic, basals)
 
+        # iterates over the synapses in the curr basket, and their new
+        # "merged" locations on the corresponding reduced cable
+        for (synapse, _, syn_index), x in zip(baskets[subtree_index], synapses_xs[subtree_index]):
             # go over all point processes in this segment and see whether one
             # of them has the same proporties of this synapse
             # If there's such a synapse link the original NetCon with this point processes
@@ -710,22 +894,30 @@ def merge_and_add_synapses(num_of_subtrees,
             new_synapses_list.append(synapse)
             synapses_per_seg[seg_pointer].append(synapse)
 
-    return new_synapses_list, subtree_ind_to_q
+    return new_synapses_list
+
 
 def textify_seg_to_seg(segs):
     '''convert segment dictionary to text'''
     ret = {str(k): str(v) for k, v in segs.items()}
     return ret
    
+@instrumentation.profiled
 def subtree_reductor(original_cell,
                      synapses_list,
                      netcons_list,
                      reduction_frequency,
-                     model_filename='model.hoc',
+                     model_filename=None,
                      total_segments_manual=-1,
                      PP_params_dict=None,
                      mapping_type='impedance',
-                     return_seg_to_seg=False
+                     return_seg_to_seg=False,
+                     subtree_executor=None,
+                     segmentation_tolerance=None,
+                     segmentation_criterion='impedance',
+                     subtree_clustering_tolerance=None,
+                     seg_to_seg=None,
+                     profile=None
                      ):
 
     '''
@@ -745,7 +937,8 @@ def subtree_reductor(original_cell,
 
 
 
-    model_filename : model.hoc  will use a default template
+    model_filename : the hoc file of the template of the reduced cell, None for the default
+                     template (DEFAULT_TEMPLATE_NAME)
     total_segments_manual: sets the number of segments in the reduced model
                            can be either -1, a float between 0 to 1, or an int
                            if total_segments_manual = -1 will do automatic segmentation
@@ -757,8 +950,33 @@ def subtree_reductor(original_cell,
                            will set the number of segments in the reduced model to:
                            original_number_of_segments*total_segments_manual
     return_seg_to_seg: if True the function will also return a textify version of the mapping
-                       between the original segments to the reduced segments 
-
+                       between the original segments to the reduced segments, if 'arrays'
+                       the mapping as a segment_mapping.SegmentMapping of arrays
+    subtree_executor: an optional executor (ie: concurrent.futures.ProcessPoolExecutor)
+                      used to reduce the subtrees concurrently, once everything that is
+                      needed was measured in hoc. Since the reduction itself is pure
+                      python, a process pool is needed to gain from it (threads are
+                      limited by the GIL)
+    segmentation_tolerance: if given, each reduced cable gets the minimal number of
+                            segments whose error is within this tolerance (instead of
+                            total_segments_manual), see calculate_nsegs_from_tolerance()
+    segmentation_criterion: the error bounded by segmentation_tolerance, either
+                            'impedance' (the relative error of the input impedance and the
+                            transfer impedances to the soma from the segments of the synapses
+                            and the original segments, at 0 Hz and the reduction_frequency) or
+                            'displacement' (the distance, in space constants, that a synapse
+                            is moved when merged)
+    subtree_clustering_tolerance: if given, basal subtrees whose reduced cables have the
+                                  same membrane and axial properties, and electrotonic
+                                  lengths within this relative tolerance (ie: 0.1), are
+                                  reduced into a single cable (see cluster_basal_subtrees()
+                                  and merge_clustered_subtrees())
+    seg_to_seg: an optional dictionary, that receives the mapping of the names of the original
+                segments (str(seg)) to the reduced segments (the segment objects, unlike
+                the textified mapping of return_seg_to_seg), see incremental.py
+    profile: an optional instrumentation.ReductionProfile, that receives the time of each
+             stage of the reduction, counters (ie: of Impedance computations and of merged
+             synapses) and the peak memory
 
     Returns the new reduced cell, a list of the new synapses, and the list of
     the inputted netcons which now have connections with the new synapses.
@@ -773,6 +991,8 @@ def subtree_reductor(original_cell,
     original synapse's NetStim with
     the reduced synapse.
     '''
+    instrumentation.start_stage('initialization')
+    initialize_hoc()
     if PP_params_dict is None:
         PP_params_dict = {}
 
@@ -789,6 +1009,7 @@ def subtree_reductor(original_cell,
 
     has_apical = len(list(original_cell.apical)) != 0
 
+    instrumentation.start_stage('axon_detach')
     soma_ref = h.SectionRef(sec=soma)
     axon_section, axon_is_parent, soma_axon_x = find_and_disconnect_axon(soma_ref)
     roots_of_subtrees, num_of_subtrees = gather_subtrees(soma_ref)
@@ -799,19 +1020,63 @@ def subtree_reductor(original_cell,
     # preparing for reduction
 
     # remove active conductances and get seg_to_mech dictionary
+    instrumentation.start_stage('mechanism_snapshot')
     segment_to_mech_vals = create_segments_to_mech_vals(sections_to_delete)
 
     # disconnects all the subtrees from the soma
+    instrumentation.start_stage('subtree_reduction')
     subtrees_xs = []
     for subtree_root in roots_of_subtrees:
         subtrees_xs.append(subtree_root.parentseg().x)
         h.disconnect(sec=subtree_root)
+        instrumentation.count('hoc_calls')
 
-    # reducing the subtrees
-    new_cable_properties = [reduce_subtree(roots_of_subtrees[i], reduction_frequency)
-                            for i in num_of_subtrees]
-
-    if total_segments_manual > 1:
+    baskets, soma_synapses_syn_to_netcon = sort_synapses_into_baskets(
+        num_of_subtrees,
+        synapses_list,
+        netcons_list,
+        mapping_sections_to_subtree_index)
+
+    segments_per_subtree = {subtree_index: list(it.chain.from_iterable(sections))
+                            for subtree_index, sections in section_per_subtree_index.items()}
+
+    # reducing the subtrees, and mapping their synapses and segments
+    new_cable_properties, synapses_xs, segments_xs = reduce_subtrees(roots_of_subtrees,
+                                                                     num_of_subtrees,
+                                                                     baskets,
+                                                                     segments_per_subtree,
+                                                                     reduction_frequency,
+                                                                     subtree_executor)
+
+    if subtree_clustering_tolerance is not None:
+        clusters = cluster_basal_subtrees(num_of_subtrees,
+                                          has_apical,
+                                          new_cable_properties,
+                                          subtree_clustering_tolerance)
+        logger.debug('%d subtrees are clustered into %d cables', len(num_of_subtrees), len(clusters))
+        (num_of_subtrees, new_cable_properties, baskets, synapses_xs,
+         segments_per_subtree, segments_xs, subtrees_xs) = merge_clustered_subtrees(
+             clusters,
+             new_cable_properties,
+             baskets,
+             synapses_xs,
+             segments_per_subtree,
+             segments_xs,
+             subtrees_xs,
+             reduction_frequency)
+
+    if segmentation_tolerance is not None:
+        if total_segments_manual != -1:
+            logger.warning('total_segments_manual is ignored, since segmentation_tolerance is given')
+        relative_locations_per_cable = [list(subtree_synapses_xs) + list(segments_xs[subtree_index])
+                                        for subtree_index, subtree_synapses_xs
+                                        in zip(num_of_subtrees, synapses_xs)]
+        new_cables_nsegs = calculate_nsegs_from_tolerance(new_cable_properties,
+                                                          relative_locations_per_cable,
+                                                          segmentation_tolerance,
+                                                          segmentation_criterion,
+                                                          sorted({0, reduction_frequency}))
+    elif total_segments_manual > 1:
         new_cables_nsegs = calculate_nsegs_from_manual_arg(new_cable_properties,
                                                            total_segments_manual)
     else:
@@ -832,6 +1097,7 @@ def subtree_reductor(original_cell,
                 new_cables_nsegs = calculate_nsegs_from_manual_arg(new_cable_properties,
                                                                    min_reduced_seg_n)
 
+    instrumentation.start_stage('cell_creation')
     cell, basals = create_reduced_cell(soma_cable,
                                        has_apical,
                                        original_cell,
@@ -840,35 +1106,34 @@ def subtree_reductor(original_cell,
                                        new_cables_nsegs,
                                        subtrees_xs)
 
-    new_synapses_list, subtree_ind_to_q = merge_and_add_synapses(
-        num_of_subtrees,
-        new_cable_properties,
-        PP_params_dict,
-        synapses_list,
-        mapping_sections_to_subtree_index,
-        netcons_list,
-        has_apical,
-        roots_of_subtrees,
-        original_cell,
-        basals,
-        cell,
-        reduction_frequency)
+    instrumentation.start_stage('synapse_merge')
+    new_synapses_list = merge_and_add_synapses(num_of_subtrees,
+                                               baskets,
+                                               synapses_xs,
+                                               soma_synapses_syn_to_netcon,
+                                               PP_params_dict,
+                                               netcons_list,
+                                               has_apical,
+                                               basals,
+                                               cell)
+    instrumentation.count('synapses_placed', len(new_synapses_list))
+    instrumentation.count('synapses_merged', len(synapses_list) - len(new_synapses_list))
 
     # create segment to segment mapping
+    instrumentation.start_stage('segment_mapping')
     original_seg_to_reduced_seg, reduced_seg_to_original_seg = create_seg_to_seg(
-        original_cell,
-        section_per_subtree_index,
-        roots_of_subtrees,
-        mapping_sections_to_subtree_index,
-        new_cable_properties,
+        segments_per_subtree,
+        segments_xs,
         has_apical,
         cell.apic,
         basals,
-        subtree_ind_to_q,
-        mapping_type,
-        reduction_frequency)
+        mapping_type)
+    if seg_to_seg is not None:
+        seg_to_seg.update((str(seg), reduced_seg)
+                          for seg, reduced_seg in original_seg_to_reduced_seg.items())
 
     # copy active mechanisms
+    instrumentation.start_stage('mechanism_copy')
     copy_dendritic_mech(original_seg_to_reduced_seg,
                         reduced_seg_to_original_seg,
                         cell.apic,
@@ -876,10 +1141,14 @@ def subtree_reductor(original_cell,
                         segment_to_mech_vals,
                         mapping_type)
     
-    if return_seg_to_seg:
-        original_seg_to_reduced_seg_text = textify_seg_to_seg(original_seg_to_reduced_seg)
+    if return_seg_to_seg == 'arrays':
+        reduced_cables = ([cell.apic] if has_apical else []) + basals
+        returned_seg_to_seg = segment_mapping_arrays(original_seg_to_reduced_seg, reduced_cables)
+    elif return_seg_to_seg:
+        returned_seg_to_seg = textify_seg_to_seg(original_seg_to_reduced_seg)
 
     # Connect axon back to the soma
+    instrumentation.start_stage('teardown')
     if len(axon_section) > 0:
         if axon_is_parent:
             soma.connect(axon_section[0])
@@ -890,14 +1159,16 @@ def subtree_reductor(original_cell,
     for section in sections_to_delete:
         with push_section(section):
             h.delete_section()
+    instrumentation.count('hoc_calls', len(sections_to_delete))
 
     cell.axon = axon_section
     cell.dend = cell.hoc_model.dend
 
     with push_section(cell.hoc_model.soma[0]):
         h.delete_section()
+    instrumentation.count('hoc_calls')
     if return_seg_to_seg:
-        return cell, new_synapses_list, netcons_list, original_seg_to_reduced_seg_text
+        return cell, new_synapses_list, netcons_list, returned_seg_to_seg
     else:
         return cell, new_synapses_list, netcons_list
 
@@ -910,10 +1181,11 @@ class Neuron(object):
         self.dend = None
         self.apic = None
         self.axon = None
+        self.all = None
 
 
 def load_default_model():
-    h('''begintemplate model
+    h('''begintemplate %s
 
 public init, biophys, geom_nseg, delete_axon, finish_creating_model_after_loading_morphology
 
@@ -997,4 +1269,4 @@ proc complete_full_model_creation() {
     biophys()			             // increases cell dimensions to account for spines
 }
 
-endtemplate model''')
+endtemplate %s''' % (DEFAULT_TEMPLATE_NAME, DEFAULT_TEMPLATE_NAME))
@@ -0,0 +1,270 @@
+'''
+Reading synapse location files and creating synapses on a cell
+
+A synapse locations file holds a line per synapse:
+    [<section type>,<section number>,<x>]
+or
+    [<section type>,<section number>,<x>,<synapse class>]
+where section type is one of apical, basal or somatic (see example in
+tests/TestsFiles/Test_1/origRandomSynapses-10000).
+
+Synapses without a class are randomly classified as excitatory or inhibitory
+(the same way it is done in tests/test_script_helper.py)
+
+The binary format is an (uncompressed) .npz file, with a column per field:
+    types: int8, index of LOCATION_TYPES
+    section_nums: int32
+    xs: float64
+    synapse_classes: int8, index of synapse_class_names, -1 if not given
+    synapse_class_names: str
+It is loaded as a SynapseLocationArrays by load_synapse_location_arrays(),
+without parsing every line, and create_synapses_from_arrays() creates the
+synapses section by section:
+    convert_synapse_locations('origRandomSynapses-10000')  # -> origRandomSynapses-10000.npz
+    arrays = load_synapse_location_arrays('origRandomSynapses-10000.npz')
+    synapses_list, netcons_list = create_synapses_from_arrays(cell, arrays)
+'''
+import collections
+import random
+
+import numpy as np
+from neuron import h
+
+SynapseFileLocation = collections.namedtuple('SynapseFileLocation',
+                                             'type, section_num, x, synapse_class')
+SynapseLocationArrays = collections.namedtuple('SynapseLocationArrays',
+                                               'types, section_nums, xs, synapse_classes, '
+                                               'synapse_class_names')
+
+# the types of the locations, the types of SynapseLocationArrays are indices of it
+LOCATION_TYPES = ('basal', 'apical', 'somatic', )
+NO_SYNAPSE_CLASS = -1
+BINARY_EXTENSION = '.npz'
+
+SYNAPSE_CLASSES = {'excitatory': {'e': 0,  # mV
+                                  'tau1': 0.3,  # ms (like AMPA)
+                                  'tau2': 1.8,  # ms (like AMPA)
+                                  'weight': 0.0008,  # gbar = 0.8 nS
+                                  },
+                   'inhibitory': {'e': -86,
+                                  'tau1': 1.,  # ms
+                                  'tau2': 8.,  # ms
+                                  'weight': 0.0008,
+                                  },
+                   }
+PERCENTAGE_OF_EXCITATORY_SYNAPSES = 85.
+SEED_FOR_RANDOM_SYNAPSE_CLASSIFICATION = 1
+
+
+def read_synapse_locations(synapse_file):
+    '''returns a list of SynapseFileLocation, from the given synapse locations file
+
+    the file is either a text file, or a binary file (see load_synapse_location_arrays())
+    '''
+    if synapse_file.endswith(BINARY_EXTENSION):
+        return arrays_to_locations(load_synapse_location_arrays(synapse_file))
+
+    locations = []
+    with open(synapse_file) as fd:
+        for line in fd:
+            line = line.strip()
+            if not line:
+                continue
+
+            line_content = [v.strip() for v in line.strip("[,]").split(",")]
+            synapse_class = line_content[3] if len(line_content) > 3 else None
+            locations.append(SynapseFileLocation(line_content[0],
+                                                 int(line_content[1]),
+                                                 float(line_content[2]),
+                                                 synapse_class))
+    return locations
+
+
+def locations_to_arrays(locations):
+    '''returns the SynapseLocationArrays of a list of SynapseFileLocation'''
+    synapse_class_names = sorted(set(location.synapse_class for location in locations
+                                     if location.synapse_class is not None))
+    class_ids = {name: i for i, name in enumerate(synapse_class_names)}
+    return SynapseLocationArrays(
+        types=np.array([LOCATION_TYPES.index(location.type) for location in locations],
+                       dtype=np.int8),
+        section_nums=np.array([location.section_num for location in locations], dtype=np.int32),
+        xs=np.array([location.x for location in locations], dtype=np.float64),
+        synapse_classes=np.array([class_ids.get(location.synapse_class, NO_SYNAPSE_CLASS)
+                                  for location in locations], dtype=np.int8),
+        synapse_class_names=synapse_class_names)
+
+
+def arrays_to_locations(arrays):
+    '''returns the list of SynapseFileLocation of a SynapseLocationArrays'''
+    synapse_class_names = list(arrays.synapse_class_names) + [None]  # -1 is None
+    return [SynapseFileLocation(LOCATION_TYPES[type_], section_num, x,
+                                synapse_class_names[synapse_class])
+            for type_, section_num, x, synapse_class in zip(arrays.types.tolist(),
+                                                            arrays.section_nums.tolist(),
+                                                            arrays.xs.tolist(),
+                                                            arrays.synapse_classes.tolist())]
+
+
+def write_synapse_location_arrays(synapse_file, arrays):
+    '''writes the SynapseLocationArrays to a binary synapse locations file'''
+    assert synapse_file.endswith(BINARY_EXTENSION), \
+        'binary synapse locations files are %s files' % BINARY_EXTENSION
+    assert len(arrays.types) == len(arrays.section_nums) == len(arrays.xs) == \
+        len(arrays.synapse_classes), 'the columns must have the same length'
+    np.savez(synapse_file,
+             types=np.asarray(arrays.types, dtype=np.int8),
+             section_nums=np.asarray(arrays.section_nums, dtype=np.int32),
+             xs=np.asarray(arrays.xs, dtype=np.float64),
+             synapse_classes=np.asarray(arrays.synapse_classes, dtype=np.int8),
+             synapse_class_names=np.array(arrays.synapse_class_names, dtype=np.str_))
+
+
+def load_synapse_location_arrays(synapse_file):
+    '''returns the SynapseLocationArrays of a synapse locations file
+
+    the file is either a binary file, or a text file (that is parsed)
+    '''
+    if not synapse_file.endswith(BINARY_EXTENSION):
+        return locations_to_arrays(read_synapse_locations(synapse_file))
+
+    with np.load(synapse_file, allow_pickle=False) as columns:
+        return SynapseLocationArrays(types=columns['types'],
+                                     section_nums=columns['section_nums'],
+                                     xs=columns['xs'],
+                                     synapse_classes=columns['synapse_classes'],
+                                     synapse_class_names=columns['synapse_class_names'].tolist())
+
+
+def convert_synapse_locations(text_file, binary_file=None):
+    '''converts a text synapse locations file to a binary one (by default, with a .npz extension)
+
+    returns the path of the binary file
+    '''
+    binary_file = binary_file or text_file + BINARY_EXTENSION
+    write_synapse_location_arrays(binary_file,
+                                  locations_to_arrays(read_synapse_locations(text_file)))
+    return binary_file
+
+
+def classify_synapses(locations,
+                      seed=SEED_FOR_RANDOM_SYNAPSE_CLASSIFICATION,
+                      percentage_of_excitatory_synapses=PERCENTAGE_OF_EXCITATORY_SYNAPSES):
+    '''returns the class of each location, randomly drawing one if it is not given'''
+    rand = random.Random(seed).random
+    classes = []
+    for location in locations:
+        # a number is drawn for every synapse, so that the classification does
+        # not depend on which of the synapses were given a class in the file
+        is_excitatory = rand() <= percentage_of_excitatory_synapses / 100.
+        if location.synapse_class is not None:
+            classes.append(location.synapse_class)
+        elif is_excitatory:
+            classes.append('excitatory')
+        else:
+            classes.append('inhibitory')
+    return classes
+
+
+def classify_synapse_arrays(arrays,
+                            seed=SEED_FOR_RANDOM_SYNAPSE_CLASSIFICATION,
+                            percentage_of_excitatory_synapses=PERCENTAGE_OF_EXCITATORY_SYNAPSES):
+    '''returns the class of each location of the SynapseLocationArrays
+
+    the same classes as classify_synapses() of the same locations
+    '''
+    rand = random.Random(seed).random
+    is_excitatory = np.array([rand() for _ in range(len(arrays.synapse_classes))]) <= \
+        percentage_of_excitatory_synapses / 100.
+    classes = np.where(is_excitatory, 'excitatory', 'inhibitory').astype(object)
+    given = arrays.synapse_classes != NO_SYNAPSE_CLASS
+    classes[given] = np.array(arrays.synapse_class_names, dtype=object)[
+        arrays.synapse_classes[given]]
+    return classes.tolist()
+
+
+def section_of_location(cell_instance, location):
+    '''returns the section of the cell that the location is on'''
+    if location.type == 'apical':
+        return cell_instance.apic[location.section_num]
+    elif location.type == 'somatic':
+        return cell_instance.soma[0]
+    # for synapses on basal subtrees
+    return cell_instance.dend[location.section_num]
+
+
+def _unique_sections_of_locations(cell_instance, arrays):
+    '''returns the sections of the SynapseLocationArrays, and the index of the section of
+    every location in them'''
+    keys = arrays.types.astype(np.int64) * 2 ** 32 + arrays.section_nums
+    unique_keys, inverse = np.unique(keys, return_inverse=True)
+    unique_sections = [section_of_location(cell_instance,
+                                           SynapseFileLocation(LOCATION_TYPES[key // 2 ** 32],
+                                                               key % 2 ** 32, None, None))
+                       for key in unique_keys.tolist()]
+    return unique_sections, inverse.ravel()
+
+
+def sections_of_locations(cell_instance, arrays):
+    '''returns the section of every location of the SynapseLocationArrays
+
+    every section is looked up once, for all of its locations
+    '''
+    unique_sections, inverse = _unique_sections_of_locations(cell_instance, arrays)
+    return [unique_sections[i] for i in inverse.tolist()]
+
+
+def create_synapses_from_arrays(cell_instance,
+                                arrays,
+                                synapse_classes=SYNAPSE_CLASSES,
+                                seed=SEED_FOR_RANDOM_SYNAPSE_CLASSIFICATION,
+                                sources=None):
+    '''creates an Exp2Syn, and a NetCon, for every location of the SynapseLocationArrays
+
+    every section is looked up once, and the synapses are created section by
+    section, on the segments of their sections, without pushing the sections on
+    the section stack
+
+    sources: optional list of the sources of the NetCons (ie: NetStims), one
+             per location, by default the NetCons have no source
+
+    Returns the synapses_list and the netcons_list, as expected by subtree_reductor(),
+    in the order of the locations
+    '''
+    if sources is None:
+        sources = [None] * len(arrays.xs)
+
+    unique_sections, section_indices = _unique_sections_of_locations(cell_instance, arrays)
+    xs = arrays.xs.tolist()
+    synapse_classes_list = classify_synapse_arrays(arrays, seed)
+
+    synapses_list, netcons_list = [None] * len(xs), [None] * len(xs)
+    # the locations of every section, one section after the other
+    for i in np.argsort(section_indices, kind='stable').tolist():
+        params = synapse_classes[synapse_classes_list[i]]
+
+        synapse = h.Exp2Syn(unique_sections[section_indices[i]](xs[i]))
+        synapse.e = params['e']
+        synapse.tau1 = params['tau1']
+        synapse.tau2 = params['tau2']
+        synapses_list[i] = synapse
+
+        netcon = h.NetCon(sources[i], synapse)
+        netcon.weight[0] = params['weight']
+        netcon.delay = 0
+        netcons_list[i] = netcon
+
+    return synapses_list, netcons_list
+
+
+def create_synapses_at_locations(cell_instance,
+                                 locations,
+                                 synapse_classes=SYNAPSE_CLASSES,
+                                 seed=SEED_FOR_RANDOM_SYNAPSE_CLASSIFICATION,
+                                 sources=None):
+    '''creates an Exp2Syn, and a NetCon, for every location (a list of SynapseFileLocation)
+
+    see create_synapses_from_arrays()
+    '''
+    return create_synapses_from_arrays(cell_instance, locations_to_arrays(locations),
+                                       synapse_classes, seed, sources)
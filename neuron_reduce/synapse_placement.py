@@ -0,0 +1,122 @@
+'''
+Placing random synapses on the dendrites of a cell, with numpy
+
+The dendritic segments of the cell are collected once (placement_segments()),
+then every segment is given a weight: its length, times the density of synapses
+at its path distance from the soma, times the weight of its section list.  The
+synapses are drawn with a single np.searchsorted over the cumulative weights,
+and uniformly within their segment, so placing 100k synapses takes
+milliseconds.
+
+usage:
+    segments = placement_segments(cell)
+    # twice as many synapses per um on the apical tree, growing with the distance
+    placement = place_synapses(segments, 100000,
+                               density=lambda distances: 1 + distances / 500.,
+                               weights={'apical': 2.}, seed=1)
+    synapses_list, netcons_list = create_synapses_from_arrays(
+        cell, placement_location_arrays(placement))
+'''
+import collections
+
+import numpy as np
+from neuron import h
+
+from .synapse_locations import (LOCATION_TYPES, NO_SYNAPSE_CLASS, SynapseFileLocation,
+                                SynapseLocationArrays)
+
+# section_types are indices of LOCATION_TYPES
+SECTION_LISTS = ('basal', 'apical', )
+
+PlacementSegments = collections.namedtuple('PlacementSegments',
+                                           'section_types, section_nums, x_starts, x_ends, '
+                                           'lengths, distances')
+SynapsePlacement = collections.namedtuple('SynapsePlacement', 'section_types, section_nums, xs')
+
+
+def placement_segments(cell, section_lists=SECTION_LISTS):
+    '''returns the PlacementSegments of the segments of the section lists of the cell
+
+    the distances are the path distances (um) of the centers of the segments
+    from the middle of the soma
+    '''
+    soma = cell.soma[0] if cell.soma.hname()[-1] == ']' else cell.soma
+    origin = soma(0.5)
+    section_types, section_nums, x_starts, x_ends, lengths, distances = [], [], [], [], [], []
+    for section_list in section_lists:
+        assert section_list in SECTION_LISTS, 'unknown section list %s' % section_list
+        section_type = LOCATION_TYPES.index(section_list)
+        for section_num, section in enumerate(getattr(cell, section_list)):
+            for i, seg in enumerate(section):
+                section_types.append(section_type)
+                section_nums.append(section_num)
+                x_starts.append(float(i) / section.nseg)
+                x_ends.append(float(i + 1) / section.nseg)
+                lengths.append(section.L / section.nseg)
+                distances.append(h.distance(origin, seg))
+
+    return PlacementSegments(section_types=np.array(section_types, dtype=np.int8),
+                             section_nums=np.array(section_nums, dtype=np.int32),
+                             x_starts=np.array(x_starts),
+                             x_ends=np.array(x_ends),
+                             lengths=np.array(lengths),
+                             distances=np.array(distances))
+
+
+def segment_weights(segments, density=None, weights=None):
+    '''returns the relative number of synapses of every segment
+
+    density: function of an array of path distances (um) from the soma, that
+             returns the (relative) number of synapses per um at these
+             distances, uniform by default
+    weights: {section list: weight} of the section lists, 1 if not given
+    '''
+    weights_per_segment = segments.lengths.copy()
+    if density is not None:
+        weights_per_segment *= np.broadcast_to(density(segments.distances), segments.lengths.shape)
+    for section_list, weight in (weights or {}).items():
+        assert section_list in SECTION_LISTS, 'unknown section list %s' % section_list
+        weights_per_segment[segments.section_types == LOCATION_TYPES.index(section_list)] *= weight
+
+    assert np.all(weights_per_segment >= 0), 'the density and weights must not be negative'
+    return weights_per_segment
+
+
+def place_synapses(segments, n_synapses, density=None, weights=None, seed=0):
+    '''returns the SynapsePlacement of n_synapses random synapses on the segments
+
+    density and weights: see segment_weights()
+    '''
+    cumulative_weights = np.cumsum(segment_weights(segments, density, weights))
+    assert len(cumulative_weights) and cumulative_weights[-1] > 0, 'no segment to place on'
+
+    draws = np.random.RandomState(seed).uniform(0, cumulative_weights[-1], n_synapses)
+    # side='right' never picks a segment of weight 0
+    indices = np.minimum(np.searchsorted(cumulative_weights, draws, side='right'),
+                         len(cumulative_weights) - 1)
+    # the position of the draw within the weight of its segment, is its position in the segment
+    own_weights = np.diff(cumulative_weights, prepend=0.)[indices]
+    fractions = np.clip((draws - cumulative_weights[indices] + own_weights) /
+                        own_weights, 0., 1.)
+    x_starts = segments.x_starts[indices]
+    return SynapsePlacement(section_types=segments.section_types[indices],
+                            section_nums=segments.section_nums[indices],
+                            xs=x_starts + fractions * (segments.x_ends[indices] - x_starts))
+
+
+def placement_locations(placement):
+    '''returns the list of SynapseFileLocation of the placement (without synapse class)'''
+    return [SynapseFileLocation(LOCATION_TYPES[section_type], section_num, x, None)
+            for section_type, section_num, x in zip(placement.section_types.tolist(),
+                                                    placement.section_nums.tolist(),
+                                                    placement.xs.tolist())]
+
+
+def placement_location_arrays(placement):
+    '''returns the SynapseLocationArrays of the placement (without synapse classes)'''
+    return SynapseLocationArrays(types=placement.section_types,
+                                 section_nums=placement.section_nums,
+                                 xs=placement.xs,
+                                 synapse_classes=np.full(len(placement.xs), NO_SYNAPSE_CLASS,
+                                                         dtype=np.int8),
+                                 synapse_class_names=[])
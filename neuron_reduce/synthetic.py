@@ -0,0 +1,150 @@
+'''
+Synthetic cells, to measure how the reduction scales
+
+create_synthetic_cell() instantiates a cell (from the default model template,
+see subtree_reductor_func.load_default_model()) whose soma has n_trees basal
+trees, and optionally an apical tree, every tree is a full tree of the given
+depth where every section has `branching` children.  The diameters of the
+children follow Rall's 3/2 power rule, and every section has the same length
+and nseg.  The dendrites have either only a passive membrane, or hh at a
+uniform density or at a density that grows with the distance from the soma.
+
+usage:
+    spec = SyntheticCellSpec(n_trees=4, branching=2, depth=6, nseg=5, density='graded',
+                             n_synapses=10000)
+    cell, synapses_list, netcons_list = create_synthetic_cell_with_synapses(spec)
+    reduced_cell, synapses_list, netcons_list = subtree_reductor(cell, synapses_list,
+                                                                 netcons_list, 38)
+'''
+import collections
+
+from neuron import h
+
+from .subtree_reductor_func import append_to_section_lists, create_sections_in_hoc, load_model
+from .synapse_locations import create_synapses_at_locations
+from .synapse_placement import place_synapses, placement_locations, placement_segments
+
+SyntheticCellSpec = collections.namedtuple('SyntheticCellSpec',
+                                           'n_trees, has_apical, branching, depth, length, '
+                                           'soma_diam, root_diam, nseg, density, n_synapses, seed')
+SyntheticCellSpec.__new__.__defaults__ = (4,  # n_trees
+                                          True,  # has_apical
+                                          2,  # branching
+                                          4,  # depth
+                                          100.,  # length, um
+                                          20.,  # soma_diam, um
+                                          2.,  # root_diam, um
+                                          5,  # nseg
+                                          'passive',  # density
+                                          1000,  # n_synapses
+                                          0,  # seed
+                                          )
+
+DENSITIES = ('passive', 'uniform', 'graded', )
+# of the graded hh density, the relative increase per um from the soma
+DENSITY_GRADIENT = 0.002
+
+RA = 100.  # ohm cm
+PASSIVE_PARAMS = {'cm': 1.,  # uF/cm2
+                  'g_pas': 1. / 20000,  # S/cm2
+                  'e_pas': -70.,  # mV
+                  }
+HH_PARAMS = {'gnabar_hh': 0.12,  # S/cm2
+             'gkbar_hh': 0.036,
+             'gl_hh': 0.0003,
+             }
+
+
+def sections_per_tree(branching, depth):
+    '''the number of sections of a full tree'''
+    return sum(branching ** level for level in range(depth))
+
+
+def _create_tree(cell, section_type, sectionlist_type, n_trees, spec):
+    '''creates the sections of n_trees trees, in the section array section_type of the cell
+
+    returns the list of the root sections
+    '''
+    n_sections = n_trees * sections_per_tree(spec.branching, spec.depth)
+    create_sections_in_hoc(section_type, n_sections, cell)
+    sections = getattr(cell, section_type)
+
+    roots, index = [], 0
+    for _ in range(n_trees):
+        parents = [None]
+        for level in range(spec.depth):
+            diam = spec.root_diam / spec.branching ** (2. / 3 * level)
+            children = []
+            for parent in parents:
+                for _ in range(1 if parent is None else spec.branching):
+                    section = sections[index]
+                    append_to_section_lists('%s[%d]' % (section_type, index),
+                                            sectionlist_type,
+                                            cell)
+                    section.L, section.diam, section.nseg = spec.length, diam, spec.nseg
+                    if parent is None:
+                        roots.append(section)
+                    else:
+                        section.connect(parent(1), 0)
+                    children.append(section)
+                    index += 1
+            parents = children
+    return roots
+
+
+def _insert_mechanisms(cell, soma, density):
+    '''inserts the passive membrane in all the sections, and hh according to the density'''
+    assert density in DENSITIES, 'density must be one of %s' % (DENSITIES, )
+    h.distance(0, 0.5, sec=soma)
+    for section in cell.all:
+        section.insert('pas')
+        section.Ra = RA
+        for seg in section:
+            for name, value in PASSIVE_PARAMS.items():
+                setattr(seg, name, value)
+
+        if density == 'passive' or section == soma:
+            continue
+        section.insert('hh')
+        for seg in section:
+            scale = 1.
+            if density == 'graded':
+                scale += DENSITY_GRADIENT * h.distance(seg.x, sec=section)
+            for name, value in HH_PARAMS.items():
+                setattr(seg, name, value * scale)
+
+
+def create_synthetic_cell(spec):
+    '''instantiates the synthetic cell of the SyntheticCellSpec'''
+    model_obj_name = load_model()
+    cell = getattr(h, model_obj_name)()
+
+    create_sections_in_hoc('soma', 1, cell)
+    append_to_section_lists('soma[0]', 'somatic', cell)
+    soma = cell.soma[0]
+    soma.L = soma.diam = spec.soma_diam
+
+    for root in _create_tree(cell, 'dend', 'basal', spec.n_trees, spec):
+        root.connect(soma(0.5), 0)
+    if spec.has_apical:
+        apical_root, = _create_tree(cell, 'apic', 'apical', 1, spec)
+        apical_root.connect(soma(1), 0)
+
+    _insert_mechanisms(cell, soma, spec.density)
+    return cell
+
+
+def random_synapse_locations(cell, n_synapses, seed=0):
+    '''returns n_synapses SynapseFileLocation, uniformly distributed over the dendritic length'''
+    return placement_locations(place_synapses(placement_segments(cell), n_synapses, seed=seed))
+
+
+def create_synthetic_cell_with_synapses(spec):
+    '''instantiates the synthetic cell, with spec.n_synapses random synapses
+
+    Returns the cell, synapses_list and netcons_list (see create_synapses_at_locations())
+    '''
+    cell = create_synthetic_cell(spec)
+    locations = random_synapse_locations(cell, spec.n_synapses, spec.seed)
+    synapses_list, netcons_list = create_synapses_at_locations(cell, locations, seed=spec.seed)
+    return cell, synapses_list, netcons_list
@@ -0,0 +1,229 @@
+'''
+Validating a reduction by simulating the full and the reduced cell with many seeds
+
+Every worker process builds, once, the full cell and a reduced copy of it,
+with a NetStim per synapse location driving the synapse on both cells. The
+seeds of the synaptic activity are then divided between the workers; for each
+seed, both cells are simulated together and the somatic voltage and spikes of
+the reduced cell are compared to the ones of the full cell.
+
+usage:
+    job = ReductionJob(name='L5PC', ..., synapse_file='synapses.txt')
+    report = validate_reduction(job, seeds=range(20), workers=8,
+                                mechanisms=['x86_64/libnrnmech.so'])
+    print(report.summary['mean_rmsd'], report.summary['mean_spike_coincidence'])
+'''
+import collections
+import concurrent.futures
+import logging
+import multiprocessing
+import traceback
+
+import numpy as np
+from neuron import h
+
+from .batch import create_cell, load_mechanisms
+from .parallel_network import SPIKE_THRESHOLD
+from .subtree_reductor_func import initialize_hoc, subtree_reductor
+from .synapse_locations import (classify_synapses, create_synapses_at_locations,
+                                read_synapse_locations)
+
+logger = logging.getLogger(__name__)
+
+# the activity of the NetStim of each synapse class (like in tests/test_script_helper.py)
+Stimulus = collections.namedtuple('Stimulus', 'interval, number, start, noise')
+STIMULI = {'excitatory': Stimulus(interval=1000.,  # ms
+                                  number=15,
+                                  start=10.,  # ms
+                                  noise=1.),
+           'inhibitory': Stimulus(interval=100.,
+                                  number=150,
+                                  start=10.,
+                                  noise=1.),
+           }
+
+SPIKE_COINCIDENCE_WINDOW = 5.  # ms
+
+ValidationModels = collections.namedtuple('ValidationModels',
+                                          'full_cell, reduced_cell, netstims, synapses, netcons')
+SeedResult = collections.namedtuple('SeedResult',
+                                    'seed, rmsd, n_spikes_full, n_spikes_reduced, '
+                                    'spike_coincidence, mean_spike_time_diff, error')
+ValidationReport = collections.namedtuple('ValidationReport', 'name, results, summary')
+
+
+def _soma(cell):
+    '''returns the soma section of the cell'''
+    return cell.soma[0] if cell.soma.hname()[-1] == ']' else cell.soma
+
+
+def build_validation_models(job, stimuli=STIMULI):
+    '''instantiates the full cell of the job, and a reduced copy of it
+
+    The synapses at the locations of job.synapse_file are created on both
+    cells, and the synapses at the same location are driven by the same
+    NetStim.  Returns ValidationModels.
+    '''
+    initialize_hoc()
+    h.celsius = job.celsius
+    locations = read_synapse_locations(job.synapse_file)
+
+    netstims = []
+    for synapse_class in classify_synapses(locations):
+        stimulus = stimuli[synapse_class]
+        netstim = h.NetStim()
+        netstim.interval = stimulus.interval
+        netstim.number = stimulus.number
+        netstim.start = stimulus.start
+        netstim.noise = stimulus.noise
+        netstims.append(netstim)
+
+    full_cell = create_cell(job)
+    full_synapses, full_netcons = create_synapses_at_locations(full_cell, locations,
+                                                               sources=netstims)
+
+    cell = create_cell(job)
+    synapses_list, netcons_list = create_synapses_at_locations(cell, locations, sources=netstims)
+    reduced_cell, synapses_list, netcons_list = subtree_reductor(
+        cell,
+        synapses_list,
+        netcons_list,
+        job.reduction_frequency,
+        total_segments_manual=job.total_segments_manual)
+
+    return ValidationModels(full_cell=full_cell,
+                            reduced_cell=reduced_cell,
+                            netstims=netstims,
+                            synapses=(full_synapses, synapses_list),
+                            netcons=(full_netcons, netcons_list))
+
+
+def spike_coincidence(reference_spike_times, spike_times, window=SPIKE_COINCIDENCE_WINDOW):
+    '''compares spike times to reference spike times
+
+    returns (the fraction of the reference spikes that have a spike within the
+    window, the mean time difference of these spikes to their closest spike),
+    (1, 0) if there are no spikes at all
+    '''
+    reference_spike_times = np.asarray(reference_spike_times, dtype=float)
+    spike_times = np.asarray(spike_times, dtype=float)
+    if not reference_spike_times.size:
+        return (1., 0.) if not spike_times.size else (0., np.nan)
+    if not spike_times.size:
+        return 0., np.nan
+
+    closest = np.abs(reference_spike_times[:, None] - spike_times[None, :]).min(axis=1)
+    coincident = closest <= window
+    mean_time_diff = np.mean(closest[coincident]) if coincident.any() else np.nan
+    return np.mean(coincident), mean_time_diff
+
+
+def run_seed(models, seed, tstop, dt=0.1):
+    '''simulates the ValidationModels with the synaptic activity of the seed, returns a SeedResult'''
+    initialize_hoc()
+    for i, netstim in enumerate(models.netstims):
+        netstim.noiseFromRandom123(i, seed, 0)
+
+    full_soma, reduced_soma = _soma(models.full_cell), _soma(models.reduced_cell)
+    recordings = []
+    for soma in (full_soma, reduced_soma):
+        v, spike_times = h.Vector(), h.Vector()
+        v.record(soma(0.5)._ref_v)
+        spike_detector = h.NetCon(soma(0.5)._ref_v, None, sec=soma)
+        spike_detector.threshold = SPIKE_THRESHOLD
+        spike_detector.record(spike_times)
+        recordings.append((v, spike_times, spike_detector))
+
+    h.steps_per_ms = 1. / dt
+    h.dt = dt
+    h.tstop = tstop
+    h.v_init = reduced_soma.e_pas
+    h.run()
+
+    (full_v, full_spikes, _), (reduced_v, reduced_spikes, _) = recordings
+    full_v, reduced_v = np.array(full_v), np.array(reduced_v)
+    coincidence, mean_spike_time_diff = spike_coincidence(full_spikes, reduced_spikes)
+    return SeedResult(seed=seed,
+                      rmsd=float(np.sqrt(np.mean((reduced_v - full_v) ** 2))),
+                      n_spikes_full=int(full_spikes.size()),
+                      n_spikes_reduced=int(reduced_spikes.size()),
+                      spike_coincidence=float(coincidence),
+                      mean_spike_time_diff=float(mean_spike_time_diff),
+                      error=None)
+
+
+def summarize_seeds(results):
+    '''returns a dictionary of the statistics of the SeedResults over the seeds that did not fail'''
+    succeeded = [result for result in results if result.error is None]
+    summary = {'n_seeds': len(results),
+               'n_failed': len(results) - len(succeeded),
+               }
+    if succeeded:
+        rmsd = np.array([result.rmsd for result in succeeded])
+        coincidence = np.array([result.spike_coincidence for result in succeeded])
+        spike_count_diff = np.array([result.n_spikes_reduced - result.n_spikes_full
+                                     for result in succeeded])
+        spike_time_diff = [result.mean_spike_time_diff for result in succeeded
+                           if np.isfinite(result.mean_spike_time_diff)]
+        summary.update({'mean_rmsd': float(np.mean(rmsd)),
+                        'std_rmsd': float(np.std(rmsd)),
+                        'max_rmsd': float(np.max(rmsd)),
+                        'mean_spike_coincidence': float(np.mean(coincidence)),
+                        'min_spike_coincidence': float(np.min(coincidence)),
+                        'mean_spike_count_diff': float(np.mean(spike_count_diff)),
+                        'mean_spike_time_diff': (float(np.mean(spike_time_diff))
+                                                 if spike_time_diff else np.nan),
+                        })
+    return summary
+
+
+_worker_models = None
+
+
+def _init_worker(job, mechanisms, stimuli):
+    '''builds the models of the job once per worker process'''
+    global _worker_models  # pylint: disable=global-statement
+    load_mechanisms(mechanisms)
+    _worker_models = build_validation_models(job, stimuli)
+
+
+def _run_seed(args):
+    '''runs a seed on the models of the worker, and isolates its failure'''
+    seed, tstop, dt = args
+    try:
+        return run_seed(_worker_models, seed, tstop, dt)
+    except Exception:  # pylint: disable=broad-except
+        error = traceback.format_exc()
+        logger.warning('seed %s failed:\n%s', seed, error)
+        return SeedResult(seed, None, None, None, None, None, error)
+
+
+def validate_reduction(job,
+                       seeds,
+                       tstop=1500,
+                       dt=0.1,
+                       workers=None,
+                       mechanisms=(),
+                       stimuli=STIMULI,
+                       mp_context='spawn'):
+    '''simulates the full and reduced cells of the job with every seed, in a pool of processes
+
+    job: a ReductionJob (see batch.py), with a synapse_file
+    seeds: the seeds of the synaptic activity
+    tstop, dt: of the simulations (in ms)
+    workers: number of worker processes, by default the number of cpus
+    mechanisms: paths of compiled mechanisms libraries, loaded by each worker
+    stimuli: {synapse class: Stimulus}, the activity of the NetStims
+
+    Returns a ValidationReport, with a SeedResult per seed (in the order of the
+    seeds) and the summary of summarize_seeds()
+    '''
+    seeds = list(seeds)
+    with concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context(mp_context),
+            initializer=_init_worker,
+            initargs=(job, list(mechanisms), stimuli)) as executor:
+        results = list(executor.map(_run_seed, [(seed, tstop, dt) for seed in seeds]))
+
+    return ValidationReport(job.name, results, summarize_seeds(results))
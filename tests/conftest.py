@@ -0,0 +1,58 @@
+'''Fixtures shared by the tests: the passive Test_1 cell, and the temperature of hh'''
+import os
+
+import pytest
+from neuron import h
+
+from neuron_reduce import ReductionJob
+from neuron_reduce.batch import _delete_new_sections, create_cell
+from neuron_reduce.synapse_locations import create_synapses_at_locations, read_synapse_locations
+
+TEST_1_PATH = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'TestsFiles', 'Test_1')
+TEST_1_JOB = ReductionJob(name='Test_1',
+                          model_file=os.path.join(TEST_1_PATH, 'model.hoc'),
+                          morphology_file=os.path.join(TEST_1_PATH,
+                                                       '2013_03_06_cell08_876_H41_05_Cell2.ASC'),
+                          create_type='basic',
+                          reduction_frequency=38,
+                          synapse_file=os.path.join(TEST_1_PATH, 'origRandomSynapses-10000'))
+HH_CELSIUS = 6.3  # the temperature hh is defined at
+
+
+@pytest.fixture
+def passive_job():
+    '''the ReductionJob of the passive cell of Test_1, with its 10000 synapses'''
+    return TEST_1_JOB
+
+
+@pytest.fixture
+def hh_celsius():
+    '''sets h.celsius to the temperature hh is defined at, restores it after the test'''
+    previous_celsius = h.celsius
+    h.celsius = HH_CELSIUS
+    yield HH_CELSIUS
+    h.celsius = previous_celsius
+
+
+@pytest.fixture
+def new_sections_deleted():
+    '''deletes the sections the test created (ie: its cells, reduced cells and copies) after it'''
+    sections_before = set(h.allsec())
+    yield
+    _delete_new_sections(sections_before)
+
+
+@pytest.fixture
+def passive_cell(passive_job, new_sections_deleted):
+    '''a function(job=passive_job) that instantiates the cell of the job, with its synapse file
+
+    the function returns the cell, synapses_list and netcons_list; the cells and
+    their reduced cells are deleted after the test
+    '''
+    def create(job=passive_job):
+        '''returns the cell of the job, its synapses and their NetCons'''
+        cell = create_cell(job)
+        synapses_list, netcons_list = create_synapses_at_locations(
+            cell, read_synapse_locations(job.synapse_file))
+        return cell, synapses_list, netcons_list
+    return create
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+'''The golden voltage traces of the regression tests
+
+A golden trace file is a .npy file of a (2, number_of_recordings) float64
+array: the voltage at the soma of the control cell and of the reduced cell.
+It is loaded memory mapped, so comparing traces doesn't read them into python
+objects.  Its metadata (the parameters of the simulation it was recorded with)
+are in a .json file next to it, with the same name:
+    {"header": the description of the parameters,
+     "parameters": {name: value}}
+
+The original text format (a line with the description of the parameters,
+followed by a line per voltage, of the control and then of the reduced cell)
+is converted with:
+    python golden_traces.py TestsFiles/Test_1/voltage_vectors_for_unit_test_38.txt
+    # converts all the text traces in TestsFiles
+    python golden_traces.py
+'''
+from __future__ import print_function
+
+import glob
+import json
+import os
+import re
+import sys
+
+import numpy as np
+
+BASE_PATH = os.path.abspath(os.path.dirname(__file__))
+TESTDATA_PATH = os.path.join(BASE_PATH, 'TestsFiles')
+TEXT_TRACES_PATTERN = os.path.join(TESTDATA_PATH, '*', 'voltage_vectors_for_unit_test*.txt')
+
+
+def metadata_file(trace_file):
+    '''the path of the metadata of the golden trace file'''
+    return os.path.splitext(trace_file)[0] + '.json'
+
+
+def write_golden_traces(trace_file, control, reduced, header, parameters):
+    '''writes the control and reduced traces, and their metadata
+
+    header: the description of the parameters of the simulation
+    parameters: {name: value} of the simulation
+    '''
+    assert trace_file.endswith('.npy'), 'golden trace files are .npy files'
+    assert len(control) == len(reduced), 'the traces must have the same number of recordings'
+    traces = np.lib.format.open_memmap(trace_file, mode='w+', dtype=np.float64,
+                                       shape=(2, len(control)))
+    traces[0] = control
+    traces[1] = reduced
+    traces.flush()
+    del traces
+
+    with open(metadata_file(trace_file), 'w') as fd:
+        json.dump({'header': header, 'parameters': parameters}, fd, indent=2, sort_keys=True)
+
+
+def load_golden_traces(trace_file, number_of_recordings=None):
+    '''returns the control and reduced traces (memory mapped) of the golden trace file'''
+    traces = np.load(trace_file, mmap_mode='r')
+    assert traces.ndim == 2 and traces.shape[0] == 2, 'bad golden trace file %s' % trace_file
+    if number_of_recordings is not None:
+        assert traces.shape[1] == number_of_recordings, \
+            '%s has %d recordings, not %d' % (trace_file, traces.shape[1], number_of_recordings)
+    return traces[0], traces[1]
+
+
+def load_golden_metadata(trace_file):
+    '''returns the metadata of the golden trace file'''
+    with open(metadata_file(trace_file)) as fd:
+        return json.load(fd)
+
+
+def parse_text_header(header):
+    '''returns {name: value} of the description of the parameters of a text trace file
+
+    the values are strings, with their units (ie: '0.3 ms')
+    '''
+    header = header.split(':', 1)[-1]
+    parameters = {}
+    # the parameters are separated by commas, some of the files miss some commas
+    for parameter in re.split(r',\s*|\s+(?=[A-Z_]+ =)', header):
+        if '=' in parameter:
+            name, value = parameter.split('=', 1)
+            parameters[name.strip()] = value.strip()
+    return parameters
+
+
+def convert_text_traces(text_file, trace_file=None):
+    '''converts the text traces file to a golden trace file (by default, with a .npy extension)
+
+    returns the path of the golden trace file
+    '''
+    trace_file = trace_file or os.path.splitext(text_file)[0] + '.npy'
+    with open(text_file) as fd:
+        header = fd.readline().strip()
+        voltages = np.loadtxt(fd, dtype=np.float64, ndmin=1)
+    assert voltages.size % 2 == 0, '%s has an odd number of voltages' % text_file
+    control, reduced = np.split(voltages, 2)
+    write_golden_traces(trace_file, control, reduced, header, parse_text_header(header))
+    return trace_file
+
+
+def main(argv):
+    '''main'''
+    for text_file in argv or sorted(glob.glob(TEXT_TRACES_PATTERN)):
+        print('%s -> %s' % (text_file, convert_text_traces(text_file)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -1,4 +1,11 @@
 #!/usr/bin/env python
+'''Regression tests of the reduction of the models in TestsFiles
+
+Every run reduces a model, simulates it with the synaptic activity of
+test_script_helper.py and compares the voltage traces to the stored ones.  Run
+in sequence by this script, or in parallel by run_regression_tests.py.
+'''
+import collections
 import os
 
 WRITE_UNIT_TEST_VECTORS = False
@@ -7,198 +14,231 @@ PLOT_VOLTAGES = False
 BASE_PATH = os.path.abspath(os.path.dirname(__file__))
 TESTDATA_PATH = os.path.join(BASE_PATH, 'TestsFiles')
 
-
-def run_reduce(morphology_file,
-               model_file,
-               frequency,
-               synapse_file,
-               voltage_file,
-               create_type,
-               celsius,
-               write_unit_test_vectors=WRITE_UNIT_TEST_VECTORS,
-               plot_voltages=PLOT_VOLTAGES,
-               reduced_model_file='model.hoc',
-               manual_total_nsegs=-1):
-    args = ("python " +
-            os.path.join(BASE_PATH, "test_script_helper.py ") +
-            ' '.join([str(a) for a in (morphology_file,
-                                       model_file,
-                                       reduced_model_file,
-                                       frequency,
-                                       manual_total_nsegs,
-                                       synapse_file,
-                                       voltage_file,
-                                       write_unit_test_vectors,
-                                       plot_voltages,
-                                       create_type,
-                                       celsius)]))
-    assert os.system(args) == 0
+RegressionRun = collections.namedtuple('RegressionRun',
+                                       'morphology_file, model_file, frequency, synapse_file, '
+                                       'voltage_file, create_type, celsius')
+
+
+def _regression_run(path, morphology_file, model_file, frequency, synapse_file, voltage_file,
+                    create_type, celsius):
+    '''the RegressionRun of the files in path'''
+    path = os.path.join(TESTDATA_PATH, path)
+    return RegressionRun(morphology_file=os.path.join(path, morphology_file),
+                         model_file=os.path.join(path, model_file),
+                         frequency=frequency,
+                         synapse_file=os.path.join(path, synapse_file),
+                         voltage_file=os.path.join(path, voltage_file),
+                         create_type=create_type,
+                         celsius=celsius)
+
+
+RUNS = collections.OrderedDict(
+    [('test1_%d' % frequency, _regression_run('Test_1',
+                                              "2013_03_06_cell08_876_H41_05_Cell2.ASC",
+                                              "model.hoc",
+                                              frequency,
+                                              "origRandomSynapses-10000",
+                                              "voltage_vectors_for_unit_test_%s.npy" % frequency,
+                                              'basic',
+                                              37))
+     for frequency in (0, 10, 38, 200)] +
+    [('test2', _regression_run('Test_2',
+                               "2013_03_06_cell08_876_H41_05_Cell2.ASC",
+                               "model.hoc",
+                               38,
+                               "origRandomSynapses-10000",
+                               "voltage_vectors_for_unit_test.npy",
+                               'basic',
+                               37)),
+     ('test3_a71075_passive', _regression_run(
+         'Test_3',
+         "dend-C050800E2_cor_axon-C120398A-P2_-_Scale_x1.000_y1.050_z1.000_-_Clone_81.asc",
+         "cADpyr230_L4_SS_4_dend_C050800E2_cor_axon_C120398A_P2___Scale_x1_000_y1_050_z1_000___"
+         "Clone_81.hoc",
+         38,
+         "synapse_fromh5a71075.txt",
+         "voltage_vectors_for_unit_test.npy",
+         'bbp',
+         34)),
+     ('test4_amsalem_2016', _regression_run('Test_4_LBC_amsalem/',
+                                            "C230300D1.asc",
+                                            "cNAC187_L23_LBC_3_C230300D1_new_new_fit.hoc",
+                                            9,
+                                            "synapse_fromh5a71075.txt",
+                                            "voltage_vectors_for_unit_test.npy",
+                                            'bbpactive',
+                                            34)),
+     ('test5_Hay_2011_active_dendrite', _regression_run('Test_5_Hay_2011/',
+                                                        "cell1.asc",
+                                                        "L5PCtemplate.hoc",
+                                                        38,
+                                                        "origRandomSynapses-10000",
+                                                        "voltage_vectors_for_unit_test.npy",
+                                                        'hay',
+                                                        37)),
+     ('test6_L4_LBC_cNAC187_5_for_run', _regression_run('L4_LBC_cNAC187_5_for_run/',
+                                                        "2013_03_06_cell08_876_H41_05_Cell2.ASC",
+                                                        "cNAC187_L4_LBC_8e834c24cb.hoc",
+                                                        0,
+                                                        "1487081844_732516.txt",
+                                                        "voltage_vectors_for_unit_test_0.npy",
+                                                        'bbpnew',
+                                                        34)),
+     ('test7_Almog_Korngreen_2014', _regression_run('Test_7_Almog/',
+                                                    '',
+                                                    "A140612_1.hoc",
+                                                    0,
+                                                    "origRandomSynapses-10000",
+                                                    "voltage_vectors_for_unit_test_0.npy",
+                                                    'almog',
+                                                    34)),
+     ('test8_Marasco_Limongiello_Migliore_2012', _regression_run(
+         'Test_8_C1_Marasco/',
+         '',
+         "geo5038801modMod.hoc",
+         0,
+         "1487081844_732516.txt",
+         "voltage_vectors_for_unit_test_0.npy",
+         'almog',
+         34)),
+     ('test9_model_48310820', _regression_run('Test_9_Allen_483108201/',
+                                              "reconstruction.swc",
+                                              "AllenTemplate.hoc",
+                                              0,
+                                              "origRandomSynapses-10000",
+                                              "voltage_vectors_for_unit_test.npy",
+                                              'allen',
+                                              34)),
+     ('test10_model_47804508', _regression_run('Test_10_Allen_47804508/',
+                                               "reconstruction.swc",
+                                               "AllenTemplate.hoc",
+                                               0,
+                                               "origRandomSynapses-10000",
+                                               "voltage_vectors_for_unit_test.npy",
+                                               'allen',
+                                               34)),
+     ('test11_human_Eyal_2016', _regression_run('Test_11_Human_L2_3_Eyal/',
+                                                "2013_03_06_cell08_876_H41_05_Cell2.ASC",
+                                                "model_0603_cell08_cm045.hoc",
+                                                0,
+                                                "origRandomSynapses-10000",
+                                                "voltage_vectors_for_unit_test.npy",
+                                                'human',
+                                                37)),
+     ('test12_TPC_Markram_2016', _regression_run(
+         'Test_12_TPC_L6_Markram/',
+         "dend-tkb070125a3_ch1_cc2_b_hw_60x_1_axon-tkb060223b3_ch1_cc2_o_ps_60x_1_-_Clone_5.asc",
+         "cADpyr231_L6_TPC_L1_44f2206f70.hoc",
+         0,
+         "synapses_location.txt",
+         "voltage_vectors_for_unit_test.npy",
+         'bbpnew',
+         34)),
+     ('test13_dbc_Markram_2015', _regression_run('Test_13_DBC_L4_Markram/',
+                                                 "C140600C-I1_-_Clone_2.asc",
+                                                 "cNAC187_L4_DBC_23ffe29c8b.hoc",
+                                                 0,
+                                                 "synapses_locations.txt",
+                                                 "voltage_vectors_for_unit_test.npy",
+                                                 'bbpnew',
+                                                 34)),
+     ])
+
+
+def command_line(morphology_file,
+                 model_file,
+                 frequency,
+                 synapse_file,
+                 voltage_file,
+                 create_type,
+                 celsius,
+                 write_unit_test_vectors=WRITE_UNIT_TEST_VECTORS,
+                 plot_voltages=PLOT_VOLTAGES,
+                 reduced_model_file=None,
+                 manual_total_nsegs=-1,
+                 results_file=None):
+    '''the arguments of the test_script_helper.py process of a run'''
+    args = [os.path.join(BASE_PATH, "test_script_helper.py")]
+    args += [str(a) for a in (morphology_file,
+                              model_file,
+                              reduced_model_file,
+                              frequency,
+                              manual_total_nsegs,
+                              synapse_file,
+                              voltage_file,
+                              write_unit_test_vectors,
+                              plot_voltages,
+                              create_type,
+                              celsius)]
+    if results_file is not None:
+        args.append(results_file)
+    return args
+
+
+def run_reduce(**kwargs):
+    '''runs test_script_helper.py for the run, asserts that it passed'''
+    assert os.system("python " + ' '.join(command_line(**kwargs))) == 0
 
 
 def test1():
     '''Test 1 passive neuron'''
-    path = os.path.join(TESTDATA_PATH, 'Test_1')
-    kwargs = dict(morphology_file=os.path.join(path, "2013_03_06_cell08_876_H41_05_Cell2.ASC"),
-                  model_file=os.path.join(path, "model.hoc"),
-                  synapse_file=os.path.join(path, "origRandomSynapses-10000"),
-                  create_type='basic',
-                  celsius=37)
-
     for frequency in (0, 10, 38, 200):
-        kwargs['frequency'] = frequency
-        kwargs['voltage_file'] = os.path.join(path, "voltage_vectors_for_unit_test_%s.txt" % frequency)
-        run_reduce(**kwargs)
+        run_reduce(**RUNS['test1_%d' % frequency]._asdict())
 
 
 def test2():
     '''Test 2 passive neuron not deleting the axon'''
-    path = os.path.join(TESTDATA_PATH, 'Test_2')
-
-    run_reduce(morphology_file=os.path.join(path, "2013_03_06_cell08_876_H41_05_Cell2.ASC"),
-               model_file=os.path.join(path, "model.hoc"),
-               frequency=38,
-               synapse_file=os.path.join(path, "origRandomSynapses-10000"),
-               voltage_file=os.path.join(path, "voltage_vectors_for_unit_test.txt"),
-               create_type='basic',
-               celsius=37,
-               )
+    run_reduce(**RUNS['test2']._asdict())
 
 
 def test3_a71075_passive():
-    path = os.path.join(TESTDATA_PATH, 'Test_3')
-    run_reduce(morphology_file=os.path.join(path, "dend-C050800E2_cor_axon-C120398A-P2_-_Scale_x1.000_y1.050_z1.000_-_Clone_81.asc"),
-               model_file=os.path.join(path, "cADpyr230_L4_SS_4_dend_C050800E2_cor_axon_C120398A_P2___Scale_x1_000_y1_050_z1_000___Clone_81.hoc"),
-               frequency=38,
-               synapse_file=os.path.join(path, "synapse_fromh5a71075.txt"),
-               voltage_file=os.path.join(path, "voltage_vectors_for_unit_test.txt"),
-               create_type='bbp',
-               celsius=34,
-               )
+    run_reduce(**RUNS['test3_a71075_passive']._asdict())
 
 
 def test4_amsalem_2016():
-    path = os.path.join(TESTDATA_PATH, 'Test_4_LBC_amsalem/')
-    run_reduce(morphology_file=os.path.join(path, "C230300D1.asc"),
-               model_file=os.path.join(path, "cNAC187_L23_LBC_3_C230300D1_new_new_fit.hoc"),
-               frequency=9,
-               synapse_file=os.path.join(path, "synapse_fromh5a71075.txt"),
-               voltage_file=os.path.join(path, "voltage_vectors_for_unit_test.txt"),
-               create_type='bbpactive',
-               celsius=34
-               )
+    run_reduce(**RUNS['test4_amsalem_2016']._asdict())
 
 
 def test5_Hay_2011_active_dendrite():
-    path = os.path.join(TESTDATA_PATH, 'Test_5_Hay_2011/')
-    run_reduce(morphology_file=os.path.join(path, "cell1.asc"),
-               model_file=os.path.join(path, "L5PCtemplate.hoc"),
-               frequency=38,
-               synapse_file=os.path.join(path, "origRandomSynapses-10000"),
-               voltage_file=os.path.join(path, "voltage_vectors_for_unit_test.txt"),
-               create_type='hay',
-               celsius=37)
+    run_reduce(**RUNS['test5_Hay_2011_active_dendrite']._asdict())
 
 
 def test6_L4_LBC_cNAC187_5_for_run():
-    path = os.path.join(TESTDATA_PATH, 'L4_LBC_cNAC187_5_for_run/')
-    run_reduce(morphology_file=os.path.join(path, "2013_03_06_cell08_876_H41_05_Cell2.ASC"),
-               model_file=os.path.join(path, "cNAC187_L4_LBC_8e834c24cb.hoc"),
-               frequency=0,
-               synapse_file=os.path.join(path, "1487081844_732516.txt"),
-               voltage_file=os.path.join(path, "voltage_vectors_for_unit_test_0.txt"),
-               create_type='bbpnew',
-               celsius=34,
-               )
+    run_reduce(**RUNS['test6_L4_LBC_cNAC187_5_for_run']._asdict())
 
 
 def test7_Almog_Korngreen_2014():
-    path = os.path.join(TESTDATA_PATH, 'Test_7_Almog/')
-    run_reduce(morphology_file=path,
-               model_file=os.path.join(path, "A140612_1.hoc"),
-               frequency=0,
-               synapse_file=os.path.join(path, "origRandomSynapses-10000"),
-               voltage_file=os.path.join(path, "voltage_vectors_for_unit_test_0.txt"),
-               create_type='almog',
-               celsius=34,
-               )
+    run_reduce(**RUNS['test7_Almog_Korngreen_2014']._asdict())
 
 
 def test8_Marasco_Limongiello_Migliore_2012():
     '''Test 8 Marasco Limongiello Migliore 2012'''
-    path = os.path.join(TESTDATA_PATH, 'Test_8_C1_Marasco/')
-    run_reduce(morphology_file=path,
-               model_file=os.path.join(path, "geo5038801modMod.hoc"),
-               frequency=0,
-               synapse_file=os.path.join(path, "1487081844_732516.txt"),
-               voltage_file=os.path.join(path, "voltage_vectors_for_unit_test_0.txt"),
-               create_type='almog',
-               celsius=34,
-               )
+    run_reduce(**RUNS['test8_Marasco_Limongiello_Migliore_2012']._asdict())
 
 
 def test9_model_48310820():
     '''Test 9 model 48310820 (L5PC) from the Allen celltypes data base'''
-    path = os.path.join(TESTDATA_PATH, 'Test_9_Allen_483108201/')
-    run_reduce(morphology_file=os.path.join(path, "reconstruction.swc"),
-               model_file=os.path.join(path, "AllenTemplate.hoc"),
-               frequency=0,
-               synapse_file=os.path.join(path, "origRandomSynapses-10000"),
-               voltage_file=os.path.join(path, "voltage_vectors_for_unit_test.txt"),
-               create_type='allen',
-               celsius=34,
-               )
+    run_reduce(**RUNS['test9_model_48310820']._asdict())
 
 
 def test10_model_47804508():
     '''Test 10 model 47804508 (L1) from the Allen celltypes data base'''
-    path = os.path.join(TESTDATA_PATH, 'Test_10_Allen_47804508/')
-    run_reduce(morphology_file=os.path.join(path, "reconstruction.swc"),
-               model_file=os.path.join(path, "AllenTemplate.hoc"),
-               frequency=0,
-               synapse_file=os.path.join(path, "origRandomSynapses-10000"),
-               voltage_file=os.path.join(path, "voltage_vectors_for_unit_test.txt"),
-               create_type='allen',
-               celsius=34,
-               )
+    run_reduce(**RUNS['test10_model_47804508']._asdict())
 
 
 def test11_human_Eyal_2016():
     '''Test 11 model Human L2/3 Cell from Eyal et al 2016'''
-    path = os.path.join(TESTDATA_PATH, 'Test_11_Human_L2_3_Eyal/')
-    run_reduce(morphology_file=os.path.join(path, "2013_03_06_cell08_876_H41_05_Cell2.ASC"),
-               model_file=os.path.join(path, "model_0603_cell08_cm045.hoc"),
-               frequency=0,
-               synapse_file=os.path.join(path, "origRandomSynapses-10000"),
-               voltage_file=os.path.join(path, "voltage_vectors_for_unit_test.txt"),
-               create_type='human',
-               celsius=37,
-               )
+    run_reduce(**RUNS['test11_human_Eyal_2016']._asdict())
 
 
 def test12_TPC_Markram_2016():
     '''Test 12 Tufted Pyramidal Cell (L6) Markram et al. Cell (2015) ----'''
-    path = os.path.join(TESTDATA_PATH, 'Test_12_TPC_L6_Markram/')
-    run_reduce(morphology_file=os.path.join(path, "dend-tkb070125a3_ch1_cc2_b_hw_60x_1_axon-tkb060223b3_ch1_cc2_o_ps_60x_1_-_Clone_5.asc"),
-               model_file=os.path.join(path, "cADpyr231_L6_TPC_L1_44f2206f70.hoc"),
-               frequency=0,
-               synapse_file=os.path.join(path, "synapses_location.txt"),
-               voltage_file=os.path.join(path, "voltage_vectors_for_unit_test.txt"),
-               create_type='bbpnew',
-               celsius=34,
-               )
+    run_reduce(**RUNS['test12_TPC_Markram_2016']._asdict())
 
 
 def test13_dbc_Markram_2015():
     '''Test 13 Double Bouquet Cell (L4) Markram et al. Cell (2015)'''
-    path = os.path.join(TESTDATA_PATH, 'Test_13_DBC_L4_Markram/')
-    run_reduce(morphology_file=os.path.join(path, "C140600C-I1_-_Clone_2.asc"),
-               model_file=os.path.join(path, "cNAC187_L4_DBC_23ffe29c8b.hoc"),
-               frequency=0,
-               synapse_file=os.path.join(path, "synapses_locations.txt"),
-               voltage_file=os.path.join(path, "voltage_vectors_for_unit_test.txt"),
-               create_type ='bbpnew',
-               celsius=34,
-               )
+    run_reduce(**RUNS['test13_dbc_Markram_2015']._asdict())
 
 
 if __name__ == '__main__':
@@ -0,0 +1,284 @@
+#!/usr/bin/env python
+'''Benchmarks of the reduction of the models in TestsFiles
+
+For each model: the wall time of each stage of the reduction and the peak
+memory (see neuron_reduce/instrumentation.py), and the simulation time of the
+full and the reduced cell with the synaptic activity of test_script_helper.py.
+Every model is measured in its own python process, so that NEURON is reset.
+The time to import neuron and neuron_reduce (in a new python process) is
+measured too.
+
+usage:
+    # measures all the models (or --models Test_1 Test_5_Hay_2011) into a json file
+    python run_benchmarks.py run --output baseline.json
+    # after a change, measures again and compares to the baseline; exits with 1
+    # if a measure is worse than in the baseline by more than the threshold
+    python run_benchmarks.py run --output current.json
+    python run_benchmarks.py compare baseline.json current.json --threshold 0.2
+'''
+from __future__ import print_function
+
+import argparse
+import collections
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+from run_all_tests import RUNS
+
+DEFAULT_TSTOP = 500  # ms
+DEFAULT_THRESHOLD = 0.2  # relative
+# timings shorter than this (in seconds) are not compared, they are mostly noise
+MIN_COMPARED_TIME = 0.05
+# the import time is the shortest of this number of imports
+IMPORT_REPEATS = 5
+IMPORTED_MODULES = ('neuron', 'neuron_reduce', )
+IMPORT_TIME_CODE = 'import time; start = time.time(); import %s; print(time.time() - start)'
+
+# the runs of run_all_tests.py, one per model: the Test_1 runs at other frequencies are left out
+BENCHMARKED_RUNS = [name for name in RUNS if name not in ('test1_0', 'test1_10', 'test1_200')]
+# {name of the directory of the model in TestsFiles: its RegressionRun}
+MODELS = collections.OrderedDict((os.path.basename(os.path.dirname(RUNS[name].model_file)),
+                                  RUNS[name])
+                                 for name in BENCHMARKED_RUNS)
+
+# the compared measures, and whether a higher value is better
+COMPARED_MEASURES = (('reduction_time', False),
+                     ('peak_memory_mb', False),
+                     ('reduced_simulation_time', False),
+                     ('speedup', True),
+                     )
+
+Regression = collections.namedtuple('Regression', 'model, measure, baseline, current, change')
+
+
+def _load_model_mechanisms(path):
+    '''loads the mechanisms of the model (if it has any), compiled once per set of mod files'''
+    from neuron_reduce.mechanisms import load_compiled_mechanisms
+    if os.path.isdir(os.path.join(path, 'mod')):
+        load_compiled_mechanisms(os.path.join(path, 'mod'))
+
+
+def _simulation_time(tstop):
+    '''runs the simulation, returns its wall time'''
+    from neuron import h
+    h.tstop = tstop
+    start = time.time()
+    h.run()
+    return time.time() - start
+
+
+def measure_model(name, tstop=DEFAULT_TSTOP):
+    '''measures the reduction and the simulations of the model, in this process
+
+    The full cell is simulated, then reduced, and the reduced cell is simulated
+    with the same (statistically) synaptic activity.  Returns a dictionary.
+    '''
+    from neuron import h
+    from neuron_reduce import subtree_reductor
+    from neuron_reduce.instrumentation import ReductionProfile
+    import test_script_helper as helper
+
+    h.load_file("stdrun.hoc")
+    model = MODELS[name]
+    path = os.path.dirname(model.model_file)
+    model_file = model.model_file
+    morphology_file = model.morphology_file
+
+    h.celsius = model.celsius
+    _load_model_mechanisms(path)
+    with helper.chdir(path):
+        if model.create_type == 'hay':
+            helper.loadtemplate(os.path.join(path, 'L5PCbiophys3.hoc'))
+        elif model.create_type == 'allen':
+            helper.loadtemplate(os.path.join(path, 'AllenBiophys.hoc'))
+        h.load_file("import3d.hoc")
+        helper.loadtemplate(model_file)
+
+        model_obj_name = os.path.basename(model_file.split(".hoc")[0])
+        cell = helper.create_model(morphology_file, model_obj_name, 'original_cell',
+                                   model.create_type)
+    synapses_list, _, netcons_list, _ = helper.create_synapses(
+        cell, model.synapse_file)
+
+    soma = cell.soma[0] if cell.soma.hname()[-1] == ']' else cell.soma
+    h.steps_per_ms = helper.SIM_PARAMS['steps_per_ms']
+    h.dt = helper.SIM_PARAMS['dt']
+    h.v_init = soma.e_pas
+    full_nseg = sum(sec.nseg for sec in h.SectionRef(sec=soma).root.wholetree())
+    full_simulation_time = _simulation_time(tstop)
+
+    profile = ReductionProfile()
+    reduced_cell, synapses_list, netcons_list = subtree_reductor(cell,
+                                                                 synapses_list,
+                                                                 netcons_list,
+                                                                 model.frequency,
+                                                                 profile=profile)
+    reduced_soma = reduced_cell.soma[0] if reduced_cell.soma.hname()[-1] == ']' else reduced_cell.soma
+    reduced_nseg = sum(sec.nseg for sec in h.SectionRef(sec=reduced_soma).root.wholetree())
+    reduced_simulation_time = _simulation_time(tstop)
+
+    return {'tstop': tstop,
+            'full_nseg': full_nseg,
+            'reduced_nseg': reduced_nseg,
+            'n_synapses': len(netcons_list),
+            'n_reduced_synapses': len(synapses_list),
+            'reduction_time': profile.total_time,
+            'reduction': profile.as_dict(),
+            'peak_memory_mb': profile.peak_memory_mb,
+            'full_simulation_time': full_simulation_time,
+            'reduced_simulation_time': reduced_simulation_time,
+            'speedup': full_simulation_time / reduced_simulation_time,
+            }
+
+
+def measure_import_time(module, repeats=IMPORT_REPEATS):
+    '''returns the shortest time, of repeats imports of the module in a new python process'''
+    times = []
+    for _ in range(repeats):
+        output = subprocess.check_output([sys.executable, '-c', IMPORT_TIME_CODE % module],
+                                         stderr=subprocess.PIPE)
+        times.append(float(output.decode('utf-8').split()[-1]))
+    return min(times)
+
+
+def run_benchmarks(names, tstop=DEFAULT_TSTOP):
+    '''measures each model in its own process, returns the results dictionary
+
+    a model that fails has an 'error' instead of its measures
+    '''
+    import neuron
+    results = {'metadata': {'date': datetime.datetime.now().isoformat(),
+                            'neuron_version': neuron.__version__,
+                            'python_version': platform.python_version(),
+                            'platform': platform.platform(),
+                            'tstop': tstop,
+                            },
+               'import_times': {module: measure_import_time(module)
+                                for module in IMPORTED_MODULES},
+               'models': collections.OrderedDict(),
+               }
+    for name in names:
+        print('benchmarking %s' % name)
+        fd, output = tempfile.mkstemp(suffix='.json')
+        os.close(fd)
+        try:
+            process = subprocess.Popen([sys.executable, os.path.abspath(__file__), 'measure', name,
+                                        '--tstop', str(tstop), '--output', output],
+                                       stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+            log = process.communicate()[0].decode('utf-8', 'replace')
+            if process.returncode == 0:
+                with open(output) as fd:
+                    results['models'][name] = json.load(fd)
+            else:
+                print('%s failed' % name)
+                results['models'][name] = {'error': log[-5000:]}
+        finally:
+            os.remove(output)
+    return results
+
+
+def compare_results(baseline, current, threshold=DEFAULT_THRESHOLD,
+                    min_compared_time=MIN_COMPARED_TIME):
+    '''returns the Regressions of the current results relative to the baseline results
+
+    A measure regresses if it is worse than in the baseline by more than the
+    threshold (relative), the time of each stage of the reduction is compared
+    too.  Timings shorter than min_compared_time in both results are ignored,
+    and so are models that failed or are missing from either results.  The
+    import times are compared as the measures of the 'import' model.
+    '''
+    regressions = []
+    baseline_imports = baseline.get('import_times', {})
+    current_imports = current.get('import_times', {})
+    for module in baseline_imports:
+        if module not in current_imports:
+            continue
+        change = current_imports[module] / baseline_imports[module] - 1
+        if max(baseline_imports[module], current_imports[module]) >= min_compared_time and \
+                change > threshold:
+            regressions.append(Regression('import', 'import_time:' + module,
+                                          baseline_imports[module], current_imports[module],
+                                          change))
+    for name, baseline_model in baseline['models'].items():
+        current_model = current['models'].get(name)
+        if current_model is None or 'error' in current_model or 'error' in baseline_model:
+            continue
+
+        measures = [(measure, higher_is_better, baseline_model[measure], current_model[measure])
+                    for measure, higher_is_better in COMPARED_MEASURES]
+        baseline_stages = baseline_model['reduction']['stage_times']
+        current_stages = current_model['reduction']['stage_times']
+        measures.extend(('stage_time:' + stage, False, baseline_stages[stage], current_stages[stage])
+                        for stage in baseline_stages if stage in current_stages)
+
+        for measure, higher_is_better, baseline_value, current_value in measures:
+            if baseline_value is None or current_value is None or not baseline_value:
+                continue
+            is_time = measure.endswith('time') or measure.startswith('stage_time')
+            if is_time and max(baseline_value, current_value) < min_compared_time:
+                continue
+
+            change = float(current_value) / baseline_value - 1
+            if (-change if higher_is_better else change) > threshold:
+                regressions.append(Regression(name, measure, baseline_value, current_value, change))
+    return regressions
+
+
+def main(argv):
+    '''main'''
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command')
+
+    run_parser = subparsers.add_parser('run', help='measures the models')
+    run_parser.add_argument('--output', required=True, help='json file of the results')
+    run_parser.add_argument('--models', nargs='+', default=list(MODELS), choices=list(MODELS))
+    run_parser.add_argument('--tstop', type=float, default=DEFAULT_TSTOP)
+
+    measure_parser = subparsers.add_parser('measure', help='measures a model in this process')
+    measure_parser.add_argument('model', choices=list(MODELS))
+    measure_parser.add_argument('--output', required=True)
+    measure_parser.add_argument('--tstop', type=float, default=DEFAULT_TSTOP)
+
+    compare_parser = subparsers.add_parser('compare', help='compares results to a baseline')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD)
+
+    args = parser.parse_args(argv)
+    if args.command == 'run':
+        results = run_benchmarks(args.models, args.tstop)
+        with open(args.output, 'w') as fd:
+            json.dump(results, fd, indent=2)
+        return 0 if all('error' not in model for model in results['models'].values()) else 1
+    elif args.command == 'measure':
+        result = measure_model(args.model, args.tstop)
+        with open(args.output, 'w') as fd:
+            json.dump(result, fd)
+        return 0
+    elif args.command == 'compare':
+        with open(args.baseline) as fd:
+            baseline = json.load(fd)
+        with open(args.current) as fd:
+            current = json.load(fd)
+        regressions = compare_results(baseline, current, args.threshold)
+        for regression in regressions:
+            print('REGRESSION %s %s: %.4g -> %.4g (%+.1f%%)' % (regression.model,
+                                                              regression.measure,
+                                                              regression.baseline,
+                                                              regression.current,
+                                                              100 * regression.change))
+        print('%d regressions' % len(regressions))
+        return 1 if regressions else 0
+    parser.print_help()
+    return 2
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
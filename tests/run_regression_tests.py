@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+'''Runs the regression tests of run_all_tests.py in parallel
+
+Every run is a test_script_helper.py process (so that NEURON is reset), the
+runs are scheduled over a pool of workers, the longest first, so the suite
+takes about the time of its longest run.  The expected duration of the runs is
+EXPECTED_DURATIONS, or the durations in the results of a previous run
+(--durations).  A run that takes longer than the timeout is killed.
+
+usage:
+    python run_regression_tests.py --workers 4 --output results.json
+    python run_regression_tests.py --runs test1_38 test5_Hay_2011_active_dendrite
+    # schedules according to the durations of the previous run
+    python run_regression_tests.py --durations results.json --output results.json
+
+exits with 1 if a run did not pass
+'''
+from __future__ import print_function
+
+import argparse
+import collections
+import concurrent.futures
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from run_all_tests import RUNS, command_line
+
+DEFAULT_TIMEOUT = 1800  # seconds
+OUTPUT_TAIL_LINES = 30
+
+# wall time (in seconds) of each run, to schedule the longest first; runs
+# that are not listed are scheduled first
+EXPECTED_DURATIONS = {'test1_0': 14,
+                      'test1_10': 14,
+                      'test1_38': 15,
+                      'test1_200': 17,
+                      'test2': 16,
+                      'test3_a71075_passive': 3,
+                      'test4_amsalem_2016': 30,
+                      'test5_Hay_2011_active_dendrite': 27,
+                      'test6_L4_LBC_cNAC187_5_for_run': 30,
+                      'test7_Almog_Korngreen_2014': 20,
+                      'test8_Marasco_Limongiello_Migliore_2012': 20,
+                      'test9_model_48310820': 15,
+                      'test10_model_47804508': 14,
+                      'test11_human_Eyal_2016': 16,
+                      'test12_TPC_Markram_2016': 30,
+                      'test13_dbc_Markram_2015': 30,
+                      }
+
+STATUSES = ('passed', 'failed', 'error', 'timeout', )
+RunResult = collections.namedtuple('RunResult',
+                                   'name, status, duration, returncode, rmsd, unit_test_rmsd, '
+                                   'rmsd_to_unit_test, reduction_time, simulation_time, '
+                                   'output_tail')
+
+
+def schedule(names, durations=None):
+    '''returns the names ordered by decreasing expected duration
+
+    durations: {name: seconds}, overrides EXPECTED_DURATIONS
+    '''
+    expected = dict(EXPECTED_DURATIONS)
+    expected.update(durations or {})
+    return sorted(names, key=lambda name: -expected.get(name, float('inf')))
+
+
+def run_one(name, timeout=DEFAULT_TIMEOUT):
+    '''runs the regression run `name` in a test_script_helper.py process, returns a RunResult'''
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        results_file = os.path.join(tmp_dir, 'results.json')
+        args = [sys.executable] + command_line(results_file=results_file, **RUNS[name]._asdict())
+        start = time.time()
+        process = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        try:
+            output = process.communicate(timeout=timeout)[0]
+            status = None
+        except subprocess.TimeoutExpired:
+            process.kill()
+            output = process.communicate()[0]
+            status = 'timeout'
+        duration = time.time() - start
+        output_tail = [line for line in output.decode('utf-8', 'replace').splitlines()
+                       if line.strip()][-OUTPUT_TAIL_LINES:]
+
+        results = {}
+        if status is None and os.path.exists(results_file):
+            with open(results_file) as fd:
+                results = json.load(fd)
+            status = 'passed' if results['passed'] and process.returncode == 0 else 'failed'
+        elif status is None:
+            # it did not get to compare the traces
+            status = 'error'
+
+        return RunResult(name=name,
+                         status=status,
+                         duration=duration,
+                         returncode=process.returncode,
+                         rmsd=results.get('rmsd'),
+                         unit_test_rmsd=results.get('unit_test_rmsd'),
+                         rmsd_to_unit_test=results.get('rmsd_to_unit_test'),
+                         reduction_time=results.get('reduction_time'),
+                         simulation_time=results.get('simulation_time'),
+                         output_tail=output_tail)
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def run_regression_tests(names=None, workers=None, timeout=DEFAULT_TIMEOUT, durations=None):
+    '''runs the regression runs (all the RUNS by default) on `workers` processes
+
+    returns the list of RunResult, in the order of the names; every run is
+    printed when it finishes
+    '''
+    names = list(RUNS) if names is None else names
+    workers = workers or multiprocessing.cpu_count()
+    results = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(run_one, name, timeout)
+                   for name in schedule(names, durations)]
+        for future in concurrent.futures.as_completed(futures):
+            result = future.result()
+            results[result.name] = result
+            print('%-45s %-8s %7.1f s' % (result.name, result.status, result.duration))
+            sys.stdout.flush()
+    return [results[name] for name in names]
+
+
+def main(argv):
+    '''main'''
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', nargs='+', choices=list(RUNS), help='all the runs by default')
+    parser.add_argument('--workers', type=int, help='the number of cpus by default')
+    parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT,
+                        help='of every run, in seconds')
+    parser.add_argument('--durations',
+                        help='json results of a previous run, to schedule the runs by')
+    parser.add_argument('--output', help='json file of the results')
+    args = parser.parse_args(argv)
+
+    durations = None
+    if args.durations and os.path.exists(args.durations):
+        with open(args.durations) as fd:
+            durations = {result['name']: result['duration'] for result in json.load(fd)['runs']}
+
+    start = time.time()
+    results = run_regression_tests(args.runs, args.workers, args.timeout, durations)
+    total_time = time.time() - start
+
+    for result in results:
+        if result.status != 'passed':
+            print('\n%s %s:\n%s' % (result.name, result.status, '\n'.join(result.output_tail)))
+    counts = collections.Counter(result.status for result in results)
+    print('\n%s in %.1f s (the longest run: %.1f s)' % (
+        ', '.join('%d %s' % (counts[status], status) for status in STATUSES if counts[status]),
+        total_time, max(result.duration for result in results)))
+
+    if args.output:
+        with open(args.output, 'w') as fd:
+            json.dump({'metadata': {'date': datetime.datetime.now().isoformat(),
+                                    'python': platform.python_version(),
+                                    'platform': platform.platform(),
+                                    'total_time': total_time,
+                                    },
+                       'runs': [result._asdict() for result in results],
+                       }, fd, indent=2)
+    return 0 if counts['passed'] == len(results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
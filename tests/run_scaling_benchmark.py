@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+'''Measures how the stages of the reduction scale, on synthetic cells
+
+Starting from a base synthetic cell (see neuron_reduce/synthetic.py), every
+axis (ie: the depth of the trees, or the number of synapses) is swept while
+the others are kept, the cells are reduced with a ReductionProfile, and the
+empirical complexity of each stage is estimated: the exponent of the size of
+the cell (its number of dendritic segments, or of synapses for the
+n_synapses axis) in a power law fit of the stage time.  The placement of the
+random synapses (see neuron_reduce/synapse_placement.py) is swept along the
+number of synapses too, it should take well under a second for 100k synapses.
+
+usage:
+    python run_scaling_benchmark.py --output scaling.json
+    python run_scaling_benchmark.py --axes depth n_synapses --density graded
+'''
+from __future__ import print_function
+
+import argparse
+import collections
+import json
+import sys
+import time
+
+import numpy as np
+
+from neuron_reduce import subtree_reductor
+from neuron_reduce.batch import teardown_reduced_cell
+from neuron_reduce.instrumentation import ReductionProfile
+from neuron_reduce.synapse_placement import place_synapses, placement_segments
+from neuron_reduce.synthetic import (DENSITIES, SyntheticCellSpec, create_synthetic_cell,
+                                     create_synthetic_cell_with_synapses, sections_per_tree)
+
+REDUCTION_FREQUENCY = 38  # Hz
+
+AXES = collections.OrderedDict([('depth', (3, 4, 5, 6, 7)),
+                                ('branching', (2, 3, 4, 5)),
+                                ('nseg', (1, 3, 9, 27)),
+                                ('n_trees', (2, 4, 8, 16)),
+                                ('n_synapses', (1000, 3000, 10000, 30000)),
+                                ])
+PLACEMENT_N_SYNAPSES = (10000, 30000, 100000, 300000)
+
+
+def cell_size(spec, axis):
+    '''the size the complexity along the axis is measured in'''
+    if axis == 'n_synapses':
+        return spec.n_synapses
+    n_trees = spec.n_trees + (1 if spec.has_apical else 0)
+    return n_trees * sections_per_tree(spec.branching, spec.depth) * spec.nseg
+
+
+def measure_reduction(spec, repeats=1):
+    '''reduces the synthetic cell repeats times, returns the profile with the shortest total time'''
+    best = None
+    for _ in range(repeats):
+        cell, synapses_list, netcons_list = create_synthetic_cell_with_synapses(spec)
+        profile = ReductionProfile()
+        reduced_cell, synapses_list, netcons_list = subtree_reductor(cell,
+                                                                     synapses_list,
+                                                                     netcons_list,
+                                                                     REDUCTION_FREQUENCY,
+                                                                     profile=profile)
+        teardown_reduced_cell(reduced_cell)
+        del cell, reduced_cell, synapses_list, netcons_list
+        if best is None or profile.total_time < best.total_time:
+            best = profile
+    return best
+
+
+def empirical_exponent(sizes, times):
+    '''the exponent of a power law fit of the times to the sizes, None if it can't be fitted'''
+    sizes, times = np.asarray(sizes, dtype=float), np.asarray(times, dtype=float)
+    valid = times > 0
+    if np.sum(valid) < 2:
+        return None
+    return float(np.polyfit(np.log(sizes[valid]), np.log(times[valid]), 1)[0])
+
+
+def sweep_axis(base_spec, axis, values, repeats=1):
+    '''reduces the cells of the sweep of the axis
+
+    returns a dictionary with the measured points, and the empirical exponent of
+    each stage, and of the total time
+    '''
+    points = []
+    for value in values:
+        spec = base_spec._replace(**{axis: value})
+        start = time.time()
+        profile = measure_reduction(spec, repeats)
+        print('%s=%s: size %d, reduced in %.3f s (%.1f s)' % (
+            axis, value, cell_size(spec, axis), profile.total_time, time.time() - start))
+        points.append({'value': value,
+                       'size': cell_size(spec, axis),
+                       'total_time': profile.total_time,
+                       'stage_times': dict(profile.stage_times),
+                       'counters': dict(profile.counters),
+                       })
+
+    sizes = [point['size'] for point in points]
+    exponents = {stage: empirical_exponent(sizes, [point['stage_times'].get(stage, 0.)
+                                                   for point in points])
+                 for stage in points[0]['stage_times']}
+    exponents['total_time'] = empirical_exponent(sizes, [point['total_time'] for point in points])
+    return {'points': points, 'exponents': exponents}
+
+
+def sweep_placement(base_spec, n_synapses_values=PLACEMENT_N_SYNAPSES, repeats=1):
+    '''places n_synapses_values random synapses on the synthetic cell
+
+    returns a dictionary with the measured points (the shortest time of repeats
+    placements), and the empirical exponent of the time to the number of synapses
+    '''
+    segments = placement_segments(create_synthetic_cell(base_spec))
+    points = []
+    for n_synapses in n_synapses_values:
+        times = []
+        for _ in range(repeats):
+            start = time.time()
+            place_synapses(segments, n_synapses)
+            times.append(time.time() - start)
+        print('placement of %d synapses in %.3f s' % (n_synapses, min(times)))
+        points.append({'value': n_synapses, 'size': n_synapses, 'total_time': min(times)})
+    exponent = empirical_exponent([point['size'] for point in points],
+                                  [point['total_time'] for point in points])
+    return {'points': points, 'exponents': {'total_time': exponent}}
+
+
+def run_scaling_benchmark(base_spec, axes, repeats=1):
+    '''sweeps every axis in axes ({axis: values}), returns {axis: sweep_axis() result}'''
+    return collections.OrderedDict((axis, sweep_axis(base_spec, axis, values, repeats))
+                                   for axis, values in axes.items())
+
+
+def print_exponents(results):
+    '''prints a table of the empirical exponent of each stage along each axis'''
+    stages = list(next(iter(results.values()))['exponents'])
+    print('%-20s' % 'stage' + ''.join('%12s' % axis for axis in results))
+    for stage in stages:
+        exponents = [results[axis]['exponents'].get(stage) for axis in results]
+        print('%-20s' % stage + ''.join('%12s' % ('-' if exponent is None else '%.2f' % exponent)
+                                        for exponent in exponents))
+
+
+def main(argv):
+    '''main'''
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--axes', nargs='+', default=list(AXES), choices=list(AXES))
+    parser.add_argument('--density', default='passive', choices=DENSITIES)
+    parser.add_argument('--repeats', type=int, default=1)
+    parser.add_argument('--output', help='json file of the results')
+    args = parser.parse_args(argv)
+
+    base_spec = SyntheticCellSpec(density=args.density)
+    results = run_scaling_benchmark(base_spec,
+                                    collections.OrderedDict((axis, AXES[axis])
+                                                            for axis in args.axes),
+                                    args.repeats)
+    print_exponents(results)
+    placement = sweep_placement(base_spec, repeats=args.repeats)
+    if args.output:
+        with open(args.output, 'w') as fd:
+            json.dump({'base_spec': base_spec._asdict(), 'axes': results,
+                       'placement': placement}, fd, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,123 @@
+'''Tests for reducing cells in worker processes and for the reduced cell specs'''
+import os
+import shutil
+import tempfile
+
+from neuron import h
+
+from neuron_reduce import instantiate_spec, iter_reduce, reduce_many
+from neuron_reduce.batch import reduce_job
+
+
+def test_reduce_many_isolates_failures(passive_job):
+    jobs = [passive_job,
+            passive_job._replace(name='missing', morphology_file='no_such_morphology.ASC'),
+            passive_job._replace(name='Test_1_freq_0', reduction_frequency=0),
+            ]
+    results = reduce_many(jobs, workers=2)
+
+    assert [r.name for r in results] == ['Test_1', 'missing', 'Test_1_freq_0']
+    assert results[1].spec is None and results[1].error
+
+    for result in (results[0], results[2]):
+        assert result.error is None
+        # every synapse in the file has a netcon
+        assert len(result.spec['netcons']) == 10000
+        assert 0 < len(result.spec['synapses']) < 10000
+
+
+def test_spec_round_trip(passive_job, new_sections_deleted):
+    spec = reduce_job(passive_job)
+    cell, synapses_list, netcons_list = instantiate_spec(spec)
+
+    assert len(synapses_list) == len(spec['synapses'])
+    assert len(netcons_list) == len(spec['netcons'])
+    for sec, section_spec in zip(cell.all, spec['sections']):
+        assert sec.nseg == section_spec['nseg']
+        assert abs(sec.L - section_spec['L']) < 1e-6
+    assert h.SectionRef(sec=cell.soma).nchild() == len(cell.dend) + (cell.apic is not None)
+
+
+def test_iter_reduce_deletes_cells(passive_job):
+    n_sections = len(list(h.allsec()))
+    jobs = [passive_job._replace(name='Test_1_%d' % i) for i in range(3)]
+    jobs.insert(1, passive_job._replace(name='missing', synapse_file='no_such_synapse_file'))
+
+    names = []
+    for result in iter_reduce(jobs):
+        names.append(result.name)
+        if result.name == 'missing':
+            assert result.error and result.spec is None
+        else:
+            assert result.error is None and len(result.spec['netcons']) == 10000
+            # only the reduced cell is alive
+            assert len(list(h.allsec())) == n_sections + len(result.spec['sections'])
+
+    assert names == ['Test_1_0', 'missing', 'Test_1_1', 'Test_1_2']
+    assert len(list(h.allsec())) == n_sections
+    assert h.List('Exp2Syn').count() == 0
+
+
+def test_failed_reduction_deletes_cell(passive_job):
+    n_sections = len(list(h.allsec()))
+    # fails in subtree_reductor, once the cell and its synapses are created
+    failing = passive_job._replace(name='failing', reduction_frequency='not a frequency')
+
+    try:
+        reduce_job(failing)
+        assert False, 'the reduction should have failed'
+    except TypeError:
+        pass
+    assert len(list(h.allsec())) == n_sections
+    assert h.List('Exp2Syn').count() == 0
+
+    names = []
+    for result in iter_reduce([failing, passive_job]):
+        names.append(result.name)
+        if result.name == 'failing':
+            assert result.error and result.spec is None
+            assert len(list(h.allsec())) == n_sections
+            assert h.List('Exp2Syn').count() == h.List('NetCon').count() == 0
+    assert names == ['failing', 'Test_1']
+
+
+def test_same_template_name_from_another_file(passive_job):
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        # another model file, with the same template name
+        other_model_file = os.path.join(tmp_dir, 'model.hoc')
+        shutil.copy(passive_job.model_file, other_model_file)
+        jobs = [passive_job,
+                passive_job._replace(name='other', model_file=other_model_file),
+                passive_job._replace(name='Test_1_again'),
+                ]
+        results = reduce_many(jobs, workers=1)
+    finally:
+        shutil.rmtree(tmp_dir)
+
+    assert results[0].error is None and results[2].error is None
+    assert results[1].spec is None
+    assert "ValueError: The template 'model' of %s is already loaded from %s" % (
+        os.path.realpath(other_model_file),
+        os.path.realpath(passive_job.model_file)) in results[1].error
+
+
+def test_model_hoc_after_another_template(passive_job):
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        # a model file whose template isn't named model: the reduced cells of its
+        # job must not define a model template
+        other_model_file = os.path.join(tmp_dir, 'other_cell.hoc')
+        with open(passive_job.model_file) as fd:
+            template = fd.read()
+        with open(other_model_file, 'w') as fd:
+            fd.write(template.replace('template model', 'template other_cell'))
+        jobs = [passive_job._replace(name='other', model_file=other_model_file),
+                passive_job,
+                ]
+        results = reduce_many(jobs, workers=1)
+    finally:
+        shutil.rmtree(tmp_dir)
+
+    assert [result.error for result in results] == [None, None]
+    assert results[0].spec == results[1].spec
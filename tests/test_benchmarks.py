@@ -0,0 +1,65 @@
+'''Tests of the benchmarks of run_benchmarks.py and run_scaling_benchmark.py'''
+import copy
+
+import pytest
+
+import run_benchmarks
+
+
+def test_run_and_compare_benchmarks():
+    results = run_benchmarks.run_benchmarks(['Test_1'], tstop=50)
+    result = results['models']['Test_1']
+    assert 'error' not in result, result.get('error')
+    assert result['reduced_nseg'] < result['full_nseg']
+    assert result['n_reduced_synapses'] < result['n_synapses']
+    assert result['speedup'] > 1
+    assert set(result['reduction']['stage_times']) >= {'subtree_reduction', 'synapse_merge'}
+    # neuron_reduce loads nothing into hoc when it is imported, so its import time is
+    # within the noise of the import time of neuron
+    assert set(results['import_times']) == set(run_benchmarks.IMPORTED_MODULES)
+    assert all(import_time > 0 for import_time in results['import_times'].values())
+
+    assert run_benchmarks.compare_results(results, results) == []
+
+    slower = copy.deepcopy(results)
+    slower['models']['Test_1']['reduction_time'] = 2 * result['reduction_time'] + 1
+    slower['models']['Test_1']['speedup'] = result['speedup'] / 2
+    regressions = run_benchmarks.compare_results(results, slower, threshold=0.2)
+    assert {(r.model, r.measure) for r in regressions} == {('Test_1', 'reduction_time'),
+                                                          ('Test_1', 'speedup')}
+    # improvements are not regressions
+    assert run_benchmarks.compare_results(slower, results, threshold=0.2) == []
+
+
+def test_compare_ignores_short_timings_and_failures():
+    def results(stage_time, error=False):
+        model = {'reduction_time': 1., 'peak_memory_mb': 100., 'reduced_simulation_time': 1.,
+                 'speedup': 10., 'reduction': {'stage_times': {'teardown': stage_time}}}
+        return {'models': {'cell': {'error': 'failed'} if error else model}}
+
+    assert run_benchmarks.compare_results(results(0.001), results(0.01)) == []
+    regression, = run_benchmarks.compare_results(results(0.1), results(0.2))
+    assert regression.measure == 'stage_time:teardown'
+    assert run_benchmarks.compare_results(results(0.1), results(0.2, error=True)) == []
+
+    baseline, slower = results(0.1), results(0.1)
+    baseline['import_times'] = {'neuron_reduce': 0.5}
+    slower['import_times'] = {'neuron_reduce': 1.}
+    regression, = run_benchmarks.compare_results(baseline, slower)
+    assert (regression.model, regression.measure) == ('import', 'import_time:neuron_reduce')
+
+
+def test_scaling_benchmark():
+    import run_scaling_benchmark
+    from neuron_reduce.synthetic import SyntheticCellSpec
+
+    results = run_scaling_benchmark.run_scaling_benchmark(SyntheticCellSpec(n_synapses=100),
+                                                          {'depth': (2, 3, 4)})
+    points = results['depth']['points']
+    assert [point['size'] for point in points] == [5 * 3 * 5, 5 * 7 * 5, 5 * 15 * 5]
+    assert results['depth']['exponents']['total_time'] is not None
+    assert run_scaling_benchmark.empirical_exponent([1, 10, 100], [2, 200, 20000]) == \
+        pytest.approx(2)
+
+    placement = run_scaling_benchmark.sweep_placement(SyntheticCellSpec(), (1000, 10000))
+    assert [point['size'] for point in placement['points']] == [1000, 10000]
@@ -0,0 +1,61 @@
+'''Test simulating a reduced cell with CoreNEURON'''
+import numpy as np
+import pytest
+from neuron import h
+
+from neuron_reduce import subtree_reductor
+from neuron_reduce.batch import create_cell
+from neuron_reduce.coreneuron_export import netcons_without_source, prepare_reduced_cell, psolve
+from neuron_reduce.synapse_locations import read_synapse_locations, section_of_location
+
+N_SYNAPSES = 2000
+GID = 0
+TSTOP = 300  # ms
+
+
+def test_neuron_and_coreneuron_traces_match(passive_job, hh_celsius, new_sections_deleted):
+    pytest.importorskip('neuron.coreneuron')
+
+    cell = create_cell(passive_job)
+    cell.soma[0].insert('hh')  # so that the cell spikes
+
+    synapses_list, netcons_list, netstims = [], [], []
+    for i, location in enumerate(read_synapse_locations(passive_job.synapse_file)[:N_SYNAPSES]):
+        synapse = h.Exp2Syn(location.x, sec=section_of_location(cell, location))
+        netstim = h.NetStim()
+        netstim.start, netstim.interval, netstim.number, netstim.noise = 5 + i % 50, 20, 20, 0
+        netcon = h.NetCon(netstim, synapse)
+        netcon.weight[0] = 0.0005
+        synapses_list.append(synapse)
+        netstims.append(netstim)
+        netcons_list.append(netcon)
+
+    reduced_cell, synapses_list, netcons_list = subtree_reductor(cell, synapses_list, netcons_list,
+                                                                 passive_job.reduction_frequency)
+    assert len(synapses_list) < N_SYNAPSES  # some were merged
+
+    pc = h.ParallelContext()
+    prepared = prepare_reduced_cell(pc, GID, reduced_cell, synapses_list, netcons_list)
+    assert prepared.spike_detector is not None
+    assert not netcons_without_source(netcons_list)
+    assert netcons_without_source([h.NetCon(None, synapses_list[0])])
+
+    iclamp = h.IClamp(0.5, sec=reduced_cell.soma[0])
+    iclamp.delay, iclamp.dur, iclamp.amp = 100, 150, 3.
+
+    try:
+        h.dt = 0.025
+        traces, spikes = [], []
+        for use_coreneuron in (False, True):
+            v, spike_times, spike_gids = h.Vector(), h.Vector(), h.Vector()
+            v.record(reduced_cell.soma[0](0.5)._ref_v)
+            pc.spike_record(GID, spike_times, spike_gids)
+            psolve(pc, TSTOP, use_coreneuron)
+            traces.append(np.array(v))
+            spikes.append(np.array(spike_times))
+    finally:
+        pc.gid_clear()
+
+    assert spikes[0].size > 0
+    assert np.allclose(spikes[0], spikes[1])
+    assert np.allclose(traces[0], traces[1], atol=1e-6)
@@ -0,0 +1,43 @@
+'''Test simulating many copies of a reduced cell, of ensemble.py'''
+import numpy as np
+from neuron import h
+
+from neuron_reduce.batch import reduce_job
+from neuron_reduce.ensemble import ENSEMBLE_CONFIG, build_ensemble, run_ensemble
+
+N_COPIES = 4
+TSTOP = 100  # ms
+
+
+def test_ensemble(passive_job, new_sections_deleted):
+    spec = reduce_job(passive_job)
+    setup_calls = []
+
+    def setup(copy_index, cell, synapses_list, netcons_list):
+        setup_calls.append(copy_index)
+        assert len(netcons_list) == len(spec['netcons'])
+
+    ensemble = build_ensemble(spec, N_COPIES, setup=setup)
+    assert setup_calls == list(range(N_COPIES))
+    try:
+        result = run_ensemble(ensemble, TSTOP, seed=1, config=ENSEMBLE_CONFIG._replace(nthread=1))
+        assert result.v.shape == (N_COPIES, len(result.t))
+        assert np.isclose(result.t[-1], TSTOP)
+        assert len(result.spike_times) == N_COPIES
+
+        # independent inputs
+        for i in range(1, N_COPIES):
+            assert not np.allclose(result.v[0], result.v[i])
+
+        # the same, in threads
+        threaded = run_ensemble(ensemble, TSTOP, seed=1,
+                                config=ENSEMBLE_CONFIG._replace(nthread=2))
+        assert np.allclose(threaded.v, result.v)
+
+        other_seed = run_ensemble(ensemble, TSTOP, seed=2,
+                                  config=ENSEMBLE_CONFIG._replace(nthread=1),
+                                  record_dt=1.)
+        assert other_seed.v.shape == (N_COPIES, TSTOP + 1)
+        assert not np.allclose(other_seed.v, result.v[:, ::40])
+    finally:
+        h.ParallelContext().nthread(1)
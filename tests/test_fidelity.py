@@ -0,0 +1,26 @@
+'''Tests for the simulation-free fidelity report of a reduction'''
+import numpy as np
+from neuron import h
+
+from neuron_reduce.fidelity import (fidelity_report, measure_impedances,
+                                    reduce_with_fidelity_report, summarize_report)
+
+
+def test_fidelity_report(passive_job, passive_cell):
+    h.celsius = passive_job.celsius
+    frequencies = (0, passive_job.reduction_frequency, 200)
+    cell, synapses_list, netcons_list = passive_cell()
+
+    original = measure_impedances(cell.soma[0](0.5), netcons_list, frequencies)
+    assert original.transfer.shape == (len(frequencies), len(netcons_list))
+    summary = summarize_report(fidelity_report(original, original))
+    assert summary['max_input_magnitude_error'] == 0
+    assert summary['max_transfer_magnitude_error'] == 0
+
+    _, _, _, report = reduce_with_fidelity_report(cell, synapses_list, netcons_list,
+                                                  passive_job.reduction_frequency, frequencies)
+    # the reduction keeps the impedances at the reduction frequency
+    assert report.input_magnitude_error[1] < 0.01
+    assert np.median(report.transfer_magnitude_error[1]) < 0.1
+    assert report.input_magnitude_error[1] < report.input_magnitude_error[2]
+    assert summarize_report(report)['n_synapses'] == len(netcons_list)
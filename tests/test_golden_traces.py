@@ -0,0 +1,47 @@
+'''Tests of the golden voltage traces of golden_traces.py'''
+import os
+
+import numpy as np
+
+import golden_traces
+
+HEADER = ('This file represents the control and reduced voltage vectors for the following '
+          'parameters: frequency = 38 Hz, synapse file = synapses , EXCITATORY_E_SYN = 0 mV, '
+          'EXCITATORY_STIMULI_INTERVAL = 1000 ms EXCITATORY_STIMULI_NUMBER = 15, dt = 0.1')
+
+
+def test_write_and_load_golden_traces(tmpdir):
+    trace_file = str(tmpdir.join('traces.npy'))
+    control, reduced = np.linspace(-70, -60, 100), np.linspace(-70, -65, 100)
+    golden_traces.write_golden_traces(trace_file, control, reduced, HEADER, {'frequency': 38})
+
+    loaded_control, loaded_reduced = golden_traces.load_golden_traces(trace_file, 100)
+    assert isinstance(loaded_control, np.memmap)
+    assert np.array_equal(loaded_control, control)
+    assert np.array_equal(loaded_reduced, reduced)
+    assert golden_traces.load_golden_metadata(trace_file) == {'header': HEADER,
+                                                              'parameters': {'frequency': 38}}
+
+
+def test_convert_text_traces(tmpdir):
+    text_file = str(tmpdir.join('voltage_vectors_for_unit_test.txt'))
+    voltages = [-70.0, -69.12345678901234, -65.5, -70.0, -69.5, -1e-17]
+    with open(text_file, 'w') as fd:
+        fd.write(HEADER + '\n')
+        fd.write(''.join(repr(v) + '\n' for v in voltages))
+
+    trace_file = golden_traces.convert_text_traces(text_file)
+    assert trace_file == os.path.splitext(text_file)[0] + '.npy'
+    control, reduced = golden_traces.load_golden_traces(trace_file, 3)
+    assert list(control) == voltages[:3]
+    assert list(reduced) == voltages[3:]
+
+    metadata = golden_traces.load_golden_metadata(trace_file)
+    assert metadata['header'] == HEADER
+    assert metadata['parameters'] == {'frequency': '38 Hz',
+                                      'synapse file': 'synapses',
+                                      'EXCITATORY_E_SYN': '0 mV',
+                                      'EXCITATORY_STIMULI_INTERVAL': '1000 ms',
+                                      'EXCITATORY_STIMULI_NUMBER': '15',
+                                      'dt': '0.1',
+                                      }
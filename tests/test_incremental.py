@@ -0,0 +1,49 @@
+'''Test the incremental update of the mechanisms of incremental.py'''
+import numpy as np
+
+from neuron_reduce import subtree_reductor
+from neuron_reduce.incremental import IncrementalReduction, OriginalSegment
+from neuron_reduce.synthetic import SyntheticCellSpec, create_synthetic_cell_with_synapses
+
+SPEC = SyntheticCellSpec(n_trees=3, depth=3, density='graded', n_synapses=100)
+
+
+def _cell_with_scaled_sodium(scale):
+    cell, synapses_list, netcons_list = create_synthetic_cell_with_synapses(SPEC)
+    for section in cell.all:
+        for seg in section:
+            if hasattr(seg, 'gnabar_hh'):
+                seg.gnabar_hh *= scale
+    return cell, synapses_list, netcons_list
+
+
+def _reduced_dendrites(reduced_cell):
+    return [reduced_cell.apic] + list(reduced_cell.hoc_model.basal)
+
+
+def test_update_from_cell(hh_celsius):
+    reduction = IncrementalReduction(*(_cell_with_scaled_sodium(1.) + (38, )))
+    full_cell, _, _ = _cell_with_scaled_sodium(3.)
+    reduction.update_from_cell(full_cell)
+
+    # the same as reducing a cell with the new conductances
+    reduced_cell, _, _ = subtree_reductor(*(_cell_with_scaled_sodium(3.) + (38, )))
+    updated = [seg.gnabar_hh
+               for section in _reduced_dendrites(reduction.reduced_cell) for seg in section]
+    expected = [seg.gnabar_hh for section in _reduced_dendrites(reduced_cell) for seg in section]
+    assert updated == expected
+
+
+def test_update_mechanisms(hh_celsius):
+    reduction = IncrementalReduction(*(_cell_with_scaled_sodium(1.) + (38, )))
+    key = OriginalSegment('apic[0]', 0.1)
+    assert key in reduction.mech_vals
+    reduced_seg = reduction.original_seg_to_reduced_seg[key]
+    before = reduced_seg.gnabar_hh
+
+    reduction.update_mechanisms({key: {'hh': {'gnabar_hh': 10.}}})
+    originals = reduction.reduced_seg_to_original_seg[reduced_seg]
+    assert reduced_seg.gnabar_hh > before
+    assert np.isclose(reduced_seg.gnabar_hh,
+                      np.mean([reduction.mech_vals[original]['hh']['gnabar_hh']
+                               for original in originals]))
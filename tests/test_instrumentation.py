@@ -0,0 +1,63 @@
+'''Test the profile of the stages of a reduction'''
+import json
+import time
+
+import numpy as np
+import pytest
+
+from neuron_reduce import iter_reduce, subtree_reductor
+from neuron_reduce.instrumentation import (STAGES, ReductionProfile, current_memory_mb,
+                                          profiled)
+
+
+def test_reduction_profile(passive_job, passive_cell):
+    cell, synapses_list, netcons_list = passive_cell()
+    n_subtrees = len(cell.soma[0].children())
+
+    profile = ReductionProfile()
+    _, new_synapses_list, _ = subtree_reductor(cell, synapses_list, netcons_list,
+                                               passive_job.reduction_frequency,
+                                               profile=profile)
+    assert list(profile.stage_times) == list(STAGES)
+    assert sum(profile.stage_times.values()) <= profile.total_time
+    counters = profile.counters
+    assert counters['impedance_computes'] == n_subtrees
+    # at least the search of the length of each cable, and of every synapse location
+    assert counters['bisection_iterations'] > n_subtrees + len(synapses_list)
+    assert counters['hoc_calls'] > 0
+    assert counters['synapses_placed'] == len(new_synapses_list)
+    assert counters['synapses_placed'] + counters['synapses_merged'] == len(synapses_list)
+    assert counters['orphan_segments'] >= 0
+    assert profile.peak_memory_mb > 0
+
+    assert json.loads(json.dumps(profile.as_dict())) == profile.as_dict()
+
+
+def test_iter_reduce_profiles(passive_job):
+    result, = list(iter_reduce([passive_job], profile=True))
+    assert result.error is None
+    assert set(result.profile['stage_times']) == set(STAGES)
+    assert result.profile['counters']['synapses_placed'] == len(result.spec['synapses'])
+
+    result, = list(iter_reduce([passive_job]))
+    assert result.profile is None
+
+
+@profiled
+def _allocate(size_mb, profile=None):
+    '''holds size_mb of memory for a while'''
+    block = np.ones(int(size_mb * 1024 ** 2 / 8))
+    time.sleep(0.1)
+    return block.sum()
+
+
+def test_peak_memory_of_each_call():
+    if current_memory_mb() is None:
+        pytest.skip('the current memory of the process is unknown')
+    large, small = ReductionProfile(), ReductionProfile()
+    _allocate(200, profile=large)
+    _allocate(100, profile=small)
+
+    # the peak of the small call, not the one of the process
+    assert 90 < small.peak_memory_increase_mb < large.peak_memory_increase_mb
+    assert small.peak_memory_mb < large.peak_memory_mb
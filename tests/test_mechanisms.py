@@ -0,0 +1,66 @@
+'''Test the compiled mechanisms cache of mechanisms.py'''
+import os
+import shutil
+import tempfile
+
+from neuron_reduce.mechanisms import compile_mechanisms, mod_files_hash
+
+MOD_FILE = '''NEURON {
+    SUFFIX leak_for_test
+    NONSPECIFIC_CURRENT i
+    RANGE g, e
+}
+PARAMETER {
+    g = 0.001 (S/cm2)
+    e = -70 (mV)
+}
+ASSIGNED {
+    v (mV)
+    i (mA/cm2)
+}
+BREAKPOINT {
+    i = g * (v - e)
+}
+'''
+
+
+def test_compile_mechanisms_once():
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        mod_dir = os.path.join(tmp_dir, 'mod')
+        cache = os.path.join(tmp_dir, 'cache')
+        os.makedirs(mod_dir)
+        with open(os.path.join(mod_dir, 'leak_for_test.mod'), 'w') as fd:
+            fd.write(MOD_FILE)
+
+        library = compile_mechanisms(mod_dir, cache)
+        assert os.path.exists(library)
+        assert library.startswith(os.path.join(cache, mod_files_hash(mod_dir)))
+        mtime = os.path.getmtime(library)
+
+        # the second time, the cached library is reused
+        assert compile_mechanisms(mod_dir, cache) == library
+        assert os.path.getmtime(library) == mtime
+        assert os.listdir(cache) == [mod_files_hash(mod_dir)]
+
+        # another directory with the same mod files uses the same library
+        other_mod_dir = os.path.join(tmp_dir, 'other_mod')
+        shutil.copytree(mod_dir, other_mod_dir)
+        assert compile_mechanisms(other_mod_dir, cache) == library
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def test_mod_files_hash():
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        with open(os.path.join(tmp_dir, 'leak_for_test.mod'), 'w') as fd:
+            fd.write(MOD_FILE)
+        before = mod_files_hash(tmp_dir)
+        assert mod_files_hash(tmp_dir) == before
+
+        with open(os.path.join(tmp_dir, 'leak_for_test.mod'), 'w') as fd:
+            fd.write(MOD_FILE.replace('0.001', '0.002'))
+        assert mod_files_hash(tmp_dir) != before
+    finally:
+        shutil.rmtree(tmp_dir)
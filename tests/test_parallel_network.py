@@ -0,0 +1,112 @@
+'''Test reducing a network that is distributed over MPI ranks
+
+The test runs this file with mpiexec; every rank builds, reduces and simulates
+its part of a ring of cells, where each cell excites the previous one through
+NetCons created with pc.gid_connect().  The ring is only closed if these
+NetCons survive the reduction and synapse merging.
+'''
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+from neuron import h
+
+from conftest import TEST_1_JOB
+from neuron_reduce.batch import create_cell
+from neuron_reduce.parallel_network import reduce_rank_cells, register_spike_source
+from neuron_reduce.synapse_locations import read_synapse_locations, section_of_location
+
+N_CELLS = 4
+N_RANKS = 2
+SYNAPSES_PER_CONNECTION = 300
+WEIGHT = 0.01  # uS
+TSTOP = 200  # ms
+
+
+def build_ring(pc):
+    '''creates the cells of this rank, each cell gets synapses from the next gid
+
+    the spike sources are registered on the somata of the full cells, which are
+    kept as the somata of the reduced cells
+    '''
+    job = TEST_1_JOB._replace(reduction_frequency=0)
+    locations = read_synapse_locations(job.synapse_file)
+
+    gids = range(int(pc.id()), N_CELLS, int(pc.nhost()))
+    cells = {}
+    for gid in gids:
+        cell = create_cell(job)
+        cell.soma[0].insert('hh')  # so that the cells spike
+        # output gids have to be set before they are used as inputs
+        register_spike_source(pc, gid, cell)
+        cells[gid] = cell
+
+    for gid in gids:
+        cell = cells[gid]
+
+        synapses_list, netcons_list = [], []
+        for location in locations[gid::N_CELLS][:SYNAPSES_PER_CONNECTION]:
+            synapse = h.Exp2Syn(location.x, sec=section_of_location(cell, location))
+            synapses_list.append(synapse)
+            netcon = pc.gid_connect((gid + 1) % N_CELLS, synapse)
+            netcon.weight[0] = WEIGHT
+            netcon.delay = 5
+            netcons_list.append(netcon)
+        cells[gid] = (cell, synapses_list, netcons_list)
+    return cells
+
+
+def run_ring():
+    '''run on every rank, returns the spike counts of all the gids on rank 0 (None on others)'''
+    h.nrnmpi_init()
+
+    pc = h.ParallelContext()
+    h.load_file('stdrun.hoc')
+    h.celsius = 37
+
+    reduced_cells, reports = reduce_rank_cells(pc, build_ring(pc), reduction_frequency=0)
+    assert [report.rank for report in reports] == list(range(int(pc.nhost())))
+    assert sum(report.n_cells for report in reports) == N_CELLS
+
+    # kick the ring
+    iclamp = None
+    if 0 in reduced_cells:
+        iclamp = h.IClamp(0.5, sec=reduced_cells[0][0].soma[0])
+        iclamp.delay, iclamp.dur, iclamp.amp = 10, 5, 20
+
+    spike_times, spike_gids = h.Vector(), h.Vector()
+    pc.spike_record(-1, spike_times, spike_gids)
+    pc.set_maxstep(10)
+    h.v_init = -65
+    h.stdinit()
+    pc.psolve(TSTOP)
+
+    all_gids = [int(gid) for rank_gids in pc.py_allgather(list(spike_gids)) for gid in rank_gids]
+    pc.barrier()
+    pc.done()
+    return {gid: all_gids.count(gid) for gid in range(N_CELLS)} if pc.id() == 0 else None
+
+
+def test_reduce_ring_with_mpi():
+    mpiexec = shutil.which('mpiexec') or shutil.which('mpirun')
+    if mpiexec is None:
+        pytest.skip('mpiexec is not available')
+
+    env = dict(os.environ,
+               OMPI_ALLOW_RUN_AS_ROOT='1',
+               OMPI_ALLOW_RUN_AS_ROOT_CONFIRM='1',
+               OMPI_MCA_rmaps_base_oversubscribe='1')
+    args = [mpiexec, '-n', str(N_RANKS), sys.executable, os.path.abspath(__file__)]
+    assert subprocess.call(args, env=env) == 0
+
+
+if __name__ == '__main__':
+    counts = run_ring()
+    exit_code = 0
+    if counts is not None:
+        print('spikes per gid', counts)
+        # every cell in the ring fired, so the NetCons between the ranks are valid
+        exit_code = int(not all(counts.values()))
+    h.quit(exit_code)  # finalizes MPI
@@ -0,0 +1,30 @@
+'''Tests of the parallel regression test runner of run_regression_tests.py'''
+import run_regression_tests
+from run_all_tests import RUNS
+
+
+def test_schedule_longest_first():
+    names = ['test3_a71075_passive', 'test1_38', 'test5_Hay_2011_active_dendrite']
+    assert run_regression_tests.schedule(names) == ['test5_Hay_2011_active_dendrite',
+                                                    'test1_38',
+                                                    'test3_a71075_passive']
+    assert run_regression_tests.schedule(names, {'test3_a71075_passive': 100}) == [
+        'test3_a71075_passive', 'test5_Hay_2011_active_dendrite', 'test1_38']
+    # runs without an expected duration first
+    assert run_regression_tests.schedule(['test1_38', 'unknown']) == ['unknown', 'test1_38']
+    assert set(run_regression_tests.EXPECTED_DURATIONS) == set(RUNS)
+
+
+def test_run_regression_tests():
+    results = run_regression_tests.run_regression_tests(['test1_38', 'test1_200'], workers=2)
+    assert [result.name for result in results] == ['test1_38', 'test1_200']
+    for result in results:
+        assert result.status in ('passed', 'failed'), result.output_tail
+        assert result.rmsd is not None and result.rmsd < 1
+        assert 0 < result.reduction_time < result.duration
+
+
+def test_run_timeout():
+    result = run_regression_tests.run_one('test1_38', timeout=0.5)
+    assert result.status == 'timeout'
+    assert result.rmsd is None
@@ -35,18 +35,23 @@
 '''
 from __future__ import print_function
 
-from collections import namedtuple
 from contextlib import contextmanager
 import sys
 import random
 import os
 import logging
-import subprocess
+import json
+from timeit import default_timer as timer
 from neuron import h
 import numpy as np
 import matplotlib.pyplot as plt
 
 from neuron_reduce import subtree_reductor
+from neuron_reduce.mechanisms import load_compiled_mechanisms
+from neuron_reduce.synapse_locations import load_synapse_location_arrays, sections_of_locations
+from neuron_reduce.synapse_placement import place_synapses, placement_locations, placement_segments
+
+from golden_traces import load_golden_traces, write_golden_traces
 
 logging.basicConfig(level=os.environ.get("LOGLEVEL", "DEBUG"))
 
@@ -190,9 +195,6 @@ def create_model(morphology_file, model_obj_name, instance_name, create_type):
     return getattr(h, instance_name)
 
 
-SynapseLocation = namedtuple('SynapseLocation', 'type, section_num, x')
-
-
 def create_synapses(cell_instance,
                     synapse_file,
                     seed_for_random_synapse_classification=SEED_FOR_RANDOM_SYNAPSE_CLASSIFICATION,
@@ -205,19 +207,8 @@ def create_synapses(cell_instance,
 
     TODO: Supports two types of synapses, to support more types CODE CHANGES are required
     '''
-    synapses = []
-    with open(synapse_file) as fd:
-        for line in fd:
-            line = line.strip()
-            if not line:
-                continue
-
-            # extracting the synapse location
-            line_content = line.strip("[,]").split(",")
-            type_ = line_content[0].strip()
-            section_num = int(line_content[1].strip())
-            x = float(line_content[2].strip())  # synapse's relative location in the section
-            synapses.append(SynapseLocation(type_, section_num, x))
+    # the synapse locations, in a text or binary synapse locations file
+    locations = load_synapse_location_arrays(synapse_file)
 
     synapses_list, netstims_list, netcons_list, randoms_list = [], [], [], []
     num_of_inhibitory_syns = num_of_excitatory_syns = 0
@@ -226,17 +217,9 @@ def create_synapses(cell_instance,
     rand = random.Random(seed_for_random_synapse_classification).random
 
     # iterates over synapse locations file and creates synapses, NetStims and NetCons
-    for i, synapse in enumerate(synapses):
-        if synapse.type == 'apical':
-            cell_instance.apic[synapse.section_num].push()
-        elif synapse.type == 'somatic':
-            cell_instance.soma[0].push()
-        else:  # for synapses on basal subtrees
-            cell_instance.dend[synapse.section_num].push()
-
-        synapse = h.Exp2Syn(synapse.x)
-
-        h.pop_section()
+    for i, (section, x) in enumerate(zip(sections_of_locations(cell_instance, locations),
+                                         locations.xs.tolist())):
+        synapse = h.Exp2Syn(section(x))
 
         # This code should be changed in order to enable more synaptic types:
         # randomly classifies the synapse as excitatory or inhibitory
@@ -283,43 +266,12 @@ def create_synapses(cell_instance,
 
 
 def generate_random_synapses_locations(cell, syn_filename, num_syns=10000, seed=2):
-    basal_L = 0
-    tot_L = 0
-    syn_L = []
-    random_obj = random.Random(seed)
-
-    for sec in cell.basal:
-        basal_L += sec.L
-        tot_L += sec.L
-
-    for sec in cell.apical:
-        tot_L += sec.L
-
-    for _ in range(num_syns):
-        L_counter = 0
-        x_L = random_obj.uniform(0, tot_L)
-        if x_L < basal_L:
-            for ix, sec in enumerate(list(cell.basal)):
-                if L_counter + sec.L > x_L:
-                    x = (x_L - L_counter) / sec.L
-                    syn_L.append(["basal", ix, x])
-                    break
-                else:
-                    L_counter += sec.L
-        else:
-            x_L -= basal_L
-            for ix, sec in enumerate(list(cell.apical)):
-                if L_counter + sec.L > x_L:
-                    x = (x_L - L_counter) / sec.L
-                    syn_L.append(["apical", ix, x])
-                    break
-                else:
-                    L_counter += sec.L
+    placement = place_synapses(placement_segments(cell), num_syns, seed=seed)
 
     print(syn_filename)
     with open(syn_filename, 'w') as f:
-        for syn in syn_L:
-            f.write("[%s,%s,%s]\n" % (syn[0], syn[1], syn[2]))
+        for location in placement_locations(placement):
+            f.write("[%s,%s,%s]\n" % (location.type, location.section_num, location.x))
 
 
 def loadtemplate(template_file):
@@ -343,49 +295,70 @@ def change_cell_location(soma, offset=150):
                      h.diam3d(i))
 
 
+def simulation_parameters(reduction_frequency, synapse_file):
+    '''the parameters of the simulation of the test vectors'''
+    return {'frequency': reduction_frequency,
+            'synapse_file': synapse_file,
+            'synapse_params': SYNAPSE_PARAMS,
+            'stimuli_noise': STIMULI_NOISE,
+            'weight': WEIGHT,
+            'iclamp_params': ICLAMP_PARAMS,
+            'sim_params': SIM_PARAMS,
+            'spike_begin_time': SPIKE_BEGIN_TIME,
+            }
+
+
 def write_test_vectors(voltage_file,
                        reduction_frequency, synapse_file,
                        recording_vec_control, recording_vec_reduced):
     '''
-    The two vectors are printed consecutively without extra spaces, first the
-    control vector and after it the reduced vector. Each voltage value of the
-    vector is in a new line.
+    If voltage_file is a .npy file, the vectors are written as golden traces
+    (see golden_traces.py).  Otherwise, the two vectors are printed
+    consecutively without extra spaces, first the control vector and after it
+    the reduced vector. Each voltage value of the vector is in a new line.
     '''
+    header = ("This file represents the control and reduced voltage vectors "
+              "for the following parameters: "
+              "frequency = {REDUCTION_FREQUENCY} Hz, "
+              "synapse file = {SYNAPSE_FILE} , "
+              "EXCITATORY_E_SYN = {EXCITATORY_E_SYN} mV, "
+              "EXCITATORY_TAU_1 = {EXCITATORY_TAU_1} ms, "
+              "EXCITATORY_TAU_2 = {EXCITATORY_TAU_2} ms, "
+              "EXCITATORY_STIMULI_INTERVAL = {EXCITATORY_STIMULI_INTERVAL} ms "
+              "EXCITATORY_STIMULI_NUMBER = {EXCITATORY_STIMULI_NUMBER}, "
+              "STIMULI_NOISE = {STIMULI_NOISE}, "
+              "weight = {WEIGHT} microSiemens, "
+              "ICLAMP_AMPLITUDE = {ICLAMP_AMPLITUDE} nA, "
+              "ICLAMP_DELAY = {ICLAMP_DELAY} ms, "
+              "ICLAMP_DURATION = {ICLAMP_DURATION} ms, "
+              "tstop = {TSTOP} ms, "
+              "dt = {DT}, "
+              "SPIKE_BEGIN_TIME = {SPIKE_BEGIN_TIME}ms".format(
+                  REDUCTION_FREQUENCY=reduction_frequency,
+                  SYNAPSE_FILE=synapse_file,
+                  EXCITATORY_E_SYN=SYNAPSE_PARAMS['excitatory']['e_syn'],
+                  EXCITATORY_TAU_1=SYNAPSE_PARAMS['excitatory']['tau_1'],
+                  EXCITATORY_TAU_2=SYNAPSE_PARAMS['excitatory']['tau_2'],
+                  EXCITATORY_STIMULI_INTERVAL=EXCITATORY_STIMULI_INTERVAL,
+                  EXCITATORY_STIMULI_NUMBER=EXCITATORY_STIMULI_NUMBER,
+                  STIMULI_NOISE=STIMULI_NOISE,
+                  WEIGHT=WEIGHT,
+                  ICLAMP_AMPLITUDE=ICLAMP_PARAMS['amplitude'],
+                  ICLAMP_DELAY=ICLAMP_PARAMS['delay'],
+                  ICLAMP_DURATION=ICLAMP_PARAMS['duration'],
+                  TSTOP=SIM_PARAMS['tstop'],
+                  DT=SIM_PARAMS['dt'],
+                  SPIKE_BEGIN_TIME=SPIKE_BEGIN_TIME,
+              ))
+
+    if voltage_file.endswith('.npy'):
+        write_golden_traces(voltage_file,
+                            recording_vec_control.as_numpy(), recording_vec_reduced.as_numpy(),
+                            header, simulation_parameters(reduction_frequency, synapse_file))
+        return
 
     with open(voltage_file, 'w') as fd:
-        fd.write("This file represents the control and reduced voltage vectors "
-                 "for the following parameters: "
-                 "frequency = {REDUCTION_FREQUENCY} Hz, "
-                 "synapse file = {SYNAPSE_FILE} , "
-                 "EXCITATORY_E_SYN = {EXCITATORY_E_SYN} mV, "
-                 "EXCITATORY_TAU_1 = {EXCITATORY_TAU_1} ms, "
-                 "EXCITATORY_TAU_2 = {EXCITATORY_TAU_2} ms, "
-                 "EXCITATORY_STIMULI_INTERVAL = {EXCITATORY_STIMULI_INTERVAL} ms "
-                 "EXCITATORY_STIMULI_NUMBER = {EXCITATORY_STIMULI_NUMBER}, "
-                 "STIMULI_NOISE = {STIMULI_NOISE}, "
-                 "weight = {WEIGHT} microSiemens, "
-                 "ICLAMP_AMPLITUDE = {ICLAMP_AMPLITUDE} nA, "
-                 "ICLAMP_DELAY = {ICLAMP_DELAY} ms, "
-                 "ICLAMP_DURATION = {ICLAMP_DURATION} ms, "
-                 "tstop = {TSTOP} ms, "
-                 "dt = {DT}, "
-                 "SPIKE_BEGIN_TIME = {SPIKE_BEGIN_TIME}ms\n".format(
-                     REDUCTION_FREQUENCY=reduction_frequency,
-                     SYNAPSE_FILE=synapse_file,
-                     EXCITATORY_E_SYN=SYNAPSE_PARAMS['excitatory']['e_syn'],
-                     EXCITATORY_TAU_1=SYNAPSE_PARAMS['excitatory']['tau_1'],
-                     EXCITATORY_TAU_2=SYNAPSE_PARAMS['excitatory']['tau_2'],
-                     EXCITATORY_STIMULI_INTERVAL=EXCITATORY_STIMULI_INTERVAL,
-                     EXCITATORY_STIMULI_NUMBER=EXCITATORY_STIMULI_NUMBER,
-                     STIMULI_NOISE=STIMULI_NOISE,
-                     WEIGHT=WEIGHT,
-                     ICLAMP_AMPLITUDE=ICLAMP_PARAMS['amplitude'],
-                     ICLAMP_DELAY=ICLAMP_PARAMS['delay'],
-                     ICLAMP_DURATION=ICLAMP_PARAMS['duration'],
-                     TSTOP=SIM_PARAMS['tstop'],
-                     DT=SIM_PARAMS['dt'],
-                     SPIKE_BEGIN_TIME=SPIKE_BEGIN_TIME,
-                 ))
+        fd.write(header + "\n")
         for i in range(int(recording_vec_control.size())):
             fd.write(repr(recording_vec_control.x[i]) + "\n")
         for i in range(int(recording_vec_reduced.size())):
@@ -393,7 +366,13 @@ def write_test_vectors(voltage_file,
 
 
 def load_voltages(voltage_file, number_of_recordings):
-    '''load_voltages'''
+    '''load_voltages
+
+    the voltages of a .npy file (see golden_traces.py) are memory mapped
+    '''
+    if voltage_file.endswith('.npy'):
+        return load_golden_traces(voltage_file, number_of_recordings)
+
     with open(voltage_file) as fd:
         fd.readline()   # skips first line with the simulation configuration details
         voltages = [float(v) for v in fd]
@@ -423,9 +402,13 @@ def run_test(morphology_file,
              write_unit_test_vectors,
              plot_voltages,
              create_type,
-             celsius):
+             celsius,
+             results_file=None):
     '''Run a test reduction
 
+    results_file: if given, the results (whether it passed, the rmsds and
+    timings) are written to it as json
+
     Note: This must be run from a new python instance so that neuron is reset
     '''
     h.celsius = celsius  # needs to be set for reduction to work properly
@@ -442,18 +425,9 @@ def run_test(morphology_file,
     print('vvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvv\n\n')
 
     if create_type in ('almog', 'hay', 'bbpnew', 'bbpactive', 'allen', 'human'):
-        with chdir(model_file[:model_file.rindex('/')]):
-            process = subprocess.Popen(['nrnivmodl', 'mod'],
-                                       stdout=subprocess.PIPE,
-                                       stderr=subprocess.PIPE)
-            print('compiling mod files')
-            stdout, stderr = process.communicate()
-            #print(stdout)
-            #print(stderr)
-            h.nrn_load_dll("x86_64/.libs/libnrnmech.so.0")
-            h.nrn_load_dll("x86_64/.libs/libnrnmech.0.so")
-            h.nrn_load_dll("x86_64/.libs/libnrnmech.so")
-            
+        # compiled once per set of mod files, see neuron_reduce/mechanisms.py
+        print('loading compiled mod files')
+        load_compiled_mechanisms(os.path.join(model_file[:model_file.rindex('/')], 'mod'))
 
     if create_type == 'hay':
         loadtemplate(model_file[:model_file.rindex('/')] + '/L5PCbiophys3.hoc')
@@ -475,12 +449,14 @@ def run_test(morphology_file,
     # simulates control and reduced cell instances together
     synapses_list, netstims_list, netcons_list, random_list = \
         create_synapses(original_cell, synapse_file)
+    start = timer()
     reduced_cell, synapses_list, netcons_list = subtree_reductor(original_cell,
                                                                  synapses_list,
                                                                  netcons_list,
                                                                  reduction_frequency,
                                                                  model_file_reduced,
                                                                  manual_total_nsegs)
+    reduction_time = timer() - start
 
     if control_cell.soma.hname()[-1] == ']':
         control_soma = control_cell.soma[0]
@@ -506,7 +482,9 @@ def run_test(morphology_file,
     recording_vec_control.record(control_soma(.5)._ref_v)
 
     print('Running simulations, temperature is ' + str(celsius) + 'c')
+    start = timer()
     h.run()
+    simulation_time = timer() - start
 
     # for debugging, it helps if the two cells don't overlap
     change_cell_location(control_soma)
@@ -564,6 +542,17 @@ def run_test(morphology_file,
                     rmsd_new, rmsd_old, rmsd_two_reduced_vecs,
                     np_recording_vec_control, np_orig_recording_vec_control)
     print('--------------------------------------- END -----------------------------------')
+    if results_file is not None:
+        with open(results_file, 'w') as fd:
+            json.dump({'passed': bool(control_vecs_equal and reduced_vecs_equal),
+                       'control_vecs_equal': bool(control_vecs_equal),
+                       'reduced_vecs_equal': bool(reduced_vecs_equal),
+                       'rmsd': float(rmsd_new),
+                       'unit_test_rmsd': float(rmsd_old),
+                       'rmsd_to_unit_test': float(rmsd_two_reduced_vecs),
+                       'reduction_time': reduction_time,
+                       'simulation_time': simulation_time,
+                       }, fd, indent=2)
     return control_vecs_equal and reduced_vecs_equal
 
 
@@ -577,7 +566,8 @@ def main(argv):
     '''main'''
     orig_morphology_file = argv[1]
     orig_model_file = argv[2]
-    reduced_model_file = argv[3]
+    # None for the default template of the reduced cells
+    reduced_model_file = None if argv[3] == 'None' else argv[3]
     frequency = float(argv[4])
     manual_total_nsegs = int(argv[5])
     synapse_file = argv[6]
@@ -586,6 +576,7 @@ def main(argv):
     plot_voltages = str_to_bool(argv[9])
     create_type = argv[10]
     celsius = float(argv[11])
+    results_file = argv[12] if len(argv) > 12 else None
     return run_test(orig_morphology_file,
                     orig_model_file,
                     reduced_model_file,
@@ -596,7 +587,8 @@ def main(argv):
                     write_unit_test_vectors,
                     plot_voltages,
                     create_type,
-                    celsius)
+                    celsius,
+                    results_file)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,42 @@
+'''Test the segment mapping arrays of segment_mapping.py'''
+import numpy as np
+
+from neuron_reduce import subtree_reductor
+from neuron_reduce.segment_mapping import averaging_matrix, reduced_segment_offsets, section_name
+from neuron_reduce.synthetic import SyntheticCellSpec, create_synthetic_cell_with_synapses
+
+
+def test_segment_mapping_arrays(hh_celsius):
+    cell, synapses_list, netcons_list = create_synthetic_cell_with_synapses(
+        SyntheticCellSpec(n_trees=3, depth=3, density='graded', n_synapses=100))
+    dendrites = list(cell.apical) + list(cell.basal)
+    dendrite_names = [section_name(section) for section in dendrites]
+    densities = {(section_name(section), seg.x): (seg.gnabar_hh, seg.area())
+                 for section in dendrites for seg in section}
+
+    reduced_cell, _, _, mapping = subtree_reductor(cell, synapses_list, netcons_list, 38,
+                                                   return_seg_to_seg='arrays')
+
+    assert len(mapping.original_xs) == len(densities)
+    assert sorted(mapping.original_section_names) == sorted(dendrite_names)
+    reduced_cables = [reduced_cell.apic] + list(reduced_cell.hoc_model.basal)
+    assert mapping.reduced_cable_names == [section_name(cable) for cable in reduced_cables]
+    nsegs = [cable.nseg for cable in reduced_cables]
+    assert list(mapping.reduced_nsegs) == nsegs
+    assert list(reduced_segment_offsets(mapping)) == list(np.cumsum([0] + nsegs)[:-1])
+
+    names = mapping.original_section_names
+    values = np.array([densities[(names[section_id], x)]
+                       for section_id, x in zip(mapping.original_section_ids, mapping.original_xs)])
+
+    # the mean densities are the ones the reduction copied to the reduced segments
+    reduced_densities = averaging_matrix(mapping).dot(values[:, 0])
+    mapped = np.bincount(reduced_segment_offsets(mapping)[mapping.reduced_cable_ids] +
+                         mapping.reduced_segment_indices,
+                         minlength=len(reduced_densities)) > 0
+    expected = np.array([seg.gnabar_hh for cable in reduced_cables for seg in cable])
+    assert np.allclose(reduced_densities[mapped], expected[mapped])
+
+    # the sum of the areas is the total area of the original dendrites
+    reduced_areas = averaging_matrix(mapping, mean=False).dot(values[:, 1])
+    assert np.isclose(np.sum(reduced_areas), np.sum(values[:, 1]))
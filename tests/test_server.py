@@ -0,0 +1,103 @@
+'''Test the reduction server of server.py'''
+import multiprocessing
+import multiprocessing.connection
+import os
+import shutil
+import tempfile
+
+from neuron_reduce.server import ReductionClient, start_server
+from neuron_reduce.synapse_locations import load_synapse_location_arrays
+
+
+def test_reduction_server(passive_job):
+    process, address, authkey = start_server()
+    try:
+        with ReductionClient(address, authkey) as client:
+            first = client.reduce(passive_job._replace(name='file'))
+            sections = client.status()['sections']
+
+            missing_job = passive_job._replace(name='missing', morphology_file='no_such_file.ASC')
+            missing = client.reduce(missing_job)
+            assert missing.spec is None and missing.error
+
+        # a new client, to the same server
+        with ReductionClient(address, authkey) as client:
+            arrays = client.reduce(passive_job._replace(
+                name='arrays', synapse_file=None,
+                synapse_arrays=load_synapse_location_arrays(passive_job.synapse_file)))
+            # the sections of the jobs were deleted
+            assert client.status() == {'jobs': 3, 'sections': sections}
+            client.shutdown()
+        process.join(60)
+        assert not process.is_alive()
+    finally:
+        if process.is_alive():
+            process.terminate()
+
+    assert first.error is None and arrays.error is None
+    assert len(first.spec['netcons']) == 10000
+    assert first.spec == arrays.spec
+
+
+def test_server_errors(passive_job):
+    process, address, authkey = start_server()
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        # a client without the authkey is refused
+        try:
+            multiprocessing.connection.Client(address, authkey=b'wrong')
+            assert False, 'the client should have been refused'
+        except multiprocessing.AuthenticationError:
+            pass
+
+        # a malformed request is answered with its exception
+        connection = multiprocessing.connection.Client(address, authkey=authkey)
+        connection.send('reduce')
+        assert isinstance(connection.recv(), ValueError)
+        # a client that hangs up before its reply is dropped
+        connection.send(('reduce', passive_job._replace(name='hung up')))
+        connection.close()
+
+        with ReductionClient(address, authkey) as client:
+            assert client.reduce(passive_job).error is None
+
+            # a template of the same name, from another file
+            other_model_file = os.path.join(tmp_dir, 'model.hoc')
+            shutil.copy(passive_job.model_file, other_model_file)
+            other = client.reduce(passive_job._replace(name='other', model_file=other_model_file))
+            assert other.spec is None
+            assert 'already loaded from' in other.error
+
+            client.shutdown()
+        process.join(60)
+        assert not process.is_alive()
+    finally:
+        if process.is_alive():
+            process.terminate()
+        shutil.rmtree(tmp_dir)
+
+
+def test_server_template_names(passive_job):
+    process, address, authkey = start_server()
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        other_model_file = os.path.join(tmp_dir, 'other_cell.hoc')
+        with open(passive_job.model_file) as fd:
+            template = fd.read()
+        with open(other_model_file, 'w') as fd:
+            fd.write(template.replace('template model', 'template other_cell'))
+
+        with ReductionClient(address, authkey) as client:
+            # the reduced cell of the first job doesn't take the name of the template
+            # of the second
+            other = client.reduce(passive_job._replace(name='other', model_file=other_model_file))
+            test_1 = client.reduce(passive_job)
+            client.shutdown()
+        process.join(60)
+    finally:
+        if process.is_alive():
+            process.terminate()
+        shutil.rmtree(tmp_dir)
+
+    assert other.error is None and test_1.error is None
+    assert other.spec == test_1.spec
@@ -0,0 +1,47 @@
+'''Tests for the simulation configurations of reduced cells'''
+from neuron import h
+
+from neuron_reduce import subtree_reductor
+from neuron_reduce.simulation import (FIXED_STEP_REFERENCE, PRESETS, compare_configs,
+                                      fastest_safe_config)
+
+STIMULI_NUMBER = 20
+TSTOP = 500  # ms
+
+
+def test_compare_configs(passive_job, passive_cell, hh_celsius):
+    cell, synapses_list, netcons_list = passive_cell()
+    cell.soma[0].insert('hh')  # so that the cell spikes
+    reduced_cell, synapses_list, _ = subtree_reductor(cell, synapses_list, netcons_list,
+                                                      passive_job.reduction_frequency)
+
+    netstims, input_netcons = [], []
+    for i, synapse in enumerate(synapses_list):
+        netstim = h.NetStim()
+        netstim.start, netstim.interval, netstim.number, netstim.noise = 5 + i % 50, 20, 20, 0
+        netcon = h.NetCon(netstim, synapse)
+        netcon.weight[0] = 0.003
+        netstims.append(netstim)
+        input_netcons.append(netcon)
+    iclamp = h.IClamp(0.5, sec=reduced_cell.soma[0])
+    iclamp.delay, iclamp.dur, iclamp.amp = 100, 300, 3.
+
+    h.dt = 0.1
+    reports = compare_configs(reduced_cell.soma[0](0.5), TSTOP, netcons_list=input_netcons)
+    assert h.dt == 0.1
+
+    reference = reports[0]
+    assert reference.config == FIXED_STEP_REFERENCE
+    assert reference.rmsd == 0 and reference.is_safe and reference.n_spikes > 0
+    assert [report.config for report in reports[1:]] == list(PRESETS)
+    for report in reports:
+        assert report.n_events == len(synapses_list) * STIMULI_NUMBER
+        assert report.sim_ms_per_wall_s > 0
+    assert fastest_safe_config(reports).is_safe
+
+    strict_reports = compare_configs(reduced_cell.soma[0](0.5), TSTOP,
+                                     configs=[FIXED_STEP_REFERENCE._replace(dt=0.1)],
+                                     netcons_list=input_netcons,
+                                     rmsd_tolerance=1e-6)
+    assert [report.is_safe for report in strict_reports] == [True, False]
+    assert fastest_safe_config(strict_reports).config == FIXED_STEP_REFERENCE
@@ -0,0 +1,91 @@
+'''Test starting the simulations of a reduced cell from its steady state, of steady_state.py'''
+import shutil
+import tempfile
+
+import numpy as np
+from neuron import h
+
+from neuron_reduce import instantiate_spec, reduced_cell_to_spec, subtree_reductor
+from neuron_reduce import steady_state
+from neuron_reduce.batch import teardown_reduced_cell
+from neuron_reduce.ensemble import ENSEMBLE_CONFIG, build_ensemble, run_ensemble
+from neuron_reduce.steady_state import (compute_steady_state, get_steady_state,
+                                        initialize_to_steady_state, steady_state_key)
+from neuron_reduce.synthetic import SyntheticCellSpec, create_synthetic_cell_with_synapses
+
+WARMUP = 200.  # ms
+TSTOP = 20.  # ms
+
+
+def _reduced_spec():
+    cell, synapses_list, netcons_list = create_synthetic_cell_with_synapses(
+        SyntheticCellSpec(n_trees=2, depth=3, density='graded', n_synapses=20))
+    reduced_cell, synapses_list, netcons_list = subtree_reductor(cell, synapses_list,
+                                                                 netcons_list, 38)
+    spec = reduced_cell_to_spec(reduced_cell, synapses_list, netcons_list)
+    teardown_reduced_cell(reduced_cell)
+    return spec
+
+
+def _soma_voltage(spec, initial_state=None):
+    '''simulates a copy of the spec without input, returns the voltage of its soma'''
+    cell, _, _ = instantiate_spec(spec)
+    initializer = None
+    if initial_state is not None:
+        initializer = initialize_to_steady_state([cell], initial_state)
+    v = h.Vector()
+    v.record(cell.soma(0.5)._ref_v)
+    h.tstop = TSTOP
+    h.stdinit()
+    h.continuerun(TSTOP)
+    del initializer
+    return np.array(v)
+
+
+def test_steady_state(hh_celsius):
+    spec = _reduced_spec()
+    cache = tempfile.mkdtemp()
+    try:
+        h.v_init, h.tstop = -70., 5.
+        state = get_steady_state(spec, WARMUP, cache=cache)
+        assert 'm_hh' in state.variables and 'nai' in state.variables
+        # the copy is deleted, and the run parameters restored
+        assert not list(h.allsec())
+        assert (h.v_init, h.tstop) == (-70., 5.)
+
+        # the warm-up would run the other cells too
+        other_cell = h.Section(name='other_cell')
+        try:
+            compute_steady_state(spec, WARMUP)
+            assert False, 'the steady state should not be computed with another cell'
+        except ValueError:
+            pass
+        del other_cell
+
+        # from the steady state, the voltage doesn't move
+        v = _soma_voltage(spec, state)
+        soma_index = spec['soma']
+        soma_v = state.values[(state.section_indices == soma_index) &
+                              (np.array(state.variables) == 'v')]
+        assert np.isclose(v[0], soma_v[len(soma_v) // 2])
+        assert np.ptp(v) < 0.01
+        # from v_init, it settles
+        assert np.ptp(_soma_voltage(spec)) > 10 * np.ptp(v)
+
+        # cached on disk
+        steady_state._steady_states.clear()
+        loaded = get_steady_state(spec, WARMUP, cache=cache)
+        assert loaded.key == state.key
+        assert loaded.variables == state.variables
+        assert np.array_equal(loaded.values, state.values)
+
+        # the ensembles start from it
+        ensemble = build_ensemble(spec, 2)
+        result = run_ensemble(ensemble, TSTOP, config=ENSEMBLE_CONFIG._replace(nthread=1),
+                              steady_state=state)
+        assert np.allclose(result.v[:, 0], v[0])
+
+        h.celsius = hh_celsius + 10
+        assert steady_state_key(spec, WARMUP) != state.key
+    finally:
+        shutil.rmtree(cache)
@@ -0,0 +1,101 @@
+'''Test the chunked simulation of streaming.py'''
+import os
+
+import numpy as np
+import pytest
+from neuron import h
+
+from neuron_reduce.streaming import RunningSpikeCoincidence, run_chunked
+from neuron_reduce.validation import spike_coincidence
+
+TSTOP = 200  # ms
+
+
+def _two_cells():
+    '''returns two single compartment hh cells, spiking at slightly different rates'''
+    # the reference run (and h.cvode) of the tests
+    h.load_file('stdrun.hoc')
+    sections, stims = [], []
+    for amp in (0.2, 0.25):
+        sec = h.Section()
+        sec.L = sec.diam = 20
+        sec.insert('hh')
+        stim = h.IClamp(0.5, sec=sec)
+        stim.delay, stim.dur, stim.amp = 10, TSTOP, amp
+        sections.append(sec)
+        stims.append(stim)
+    return sections, stims
+
+
+def _run_unchunked(segments):
+    '''returns the traces and spike times of one h.run()'''
+    traces, spike_times, detectors = [], [], []
+    for seg in segments:
+        traces.append(h.Vector())
+        traces[-1].record(seg._ref_v)
+        spike_times.append(h.Vector())
+        detectors.append(h.NetCon(seg._ref_v, None, sec=seg.sec))
+        detectors[-1].threshold = -20
+        detectors[-1].record(spike_times[-1])
+    h.tstop = TSTOP
+    h.run()
+    return np.array(traces), [np.array(times) for times in spike_times]
+
+
+def test_chunked_run_matches_one_run(tmpdir, hh_celsius):
+    h.dt = 0.025
+    sections, _ = _two_cells()
+    segments = [sec(0.5) for sec in sections]
+    traces, spike_times = _run_unchunked(segments)
+
+    trace_file = os.path.join(str(tmpdir), 'traces.npy')
+    result = run_chunked(segments, TSTOP, chunk_ms=33, reference=0, trace_file=trace_file,
+                         threshold=-20)
+
+    assert result.n_samples == traces.shape[1]
+    saved = np.load(trace_file, mmap_mode='r')
+    assert saved.shape == traces.shape
+    assert np.array_equal(saved, traces)
+
+    assert result.spike_counts == [times.size for times in spike_times]
+    assert result.spike_counts[0] > 0
+    assert result.rmsd[0] == 0
+    assert result.rmsd[1] == pytest.approx(np.sqrt(np.mean((traces[1] - traces[0]) ** 2)))
+    assert result.max_abs_diff[1] == pytest.approx(np.max(np.abs(traces[1] - traces[0])))
+    coincidence, mean_time_diff = spike_coincidence(spike_times[0], spike_times[1])
+    assert result.spike_coincidence[1] == pytest.approx(coincidence)
+    assert result.mean_spike_time_diff[1] == pytest.approx(mean_time_diff, nan_ok=True)
+
+    # the saved traces as the reference
+    result = run_chunked(segments, TSTOP, chunk_ms=50, reference=saved, threshold=-20)
+    assert result.rmsd == [0, 0]
+    assert result.spike_coincidence is None
+
+
+def test_running_spike_coincidence():
+    reference = np.array([10., 21., 40., 100.])
+    spikes = np.array([12., 27., 44.9, 300.])
+    running = RunningSpikeCoincidence(window=5)
+    for chunk_end in range(20, 320, 20):
+        running.add(reference[(reference >= chunk_end - 20) & (reference < chunk_end)],
+                    spikes[(spikes >= chunk_end - 20) & (spikes < chunk_end)],
+                    chunk_end)
+    running.finish()
+    coincidence, mean_time_diff = spike_coincidence(reference, spikes, window=5)
+    assert running.coincidence == pytest.approx(coincidence)
+    assert running.mean_spike_time_diff == pytest.approx(mean_time_diff)
+
+    running = RunningSpikeCoincidence()
+    running.add([], [], 10)
+    running.finish()
+    assert (running.coincidence, running.mean_spike_time_diff) == (1., 0.)
+
+
+def test_cvode_is_not_supported(hh_celsius):
+    sections, _ = _two_cells()
+    h.cvode.active(1)
+    try:
+        with pytest.raises(Exception):
+            run_chunked([sections[0](0.5)], TSTOP)
+    finally:
+        h.cvode.active(0)
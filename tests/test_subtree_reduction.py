@@ -0,0 +1,132 @@
+'''Tests for the reduction of the subtrees of a single cell'''
+import cmath
+import concurrent.futures
+import math
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+from neuron import h
+
+from neuron_reduce import reduced_cell_to_spec, subtree_reductor
+from neuron_reduce.reducing_methods import (CableParams,
+                                            find_space_const_in_cm,
+                                            merge_cables,
+                                            segmented_cable_transfer_impedances,
+                                            segmentation_impedance_error)
+from neuron_reduce.subtree_reductor_func import calculate_nsegs_from_tolerance
+
+
+@pytest.fixture
+def reduced_cell(passive_job, passive_cell):
+    '''a function(**reductor_kwargs) that reduces the passive cell, deleted after the test'''
+    def reduce(**reductor_kwargs):
+        '''returns the reduced cell, synapses_list and netcons_list'''
+        return subtree_reductor(*(passive_cell() + (passive_job.reduction_frequency, )),
+                                **reductor_kwargs)
+    return reduce
+
+
+@pytest.fixture
+def reduced_spec(reduced_cell):
+    '''a function(**reductor_kwargs) that returns the spec of the reduced passive cell'''
+    def reduce(**reductor_kwargs):
+        '''returns the spec of the reduced cell'''
+        return reduced_cell_to_spec(*reduced_cell(**reductor_kwargs))
+    return reduce
+
+
+def _soma_input_impedance(reduced_cell, frequency):
+    soma = reduced_cell.soma[0]
+    imp = h.Impedance()
+    imp.loc(0.5, sec=soma)
+    imp.compute(frequency)
+    return imp.input(0.5, sec=soma)
+
+
+def test_subtrees_reduced_in_process_pool(reduced_spec):
+    with concurrent.futures.ProcessPoolExecutor(max_workers=2) as executor:
+        parallel_spec = reduced_spec(subtree_executor=executor)
+    assert parallel_spec == reduced_spec()
+
+
+def test_segmented_cable_impedances_match_neuron():
+    section = h.Section(name='cable')
+    section.L, section.diam, section.Ra, section.cm, section.nseg = 500, 2, 150, 1, 5
+    section.insert('pas')
+    section.g_pas = 1. / 20000
+
+    frequency = 100
+    imp = h.Impedance()
+    imp.loc(0, sec=section)
+    imp.compute(frequency)
+
+    space_const_in_cm = find_space_const_in_cm(section.diam / 10000, 20000, section.Ra)
+    L = section.L / 10000 / space_const_in_cm
+    q = cmath.sqrt(complex(1, 2 * math.pi * frequency * 20000 * section.cm / 1000000))
+    axial_resistance = 4 * section.Ra / (math.pi * (section.diam / 10000) ** 2) * space_const_in_cm
+
+    xs = [0, 0.05, 0.3, 0.5, 0.95, 1]
+    impedances = segmented_cable_transfer_impedances(L, q, section.nseg, xs) * axial_resistance
+    for x, impedance in zip(xs, impedances):
+        assert np.isclose(abs(impedance) / 1e6, imp.transfer(x, sec=section))
+        assert np.isclose(cmath.phase(impedance), imp.transfer_phase(x, sec=section))
+
+
+def test_nsegs_from_tolerance():
+    cable = CableParams(length=1000., diam=2., space_const=1000., cm=1., rm=20000., ra=150.,
+                        e_pas=-70., electrotonic_length=1.)
+    xs = np.linspace(0, 1, 101)
+
+    nsegs = []
+    for tolerance in (0.05, 0.01, 0.001):
+        nseg, = calculate_nsegs_from_tolerance([cable], [xs], tolerance, 'impedance', (0, 100))
+        assert segmentation_impedance_error(cable, nseg, xs, (0, 100)) <= tolerance
+        assert nseg == 1 or segmentation_impedance_error(cable, nseg - 1, xs, (0, 100)) > tolerance
+        nsegs.append(nseg)
+    assert nsegs == sorted(nsegs) and nsegs[0] < nsegs[-1]
+
+    assert calculate_nsegs_from_tolerance([cable], [xs], 0.1, 'displacement') == [5]
+
+
+def test_reduction_with_segmentation_tolerance(reduced_spec):
+    def total_nseg(spec):
+        return sum(section['nseg'] for section in spec['sections'])
+
+    assert total_nseg(reduced_spec(segmentation_tolerance=0.05)) < total_nseg(reduced_spec())
+
+
+def test_merge_cables_of_same_electrotonic_length():
+    cables = [CableParams(length=None, diam=diam, space_const=None, cm=1., rm=20000., ra=150.,
+                          e_pas=-70., electrotonic_length=0.8)
+              for diam in (1., 2., 3.)]
+    merged = merge_cables(cables, 38)
+    assert np.isclose(merged.electrotonic_length, 0.8)
+    assert np.isclose(merged.diam, (1 + 2 ** 1.5 + 3 ** 1.5) ** (2. / 3))
+    assert np.isclose(merged.length / merged.space_const, 0.8)
+
+
+def test_subtree_clustering(passive_job, reduced_cell):
+    cell, synapses_list, netcons_list = reduced_cell()
+    n_dends = len(cell.dend)
+    input_impedance = _soma_input_impedance(cell, passive_job.reduction_frequency)
+
+    clustered_cell, clustered_synapses_list, netcons_list = reduced_cell(
+        subtree_clustering_tolerance=0.3)
+    assert len(clustered_cell.dend) < n_dends
+    assert len(clustered_synapses_list) < len(synapses_list)
+    assert all(netcon.syn().has_loc() for netcon in netcons_list)
+    assert np.isclose(_soma_input_impedance(clustered_cell, passive_job.reduction_frequency),
+                      input_impedance,
+                      rtol=0.01)
+
+
+def test_import_does_not_initialize_hoc():
+    code = ('import neuron_reduce\n'
+            'from neuron_reduce import (coreneuron_export, ensemble, simulation, '
+            'steady_state, streaming, validation)\n'
+            'from neuron import h\n'
+            'assert not h.name_declared("lowest_impedance_recursive")\n'
+            'assert not h.name_declared("stdinit")\n')
+    subprocess.check_call([sys.executable, '-c', code])
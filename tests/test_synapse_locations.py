@@ -0,0 +1,86 @@
+'''Test the text and binary synapse locations files of synapse_locations.py'''
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from neuron_reduce.synapse_locations import (SynapseFileLocation, classify_synapses,
+                                             convert_synapse_locations,
+                                             create_synapses_at_locations,
+                                             create_synapses_from_arrays,
+                                             load_synapse_location_arrays, locations_to_arrays,
+                                             read_synapse_locations, sections_of_locations,
+                                             write_synapse_location_arrays)
+from neuron_reduce.synapse_placement import (place_synapses, placement_location_arrays,
+                                             placement_segments)
+from neuron_reduce.synthetic import SyntheticCellSpec, create_synthetic_cell
+
+BASE_PATH = os.path.abspath(os.path.dirname(__file__))
+SYNAPSE_FILE = os.path.join(BASE_PATH, 'TestsFiles', 'Test_1', 'origRandomSynapses-10000')
+
+LOCATIONS = [SynapseFileLocation('basal', 3, 0.25, None),
+             SynapseFileLocation('apical', 1, 0.5, 'inhibitory'),
+             SynapseFileLocation('somatic', 0, 0.5, None),
+             SynapseFileLocation('apical', 1, 0.75, 'excitatory'),
+             ]
+
+
+def test_binary_synapse_locations():
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        binary_file = convert_synapse_locations(SYNAPSE_FILE,
+                                                os.path.join(tmp_dir, 'synapses.npz'))
+        text_locations = read_synapse_locations(SYNAPSE_FILE)
+        assert read_synapse_locations(binary_file) == text_locations
+
+        arrays = load_synapse_location_arrays(binary_file)
+        assert len(arrays.xs) == len(text_locations) == 10000
+        assert np.array_equal(arrays.xs, [location.x for location in text_locations])
+
+        start = time.time()
+        load_synapse_location_arrays(binary_file)
+        binary_time = time.time() - start
+        start = time.time()
+        read_synapse_locations(SYNAPSE_FILE)
+        assert binary_time < time.time() - start
+
+        classes_file = os.path.join(tmp_dir, 'classes.npz')
+        write_synapse_location_arrays(classes_file, locations_to_arrays(LOCATIONS))
+        assert read_synapse_locations(classes_file) == LOCATIONS
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def test_create_synapses_from_arrays():
+    cell = create_synthetic_cell(SyntheticCellSpec(n_trees=2, depth=3))
+    arrays = locations_to_arrays(LOCATIONS)
+
+    sections = sections_of_locations(cell, arrays)
+    assert sections == [cell.dend[3], cell.apic[1], cell.soma[0], cell.apic[1]]
+
+    synapses_list, netcons_list = create_synapses_from_arrays(cell, arrays, seed=5)
+    assert [synapse.get_segment().sec for synapse in synapses_list] == sections
+    # on the segments of the locations
+    assert [synapse.get_segment().node_index() for synapse in synapses_list] == \
+        [section(location.x).node_index() for section, location in zip(sections, LOCATIONS)]
+    # created section by section: the synapses on apic[1] one after the other
+    hoc_indices = [int(str(synapse).split('[')[1].rstrip(']')) for synapse in synapses_list]
+    assert hoc_indices[3] == hoc_indices[1] + 1
+    classes = classify_synapses(LOCATIONS, seed=5)
+    assert classes[1:4:2] == ['inhibitory', 'excitatory']
+    assert [synapse.e for synapse in synapses_list] == [{'excitatory': 0, 'inhibitory': -86}[c]
+                                                       for c in classes]
+    assert len(netcons_list) == len(LOCATIONS)
+
+
+def test_create_placed_synapses():
+    cell = create_synthetic_cell(SyntheticCellSpec(n_trees=2, depth=3))
+    placement = place_synapses(placement_segments(cell), 1000, seed=2)
+    synapses_list, _ = create_synapses_from_arrays(cell, placement_location_arrays(placement))
+    text_synapses_list, _ = create_synapses_at_locations(
+        cell, [SynapseFileLocation('apical' if section_type else 'basal', section_num, x, None)
+               for section_type, section_num, x in zip(*placement)])
+    assert [str(synapse.get_segment()) for synapse in synapses_list] == \
+        [str(synapse.get_segment()) for synapse in text_synapses_list]
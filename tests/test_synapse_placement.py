@@ -0,0 +1,65 @@
+'''Test the vectorized synapse placement of synapse_placement.py'''
+import numpy as np
+
+from neuron_reduce.synapse_placement import (LOCATION_TYPES, place_synapses, placement_locations,
+                                             placement_segments, segment_weights)
+from neuron_reduce.synthetic import SyntheticCellSpec, create_synthetic_cell
+
+SPEC = SyntheticCellSpec(n_trees=2, branching=2, depth=3, length=100., nseg=4)
+
+
+def test_placement_segments():
+    cell = create_synthetic_cell(SPEC)
+    segments = placement_segments(cell)
+
+    dendrites = list(cell.basal) + list(cell.apical)
+    assert len(segments.lengths) == sum(section.nseg for section in dendrites)
+    assert np.isclose(np.sum(segments.lengths), sum(section.L for section in dendrites))
+    # the first segment of a basal root (on the middle of the soma), and the
+    # last segment of an apical leaf (on its end)
+    assert np.isclose(segments.distances[0], SPEC.length / 8)
+    assert np.isclose(np.max(segments.distances),
+                      cell.soma[0].L / 2 + SPEC.depth * SPEC.length - SPEC.length / 8)
+
+    apical = placement_segments(cell, section_lists=('apical', ))
+    assert set(apical.section_types) == {LOCATION_TYPES.index('apical')}
+
+
+def test_place_synapses_uniform():
+    cell = create_synthetic_cell(SPEC)
+    segments = placement_segments(cell)
+    n_synapses = 200000
+    placement = place_synapses(segments, n_synapses, seed=3)
+
+    assert len(placement.xs) == n_synapses
+    assert np.all((placement.xs >= 0) & (placement.xs <= 1))
+    # same seed, same placement
+    assert np.array_equal(placement.xs, place_synapses(segments, n_synapses, seed=3).xs)
+
+    # the basal trees are 2 thirds of the dendritic length
+    basal = placement.section_types == LOCATION_TYPES.index('basal')
+    assert abs(np.mean(basal) - 2. / 3) < 0.01
+    # uniform along the sections
+    assert abs(np.mean(placement.xs < 0.5) - 0.5) < 0.01
+
+    locations = placement_locations(placement)
+    assert locations[0].type in ('basal', 'apical')
+    assert locations[0].x == placement.xs[0]
+
+
+def test_place_synapses_density_and_weights():
+    cell = create_synthetic_cell(SPEC)
+    segments = placement_segments(cell)
+
+    weights = segment_weights(segments, weights={'apical': 0.})
+    assert np.all(weights[segments.section_types == LOCATION_TYPES.index('apical')] == 0)
+    placement = place_synapses(segments, 10000, weights={'apical': 0.})
+    assert np.all(placement.section_types == LOCATION_TYPES.index('basal'))
+
+    # only beyond 200 um from the soma
+    far = SPEC.soma_diam / 2 + 2 * SPEC.length
+    placement = place_synapses(segments, 10000, density=lambda distances: distances > far)
+    sections = {'basal': list(cell.basal), 'apical': list(cell.apical)}
+    for location in placement_locations(placement)[:100]:
+        section = sections[location.type][location.section_num]
+        assert section.parentseg().sec.parentseg().sec != cell.soma[0]
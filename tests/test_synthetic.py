@@ -0,0 +1,46 @@
+'''Test the synthetic cells'''
+import pytest
+
+from neuron_reduce import subtree_reductor
+from neuron_reduce.batch import teardown_reduced_cell
+from neuron_reduce.synthetic import (SyntheticCellSpec, create_synthetic_cell,
+                                     create_synthetic_cell_with_synapses, sections_per_tree)
+
+
+def test_synthetic_cell_topology():
+    spec = SyntheticCellSpec(n_trees=3, branching=3, depth=3, nseg=7)
+    cell = create_synthetic_cell(spec)
+
+    assert sections_per_tree(3, 3) == 1 + 3 + 9
+    basals, apicals = list(cell.basal), list(cell.apical)
+    assert len(basals) == 3 * 13 and len(apicals) == 13
+    assert len(cell.soma[0].children()) == 4
+    assert all(sec.nseg == 7 for sec in basals + apicals)
+
+    root = cell.dend[0]
+    children = root.children()
+    assert len(children) == 3
+    # Rall's 3/2 power rule
+    assert sum(child.diam ** 1.5 for child in children) == pytest.approx(root.diam ** 1.5)
+
+
+def test_graded_density():
+    uniform = create_synthetic_cell(SyntheticCellSpec(density='uniform'))
+    assert uniform.dend[0](0.1).gnabar_hh == uniform.apic[14](0.9).gnabar_hh
+    graded = create_synthetic_cell(SyntheticCellSpec(density='graded'))
+    assert graded.dend[0](0.1).gnabar_hh < graded.apic[14](0.9).gnabar_hh
+    passive = create_synthetic_cell(SyntheticCellSpec())
+    assert not hasattr(passive.dend[0](0.5), 'hh')
+
+
+def test_reduce_synthetic_cell():
+    spec = SyntheticCellSpec(density='graded', n_synapses=500)
+    cell, synapses_list, netcons_list = create_synthetic_cell_with_synapses(spec)
+    assert len(synapses_list) == len(netcons_list) == 500
+
+    reduced_cell, synapses_list, netcons_list = subtree_reductor(cell, synapses_list,
+                                                                 netcons_list, 38)
+    assert len(reduced_cell.dend) == spec.n_trees
+    assert len(netcons_list) == 500
+    assert hasattr(reduced_cell.apic(0.5), 'hh')
+    teardown_reduced_cell(reduced_cell)
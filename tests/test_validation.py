@@ -0,0 +1,24 @@
+'''Tests for the multi-seed validation of a reduction'''
+import numpy as np
+
+from neuron_reduce.validation import spike_coincidence, validate_reduction
+
+
+def test_spike_coincidence():
+    assert spike_coincidence([], []) == (1., 0.)
+    assert spike_coincidence([10., 50.], [12., 200.]) == (0.5, 2.)
+
+
+def test_validate_reduction(passive_job):
+    report = validate_reduction(passive_job, seeds=[1, 2, 1], tstop=300, workers=2)
+
+    assert report.name == 'Test_1'
+    assert [result.seed for result in report.results] == [1, 2, 1]
+    assert all(result.error is None for result in report.results)
+    # the same seed gives the same synaptic activity, in any worker
+    assert report.results[0] == report.results[2]
+    assert report.results[0].rmsd != report.results[1].rmsd
+    assert 0 < report.summary['mean_rmsd'] < 5  # mV
+    assert report.summary['n_seeds'] == 3 and report.summary['n_failed'] == 0
+    assert np.isclose(report.summary['max_rmsd'],
+                      max(result.rmsd for result in report.results))